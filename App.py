@@ -1,7 +1,11 @@
 import streamlit as st
+from utils_perf import page_start, page_end
 from db import init_db
+from utils_snapshot import apply_db_conf
 
 st.set_page_config(page_title="Giới thiệu", page_icon="📝", layout="wide")
+page_start("Giới thiệu")
+apply_db_conf()
 
 def main():
     st.title("📝 Giới thiệu")
@@ -17,3 +21,5 @@ def main():
 
 if __name__ == "__main__":
     main()
+
+page_end()
@@ -0,0 +1,60 @@
+"""Đo phân tích chéo slider × điểm vấn đáp: cách lọc boolean từng câu hỏi/mức trên cả DataFrame
+(mỗi bảng một lần quét) so với pivot một lần + phép nhân ma trận (utils_analytics.answer_matrix).
+
+Chạy: python benchmarks/bench_analytics.py [số_sinh_viên ...]   (mặc định 2000 20000 50000)
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import cohort  # noqa: E402
+from utils_analytics import LEVELS, answer_matrix  # noqa: E402
+
+
+def per_question_filters(frame, question_ids):
+    """Cách cũ: mỗi (câu, mức) một lần lọc; mỗi cặp câu hỏi một lần merge + crosstab."""
+    out = {"score_mean": {}, "crosstab": {}, "corr": {}}
+    for qid in question_ids:
+        for level in LEVELS:
+            mask = (frame["question_id"] == qid) & (frame["value_int"] == level)
+            out["score_mean"][qid, level] = frame.loc[mask, "score"].mean()
+    wide = {qid: frame[frame["question_id"] == qid].set_index("msv")["value_int"] for qid in question_ids}
+    for a in question_ids:
+        for b in question_ids:
+            pair = wide[a].to_frame("a").join(wide[b].rename("b"), how="inner")
+            out["crosstab"][a, b] = pair.value_counts()
+            out["corr"][a, b] = pair["a"].rank().corr(pair["b"].rank())
+    return out
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [2000, 20000, 50000]
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            cohort.generate(Path(tmp) / "bench.db", n, completed=0.9)
+            sliders = [q["id"] for q in db.list_questions() if q["qtype"] == "slider"]
+            fetch_ms = timed(db.fetch_slider_scores_frame)
+            frame = db.fetch_slider_scores_frame()
+            old_ms = timed(lambda: per_question_filters(frame, sliders), repeat=1)
+            new_ms = timed(lambda: answer_matrix(frame, sliders))
+            version_ms = timed(db.analytics_version)
+            print(f"{n:6d} SV, {len(frame):7d} câu trả lời | đọc DB {fetch_ms:7.1f} ms | lọc từng câu {old_ms:8.1f} ms"
+                  f" | ma trận một lần {new_ms:6.1f} ms ({old_ms / new_ms:5.1f}x) | cache hit {version_ms:5.2f} ms")
+            db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
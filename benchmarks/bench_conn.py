@@ -0,0 +1,108 @@
+"""So sánh get_conn() có pool (engine SQLAlchemy, WAL + PRAGMA) với cách mở/đóng kết nối mỗi lần gọi.
+
+Ba cấu hình: sqlite3.connect mỗi lần gọi (hành vi cũ), backend không pool (pool_size=0)
+và backend có pool (mặc định). Chạy trên file SQLite tạm.
+
+Chạy: python benchmarks/bench_conn.py [số_lần_rerun]
+"""
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+pooled_get_conn = db.get_conn
+
+
+@contextmanager
+def legacy_get_conn():
+    # Hành vi cũ: mỗi lần gọi mở kết nối mới, journal mặc định, commit rồi đóng
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.commit()
+        conn.close()
+
+
+def student_rerun(msv):
+    # Các truy vấn mà một lần rerun trang Sinh viên thực hiện
+    db.get_student(msv)
+    db.can_request_otp(msv)
+    db.list_questions()
+    db.get_student(msv)
+    db.get_student_responses(msv)
+
+
+def run_sequential(n):
+    start = time.perf_counter()
+    for i in range(n):
+        student_rerun(f"SV{i % 200:05d}")
+    return n / (time.perf_counter() - start)
+
+
+def run_mixed(n, readers=4):
+    """Nhiều luồng đọc song song với một luồng ghi OTP."""
+    errors = []
+
+    def reader(k):
+        try:
+            for i in range(n):
+                student_rerun(f"SV{(i + k) % 200:05d}")
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+
+    def writer():
+        try:
+            for i in range(n):
+                db.create_otp(f"SV{i % 200:05d}", "123456")
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader, args=(k,)) for k in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return (readers + 1) * n / elapsed, len(errors)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(db_path=Path(tmp) / "bench.db")
+        db.init_db()
+        db.upsert_students([
+            {"msv": f"SV{i:05d}", "email": f"sv{i}@example.edu.vn", "name": f"Sinh viên {i}", "score": 8.0}
+            for i in range(200)
+        ])
+        db.close_pools()
+        with legacy_get_conn() as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        runs = (
+            ("per-call connect", legacy_get_conn, None),
+            ("engine, no pool", pooled_get_conn, 0),
+            ("engine, pooled", pooled_get_conn, db.POOL_SIZE),
+        )
+        for label, impl, pool_size in runs:
+            if pool_size is not None:
+                db.configure(pool_size=pool_size)
+            db.get_conn = impl
+            seq = run_sequential(n)
+            mixed, errors = run_mixed(n // 5)
+            print(f"{label:18s} sequential: {seq:8.0f} reruns/s   mixed: {mixed:8.0f} ops/s   lock errors: {errors}")
+        db.get_conn = pooled_get_conn
+        db.close_pools()
+
+if __name__ == "__main__":
+    main()
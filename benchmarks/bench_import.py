@@ -0,0 +1,90 @@
+"""Đo tốc độ import danh sách sinh viên: cách cũ (read_excel + iterrows + INSERT từng dòng)
+so với pipeline mới (đọc theo chunk + bulk_upsert_students).
+
+Chạy: python benchmarks/bench_import.py [số_sinh_viên]
+"""
+import csv
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+
+import db  # noqa: E402
+from utils_import import ROSTER_COLUMNS, iter_roster_rows  # noqa: E402
+
+
+def write_roster(path: Path, n: int):
+    header = list(ROSTER_COLUMNS)
+    rows = [(f"{2151000000 + i}", f"{2151000000 + i}@e.tlu.edu.vn", f"Sinh viên {i}", 5 + (i % 50) / 10)
+            for i in range(n)]
+    if path.suffix == ".csv":
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            w = csv.writer(f)
+            w.writerow(header)
+            w.writerows(rows)
+    else:
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(header)
+        for r in rows:
+            ws.append(r)
+        wb.save(path)
+
+
+def legacy_import(path: Path):
+    df = pd.read_excel(path) if path.suffix == ".xlsx" else pd.read_csv(path, encoding="utf-8-sig")
+    rows = []
+    for _, r in df.iterrows():
+        rows.append({
+            "msv": str(r["Mã sinh viên"]).strip(),
+            "email": str(r["Email"]).strip(),
+            "name": str(r["Họ và tên"]).strip(),
+            "score": float(r["Điểm thi vấn đáp"]),
+        })
+    with db.get_conn() as conn:
+        c = conn.cursor()
+        for r in rows:
+            c.execute("""
+            INSERT INTO students (msv, email, name, score, completed, completed_at)
+            VALUES (?, ?, ?, ?, COALESCE((SELECT completed FROM students WHERE msv=?), 0),
+                    COALESCE((SELECT completed_at FROM students WHERE msv=?), NULL))
+            ON CONFLICT(msv) DO UPDATE SET
+                email=excluded.email,
+                name=excluded.name,
+                score=excluded.score
+            """, (r["msv"], r["email"], r["name"], r["score"], r["msv"], r["msv"]))
+    return len(rows)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for suffix in (".xlsx", ".csv"):
+            roster = tmp / f"roster{suffix}"
+            write_roster(roster, n)
+            for label in ("legacy", "bulk"):
+                db.configure(db_path=tmp / f"{label}{suffix}.db")
+                db.init_db()
+                start = time.perf_counter()
+                if label == "legacy":
+                    legacy_import(roster)
+                else:
+                    with open(roster, "rb") as f:
+                        stats = db.bulk_upsert_students(iter_roster_rows(f, roster.name))
+                elapsed = time.perf_counter() - start
+                print(f"{suffix:5s} {label:7s} {n} rows in {elapsed:6.2f}s ({n / elapsed:8.0f} rows/s)")
+            # Import lại cùng file: mọi dòng đều "unchanged"
+            with open(roster, "rb") as f:
+                stats = db.bulk_upsert_students(iter_roster_rows(f, roster.name))
+            print(f"{suffix:5s} re-import: {stats}")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
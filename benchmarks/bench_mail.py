@@ -0,0 +1,97 @@
+"""Đo tốc độ gửi email qua outbox + MailWorkerPool với SMTP giả lập local (aiosmtpd),
+so với cách cũ mở/đăng nhập/đóng kết nối SMTP cho từng thư.
+
+Cần: pip install aiosmtpd
+Chạy: python benchmarks/bench_mail.py [số_thư] [số_worker] [tỉ_lệ_lỗi_tạm_thời]
+"""
+import random
+import smtplib
+import socket
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiosmtpd.controller import Controller  # noqa: E402
+from aiosmtpd.smtp import AuthResult  # noqa: E402
+
+import db  # noqa: E402
+from utils_mail import MailWorkerPool, _build_message, _open_smtp  # noqa: E402
+
+
+class Handler:
+    def __init__(self, fail_rate):
+        self.fail_rate = fail_rate
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if random.random() < self.fail_rate:
+            return "451 Temporary failure, try again"
+        self.received += 1
+        return "250 OK"
+
+
+def authenticator(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def main():
+    warnings.filterwarnings("ignore", message="Session.login_data")
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    fail_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+    handler = Handler(fail_rate)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    controller = Controller(handler, hostname="127.0.0.1", port=port, authenticator=authenticator,
+                            auth_require_tls=False)
+    controller.start()
+    conf = {
+        "host": "127.0.0.1", "port": port,
+        "user": "bench", "password": "bench", "use_tls": False, "security": "none",
+        "from_name": "Bench",
+    }
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.configure(db_path=Path(tmp) / "mail.db")
+            db.init_db()
+
+            # Cách cũ: mỗi thư một kết nối SMTP, chạy tuần tự trong luồng của trang
+            legacy_n = min(n, 200)
+            start = time.perf_counter()
+            for i in range(legacy_n):
+                server = _open_smtp(conf)
+                try:
+                    server.send_message(_build_message(conf, f"sv{i}@example.edu.vn", "OTP", "123456"))
+                except smtplib.SMTPDataError:
+                    pass
+                server.quit()
+            legacy = legacy_n / (time.perf_counter() - start)
+            print(f"per-message connection: {legacy:8.1f} msg/s ({legacy_n} thư)")
+
+            handler.received = 0
+            start = time.perf_counter()
+            for i in range(n):
+                db.enqueue_email(f"sv{i}@example.edu.vn", "OTP", f"Mã của bạn: {i:06d}")
+            enqueue = n / (time.perf_counter() - start)
+            pool = MailWorkerPool(conf, workers=workers, poll_interval=0.05, backoff_base=0.05).start()
+            while True:
+                stats = db.outbox_stats()
+                if stats.get("pending", 0) + stats.get("sending", 0) == 0:
+                    break
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - start
+            pool.stop()
+            print(f"outbox + {workers} workers:  {n / elapsed:8.1f} msg/s  (enqueue {enqueue:.0f}/s, "
+                  f"server received {handler.received}, outbox {stats})")
+            db.close_pools()
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
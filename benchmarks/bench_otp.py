@@ -0,0 +1,101 @@
+"""Load test luồng đăng nhập OTP: nhiều luồng gửi hàng nghìn yêu cầu (đa số là spam lặp lại
+và nhập sai mã), so sánh khi chỉ dùng DB với khi có bộ giới hạn token bucket trong bộ nhớ.
+
+Chạy: python benchmarks/bench_otp.py [số_yêu_cầu] [số_luồng]
+"""
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import utils_ratelimit  # noqa: E402
+
+STUDENTS = 500
+
+
+def request_otp(msv, ip, use_limiter):
+    # Giống trang Sinh viên: giới hạn trong bộ nhớ -> tra sinh viên -> cooldown DB -> tạo mã
+    if use_limiter and utils_ratelimit.allow_otp_request(msv, ip):
+        return "limited"
+    if not db.get_student(msv):
+        utils_ratelimit.release_otp_request(msv)
+        return "unknown"
+    if not db.can_request_otp(msv):
+        return "cooldown"
+    db.create_otp(msv, "123456")
+    return "sent"
+
+
+def verify(msv, ip, code, use_limiter):
+    if use_limiter and utils_ratelimit.allow_otp_verify(msv, ip):
+        return "limited"
+    return "ok" if db.verify_otp(msv, code) else "rejected"
+
+
+def run(n, threads, use_limiter):
+    for limiter in (utils_ratelimit.OTP_REQUEST_PER_MSV, utils_ratelimit.OTP_REQUEST_PER_IP,
+                    utils_ratelimit.OTP_VERIFY_PER_MSV, utils_ratelimit.OTP_VERIFY_PER_IP,
+                    utils_ratelimit.OTP_LOGIN_FAIL_PER_MSV, utils_ratelimit.OTP_REQUEST_GLOBAL,
+                    utils_ratelimit.OTP_VERIFY_GLOBAL):
+        limiter._buckets.clear()
+    latencies, outcomes = [], {}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        local = []
+        for _ in range(n // threads):
+            msv = f"SV{rnd.randrange(STUDENTS if rnd.random() < 0.3 else 20):05d}"
+            ip = f"10.0.{rnd.randrange(4)}.{rnd.randrange(50)}"
+            start = time.perf_counter()
+            if rnd.random() < 0.6:
+                outcome = request_otp(msv, ip, use_limiter)
+            else:
+                outcome = verify(msv, ip, f"{rnd.randrange(10**6):06d}", use_limiter)
+            local.append(time.perf_counter() - start)
+            with lock:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        with lock:
+            latencies.extend(local)
+
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "outcomes": outcomes,
+    }
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    with tempfile.TemporaryDirectory() as tmp:
+        for use_limiter in (False, True):
+            db.configure(db_path=Path(tmp) / f"otp_{use_limiter}.db")
+            db.init_db()
+            db.upsert_students([
+                {"msv": f"SV{i:05d}", "email": f"sv{i}@example.edu.vn", "name": f"SV {i}", "score": 8.0}
+                for i in range(STUDENTS)
+            ])
+            r = run(n, threads, use_limiter)
+            label = "memory limiter" if use_limiter else "db only"
+            print(f"{label:15s} {r['rps']:8.0f} req/s  p50 {r['p50_ms']:6.2f} ms  p99 {r['p99_ms']:6.2f} ms  {r['outcomes']}")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Đo chi phí của lớp đo thời gian (utils_perf) trên các hàm db.py: hàm gốc chưa bọc,
+đã bọc nhưng tắt đo, bật đo, và bật ghi truy vấn chậm (trace SQL).
+
+Chạy: python benchmarks/bench_perf.py [số_lần_gọi]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import utils_perf  # noqa: E402
+
+
+def per_call_us(fn, n, *args):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(*args)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(db_path=Path(tmp) / "perf.db")
+        db.init_db()
+        db.upsert_students([{"msv": "SV1", "email": "a@e.tlu.edu.vn", "name": "A", "score": 8.0}])
+        cases = [
+            ("chưa bọc", lambda: utils_perf.enable(False), db.get_student.__wrapped__),
+            ("tắt đo", lambda: utils_perf.enable(False), db.get_student),
+            ("bật đo", lambda: utils_perf.enable(True, slow_query_ms=None), db.get_student),
+            ("bật + trace SQL", lambda: utils_perf.enable(True, slow_query_ms=1000.0), db.get_student),
+        ]
+        base = None
+        for label, setup, fn in cases:
+            setup()
+            per_call_us(fn, 1000, "SV1")  # làm nóng pool
+            us = per_call_us(fn, n, "SV1")
+            base = base or us
+            print(f"get_student {label:16s} {us:7.2f} µs/lần  ({us - base:+6.2f} µs)")
+        utils_perf.enable(False, slow_query_ms=None)
+        utils_perf.reset()
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Đo ảnh hưởng của việc chụp snapshot (db.take_snapshot) lên người ghi: nhiều luồng nộp bài
+liên tục, một luồng vừa đọc Dashboard/export vừa chụp snapshot định kỳ.
+
+So sánh độ trễ nộp bài khi truy vấn đọc nặng chạy thẳng trên survey.db với khi chạy trên bản
+snapshot chỉ đọc, kèm thời gian và kích thước mỗi lần chụp.
+
+Chạy: python benchmarks/bench_snapshot.py [số_sinh_viên] [số_giây]
+"""
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+
+def seed(n):
+    db.bulk_upsert_students([[(f"SV{i:06d}", f"sv{i}@e.tlu.edu.vn", f"Sinh viên {i}", 7.0) for i in range(n)]])
+    qs = db.list_questions()
+    for i in range(n // 2):
+        db.submit_survey(f"SV{i:06d}", [
+            {"question_id": q["id"], "value_int": 1 + (i + q["id"]) % 3 if q["qtype"] == "slider" else None,
+             "value_text": None if q["qtype"] == "slider" else f"Ý kiến {i % 97}"}
+            for q in qs
+        ])
+    return qs
+
+
+def run(n, seconds, snapshot_max_age):
+    db.configure(snapshot_max_age=snapshot_max_age)
+    qs = db.list_questions()
+    stop = threading.Event()
+    latencies, reads, snapshots = [], [0], []
+    next_msv = iter(range(n // 2, n))
+    lock = threading.Lock()
+
+    def writer():
+        while not stop.is_set():
+            with lock:
+                i = next(next_msv, None)
+            if i is None:
+                return
+            answers = [{"question_id": q["id"], "value_int": 2 if q["qtype"] == "slider" else None,
+                        "value_text": None if q["qtype"] == "slider" else "Tốt"} for q in qs]
+            start = time.perf_counter()
+            db.submit_survey(f"SV{i:06d}", answers)
+            latencies.append(time.perf_counter() - start)
+
+    def reader():
+        while not stop.is_set():
+            db.get_tallies()
+            for _ in db.iter_export_rows():
+                pass
+            reads[0] += 1
+            if snapshot_max_age is not None and (db.snapshot_age() or 0) > snapshot_max_age:
+                snapshots.append(db.take_snapshot())
+
+    threads = [threading.Thread(target=writer) for _ in range(4)] + [threading.Thread(target=reader)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    ms = sorted(x * 1000 for x in latencies)
+    label = "live" if snapshot_max_age is None else f"snapshot {snapshot_max_age:g}s"
+    print(f"{label:14s} submits {len(ms):6d} | p50 {statistics.median(ms):6.2f} ms"
+          f" | p99 {ms[int(len(ms) * 0.99)]:7.2f} ms | max {ms[-1]:7.2f} ms | dashboard/export reads {reads[0]}")
+    if snapshots:
+        secs = [s["seconds"] * 1000 for s in snapshots]
+        print(f"{'':14s} {len(snapshots)} snapshots, {snapshots[-1]['bytes'] / 1e6:.1f} MB,"
+              f" {statistics.median(secs):.1f} ms median / {max(secs):.1f} ms max")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        for max_age in (None, 1.0):
+            db.configure(db_path=Path(tmp) / f"bench_{max_age}.db", snapshot_max_age=None)
+            db.init_db()
+            seed(n)
+            run(n, seconds, max_age)
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Đo thời gian hiện một trang danh sách sinh viên (keyset) ở đầu/giữa/cuối danh sách,
+so với list_students() đọc cả bảng như tab Sinh viên trước đây.
+
+Chạy: python benchmarks/bench_students.py [số_sinh_viên] [số_dòng_mỗi_trang]
+"""
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import cohort  # noqa: E402
+
+
+def walk(limit, **filters):
+    """Duyệt hết các trang, trả về thời gian (ms) của từng trang."""
+    times, after = [], None
+    while True:
+        start = time.perf_counter()
+        page = db.list_students_page(after=after, limit=limit, **filters)
+        times.append((time.perf_counter() - start) * 1000)
+        after = page["next"]
+        if after is None:
+            return times
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        cohort.generate(Path(tmp) / "bench.db", n, completed=0.5)
+        start = time.perf_counter()
+        db.list_students()
+        print(f"list_students() toàn bảng: {(time.perf_counter() - start) * 1000:8.1f} ms ({n} sinh viên)")
+        cases = {
+            "tất cả": {},
+            "chưa hoàn thành": {"completed": False},
+            "MSV tiền tố": {"search": "2151", "field": "msv"},
+            "họ tên tiền tố": {"search": "Nguyễn", "field": "name"},
+            "email, đã xong": {"search": "2151001", "field": "email", "completed": True},
+        }
+        for label, filters in cases.items():
+            times = walk(limit, **filters)
+            print(f"{label:16s} {len(times):5d} trang | đầu {times[0]:6.2f} ms | giữa {times[len(times) // 2]:6.2f} ms"
+                  f" | cuối {times[-1]:6.2f} ms | trung vị {statistics.median(times):6.2f} ms")
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Bộ benchmark tổng hợp: đo từng hàm public của db.py và thời gian chạy các trang bằng AppTest
+trên một DB giả lập (benchmarks/cohort.py), ghi kết quả ra JSON để so sánh giữa các commit.
+
+Chạy:  python benchmarks/bench_suite.py [--students 2000] [--repeat 20] [--out results.json] [--no-pages]
+So sánh: python benchmarks/compare_results.py cũ.json mới.json
+"""
+import argparse
+import inspect
+import itertools
+import json
+import logging
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import db  # noqa: E402
+import cohort  # noqa: E402
+
+# Hàm hạ tầng (cấu hình, kết nối, migration) không đo riêng: đã nằm trong mọi hàm khác
+NOT_BENCHMARKED = {
+    "configure", "close_pools", "get_conn", "read_conn", "migrate", "schema_version",
+    "snapshot_path", "snapshot_age", "snapshot_info",
+    "cohort_path", "using_cohort", "use_cohort", "current_cohort", "student_version",
+    "lock_stats", "reset_lock_stats",
+}
+
+# Hàm xóa/reset toàn bộ dữ liệu: chỉ đo một lần, sau tất cả các hàm khác
+DESTRUCTIVE = ["reset_responses_and_completion", "reset_questions_to_new_default"]
+
+PAGES = {
+    "home": ("App.py", {}),
+    "student_login": ("pages/1_Sinh viên.py", {}),
+    "student_survey": ("pages/1_Sinh viên.py", {"auth_msv": "{pending}"}),
+    "student_done": ("pages/1_Sinh viên.py", {"auth_msv": "{done}"}),
+    "admin": ("pages/2_Admin.py", {"admin_auth": True}),
+    "dashboard": ("pages/3_Dashboard.py", {"admin_auth": True}),
+}
+
+
+def summarize(samples: list[float]) -> dict:
+    ms = sorted(x * 1000 for x in samples)
+    return {
+        "calls": len(ms),
+        "median_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "min_ms": round(ms[0], 3),
+    }
+
+
+def timed(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    if inspect.isgenerator(result):
+        for _ in result:
+            pass
+    return time.perf_counter() - start
+
+
+def db_benchmarks(info: dict) -> dict:
+    """{tên hàm: callable không tham số} — tham số đổi theo mỗi lần gọi để không đo cache nóng giả."""
+    rows = cohort.student_rows(info["students"], seed=0)
+    msvs = [r[0] for r in rows]
+    qs = db.list_questions()
+    qid = qs[0]["id"]
+    rng = cohort.random.Random(1)
+    counter = itertools.count()
+    next_msv = lambda: msvs[next(counter) % len(msvs)]
+    new_msv = lambda: f"BENCH{next(counter):07d}"
+    bid = db.create_broadcast("Nhắc khảo sát", "Chào {name}", rate_per_min=6000)
+    outbox_ids = [db.enqueue_email("a@e.tlu.edu.vn", "OTP", "123456") for _ in range(64)]
+    db.claim_outbox(64)
+    ids = iter(outbox_ids)
+
+    def throwaway_student():
+        msv = new_msv()
+        db.upsert_students([{"msv": msv, "email": f"{msv}@e.tlu.edu.vn", "name": "Xóa", "score": 5.0}])
+        return msv
+
+    return {
+        "init_db": lambda: db.init_db(),
+        "seed_questions_if_empty": lambda: db.seed_questions_if_empty(),
+        "upsert_students": lambda: db.upsert_students(
+            [{"msv": m, "email": f"{m}@e.tlu.edu.vn", "name": "Mới", "score": 6.5} for m in (new_msv() for _ in range(100))]),
+        "bulk_upsert_students": lambda: db.bulk_upsert_students([rows[:1000]]),
+        "get_student": lambda: db.get_student(next_msv()),
+        "check_student_login": lambda: db.check_student_login(next_msv(), "SV@E.TLU.EDU.VN"),
+        "mark_completed": lambda: db.mark_completed(next_msv()),
+        "list_questions": lambda: db.list_questions(),
+        "questions_version": lambda: db.questions_version(),
+        "create_question": lambda: db.create_question("Câu hỏi benchmark", "Nhóm benchmark", "slider", "1", "2", "3"),
+        "update_question": lambda: db.update_question(qid, text=qs[0]["text"]),
+        "delete_question": (lambda: db.create_question("Xóa", "Nhóm benchmark", "open"), db.delete_question),
+        # Sửa một dòng và đánh số lại toàn bộ danh sách như khi lưu trình sửa dạng bảng
+        "apply_question_changes": (db.list_questions, lambda loaded: db.apply_question_changes(
+            loaded, [dict(loaded[0], text=loaded[0]["text"] + "!")] + loaded[1:], renumber=True)),
+        "save_responses": lambda: db.save_responses(next_msv(), cohort.answers_for(qs, rng)),
+        "submit_survey": lambda: db.submit_survey(throwaway_student(), cohort.answers_for(qs, rng)),
+        "get_student_responses": lambda: db.get_student_responses(next_msv()),
+        "get_student_with_responses": lambda: db.get_student_with_responses(next_msv()),
+        "fetch_results": lambda: db.fetch_results(),
+        "fetch_slider_scores_frame": lambda: db.fetch_slider_scores_frame(),
+        "analytics_version": lambda: db.analytics_version(),
+        "iter_open_answers": lambda: db.iter_open_answers(next(q["id"] for q in qs if q["qtype"] == "open")),
+        "get_tallies": lambda: db.get_tallies(),
+        "verify_tallies": lambda: db.verify_tallies(),
+        "rebuild_tallies": lambda: db.rebuild_tallies(),
+        "list_students": lambda: db.list_students(),
+        "list_students_page": lambda: db.list_students_page(
+            "Nguyễn", "name", completed=False, after=("Nguyễn", next_msv())),
+        "update_student": lambda: db.update_student(next_msv(), name="Đã sửa"),
+        "delete_student": (throwaway_student, db.delete_student),
+        "export_responses_as_rows": lambda: db.export_responses_as_rows(),
+        "iter_export_rows": lambda: db.iter_export_rows(),
+        "iter_student_answers": lambda: db.iter_student_answers(),
+        "can_request_otp": lambda: db.can_request_otp(next_msv()),
+        "create_otp": lambda: db.create_otp(next_msv(), f"{rng.randrange(10**6):06d}"),
+        "verify_otp": lambda: db.verify_otp(next_msv(), f"{rng.randrange(10**6):06d}"),
+        "purge_expired_otps": lambda: db.purge_expired_otps(),
+        "enqueue_email": lambda: db.enqueue_email("a@e.tlu.edu.vn", "OTP", "123456"),
+        "claim_outbox": lambda: db.claim_outbox(20),
+        "mark_outbox_sent": lambda: db.mark_outbox_sent(next(ids, outbox_ids[0])),
+        "mark_outbox_failed": lambda: db.mark_outbox_failed(outbox_ids[-1], "451 thử lại", 5.0),
+        "get_outbox_message": lambda: db.get_outbox_message(outbox_ids[0]),
+        "outbox_stats": lambda: db.outbox_stats(),
+        "count_broadcast_candidates": lambda: db.count_broadcast_candidates(),
+        "create_broadcast": lambda: db.create_broadcast("Nhắc", "Chào {name}", msv_prefix="2151000"),
+        "list_broadcasts": lambda: db.list_broadcasts(),
+        "set_broadcast_status": lambda: db.set_broadcast_status(bid, "running"),
+        "release_broadcast_batch": lambda: db.release_broadcast_batch(bid, 20, lambda r: f"Chào {r['name']}"),
+        "broadcast_progress": lambda: db.broadcast_progress(bid),
+        "list_broadcast_recipients": lambda: db.list_broadcast_recipients(bid),
+        "take_snapshot": lambda: db.take_snapshot(),
+        "list_cohorts": lambda: db.list_cohorts(),
+        "create_cohort": lambda: db.create_cohort(f"K{next(counter)}", "Khóa benchmark"),
+        "aggregate_tallies": lambda: db.aggregate_tallies(),
+        "reset_responses_and_completion": lambda: db.reset_responses_and_completion(),
+        "reset_questions_to_new_default": lambda: db.reset_questions_to_new_default(),
+    }
+
+
+def run_db(info: dict, repeat: int) -> dict:
+    benches = db_benchmarks(info)
+    public = {
+        name for name, fn in inspect.getmembers(db, inspect.isfunction)
+        if fn.__module__ == "db" and not name.startswith("_")
+    }
+    missing = sorted(public - set(benches) - NOT_BENCHMARKED)
+    if missing:
+        sys.exit(f"Hàm chưa có benchmark (thêm vào db_benchmarks): {', '.join(missing)}")
+
+    results = {}
+    order = [n for n in benches if n not in DESTRUCTIVE] + DESTRUCTIVE
+    for name in order:
+        bench = benches[name]
+        samples = []
+        for _ in range(1 if name in DESTRUCTIVE else repeat):
+            if isinstance(bench, tuple):
+                # (chuẩn bị, hàm đo): chỉ đo phần thứ hai
+                setup, fn = bench
+                samples.append(timed(fn, setup()))
+            else:
+                samples.append(timed(bench))
+        results[name] = summarize(samples)
+        print(f"db    {name:32s} {results[name]['median_ms']:9.3f} ms  (p95 {results[name]['p95_ms']:.3f})")
+    return results
+
+
+def run_pages(repeat: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    # Cảnh báo của Streamlit khi chạy ngoài server làm rối kết quả (AppTest đặt lại level mỗi lần chạy)
+    for name in ("streamlit.runtime.scriptrunner_utils.script_run_context", "streamlit.elements.lib.policies"):
+        logging.getLogger(name).addFilter(lambda record: record.levelno >= logging.ERROR)
+
+    done = next((s["msv"] for s in db.list_students() if s["completed"]), None)
+    pending = next((s["msv"] for s in db.list_students() if not s["completed"]), None)
+    results = {}
+    for name, (script, state) in PAGES.items():
+        samples, cold = [], None
+        for i in range(repeat + 1):
+            at = AppTest.from_file(str(ROOT / script), default_timeout=120)
+            for key, value in state.items():
+                at.session_state[key] = {"{done}": done, "{pending}": pending}.get(value, value)
+            start = time.perf_counter()
+            at.run()
+            elapsed = time.perf_counter() - start
+            if at.exception:
+                sys.exit(f"{script}: {at.exception[0].value}")
+            # Lần đầu tính riêng: gồm import module và làm đầy cache của process
+            if i == 0:
+                cold = elapsed
+            else:
+                samples.append(elapsed)
+        results[name] = {**summarize(samples), "cold_ms": round(cold * 1000, 3)}
+        print(f"page  {name:32s} {results[name]['median_ms']:9.3f} ms  (cold {results[name]['cold_ms']:.1f})")
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--page-repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="file JSON kết quả (mặc định benchmarks/results/<commit>.json)")
+    parser.add_argument("--no-pages", action="store_true", help="bỏ qua phần đo trang bằng AppTest")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    out = Path(args.out) if args.out else ROOT / "benchmarks" / "results" / f"{commit or 'local'}.json"
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "students": args.students,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        info = cohort.generate(Path(tmp) / "bench.db", args.students, seed=args.seed)
+        report["meta"]["cohort"] = {**info, "generate_s": round(time.perf_counter() - start, 3)}
+        print(f"cohort {info}")
+        # Trang được đo trước khi benchmark db thay đổi/xóa dữ liệu
+        report["pages"] = {} if args.no_pages else run_pages(args.page_repeat)
+        report["db"] = run_db(info, args.repeat)
+        db.close_pools()
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Đã ghi {out}")
+
+
+if __name__ == "__main__":
+    main()
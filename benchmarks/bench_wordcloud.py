@@ -0,0 +1,87 @@
+"""Đo pipeline WordCloud cho câu hỏi mở: cách cũ (vòng lặp từng ký tự + dict Python)
+so với chuẩn hóa bằng pandas, chế độ lấy mẫu reservoir và thời gian vẽ ảnh.
+
+Chạy: python benchmarks/bench_wordcloud.py [số_câu_trả_lời ...]   (mặc định 10000 50000 100000)
+"""
+import random
+import re
+import sys
+import time
+import unicodedata as ud
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils_text import WORDCLOUD_SAMPLE_SIZE, answer_frequencies, reservoir_sample  # noqa: E402
+
+PHRASES = [
+    "Tốt", "Rất hay", "Cần thêm thời gian", "Ổn", "Giảng viên nhiệt tình", "Đề hơi khó",
+    "Nên có thêm ví dụ thực tế", "Không có ý kiến", "Cảm ơn thầy cô", "Phòng thi hơi nóng",
+]
+
+
+def make_answers(n: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        text = rng.choice(PHRASES)
+        if rng.random() < 0.3:
+            text = text.lower()
+        if rng.random() < 0.3:
+            text += rng.choice([".", "!", "...", " ", "  !"])
+        if rng.random() < 0.2:
+            # Câu trả lời riêng, tạo nhiều cụm khác nhau
+            text = f"{text} ({i % 5000})"
+        out.append(text if rng.random() > 0.02 else "   ")
+    return out
+
+
+def legacy_frequencies(raw_texts):
+    raw_texts = [t for t in raw_texts if t and t.strip()]
+    canon_to_display = {}
+    for t in raw_texts:
+        display = re.sub(r"\s+", " ", t.strip())
+        tmp = display
+        while tmp and (ud.category(tmp[-1]).startswith('P') or ud.category(tmp[-1]).startswith('Z')):
+            tmp = tmp[:-1]
+        canonical = tmp.lower()
+        if canonical in canon_to_display:
+            old_disp, cnt = canon_to_display[canonical]
+            canon_to_display[canonical] = (old_disp, cnt + 1)
+        else:
+            canon_to_display[canonical] = (display, 1)
+    return {disp: cnt for disp, cnt in canon_to_display.values()}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def render(frequencies):
+    from wordcloud import WordCloud
+    return WordCloud(width=160, height=60, background_color="white", collocations=False, max_words=30,
+                     max_font_size=60, min_font_size=6, prefer_horizontal=1, margin=0,
+                     relative_scaling=0.5).generate_from_frequencies(frequencies)
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10000, 50000, 100000]
+    answer_frequencies(["khởi tạo bảng ký tự"])  # bảng dấu câu Unicode được tính một lần mỗi process
+    for n in sizes:
+        answers = make_answers(n)
+        chunks = [answers[i:i + 5000] for i in range(0, n, 5000)]
+        legacy, t_legacy = timed(legacy_frequencies, answers)
+        fast, t_fast = timed(answer_frequencies, answers)
+        assert fast == legacy, "kết quả chuẩn hóa khác cách cũ"
+        (sample, _), t_sample = timed(reservoir_sample, chunks, WORDCLOUD_SAMPLE_SIZE)
+        _, t_sample_freq = timed(answer_frequencies, sample)
+        _, t_render = timed(render, fast)
+        print(f"{n:7d} answers | legacy {t_legacy * 1000:7.1f} ms | pandas {t_fast * 1000:7.1f} ms"
+              f" ({len(fast)} cụm) | reservoir {WORDCLOUD_SAMPLE_SIZE} {(t_sample + t_sample_freq) * 1000:7.1f} ms"
+              f" | render {t_render * 1000:6.1f} ms (chỉ khi version đổi)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Kiểm tra EXPLAIN QUERY PLAN cho mọi câu SQL mà db.py thực thi.
+
+Script gọi từng hàm public của db.py trên một DB tạm, ghi lại câu SQL qua
+trace callback rồi chạy EXPLAIN QUERY PLAN. Lần quét cả bảng ("SCAN <bảng>"
+không dùng index) nào mà cặp (hàm, bảng) không nằm trong FULL_SCAN_OK sẽ bị
+báo lỗi và script trả về mã thoát 1.
+
+Chạy: python benchmarks/check_query_plans.py
+"""
+import inspect
+import re
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+# (hàm, bảng) được phép quét cả bảng, kèm lý do. Khóa theo bảng để một lần quét mới
+# (bảng khác) trong cùng hàm vẫn bị báo.
+FULL_SCAN_OK = {
+    # Bảng bộ đếm/metadata: mỗi câu hỏi/bộ đếm một dòng, không tăng theo số sinh viên
+    ("get_tallies", "answer_tallies"): "đọc toàn bộ bộ đếm cho Dashboard",
+    ("get_tallies", "question_stats"): "một dòng mỗi câu hỏi",
+    ("get_tallies", "survey_counters"): "vài dòng bộ đếm",
+    ("verify_tallies", "answer_tallies"): "so bộ đếm với responses",
+    ("verify_tallies", "question_stats"): "so bộ đếm với responses",
+    ("verify_tallies", "survey_counters"): "so bộ đếm với responses",
+    ("rebuild_tallies", "question_stats"): "đặt lại mọi bộ đếm",
+    ("create_cohort", "question_stats"): "migrate shard mới: dựng bộ đếm (bảng rỗng)",
+    ("create_cohort", "responses"): "migrate shard mới: bỏ câu trả lời trùng (bảng rỗng)",
+    ("analytics_version", "question_stats"): "SUM(version), một dòng mỗi câu hỏi",
+    ("list_broadcasts", "broadcasts"): "vài đợt gửi, Admin xem toàn bộ",
+    ("list_cohorts", "cohorts"): "vài khóa",
+    # Đọc cố ý toàn bộ câu trả lời (export, phân tích)
+    ("fetch_results", "responses"): "đọc mọi câu trả lời",
+    ("export_responses_as_rows", "responses"): "export toàn bộ",
+    ("iter_export_rows", "responses"): "export toàn bộ theo chunk",
+    ("fetch_slider_scores_frame", "responses"): "phân tích chéo cần mọi câu trả lời slider",
+    # Reset theo yêu cầu của Admin
+    ("reset_responses_and_completion", "responses"): "xóa mọi câu trả lời",
+    ("reset_responses_and_completion", "students"): "đặt lại trạng thái hoàn thành của mọi sinh viên",
+    ("reset_questions_to_new_default", "questions"): "xóa mọi câu hỏi",
+    ("reset_questions_to_new_default", "responses"): "xóa mọi câu trả lời",
+}
+
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:temp\.)?(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|USING\b|SET\b|JOIN\b|LEFT\b|GROUP\b|ORDER\b|VALUES\b|SELECT\b)(\w+))?", re.I)
+
+
+def table_aliases(sql: str) -> dict[str, str]:
+    """Bí danh -> tên bảng trong câu SQL (EXPLAIN QUERY PLAN ghi 'SCAN r' theo bí danh)."""
+    return {alias: table for table, alias in _TABLE_REF.findall(sql) if alias}
+
+
+SKIP_PREFIXES = ("PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "CREATE", "ALTER", "DROP", "SAVEPOINT", "RELEASE")
+
+
+def sample_calls():
+    """(tên hàm, args, kwargs) cho mọi hàm public có truy vấn trong db.py."""
+    qs = db.list_questions()
+    qid = qs[0]["id"]
+    edited = [dict(qs[0], text="Sửa hàng loạt")] + qs[1:] + [{"id": None, "text": "Mới", "qtype": "open"}]
+    return [
+        ("init_db", (), {}),
+        ("seed_questions_if_empty", (), {}),
+        ("upsert_students", ([{"msv": "SV1", "email": "a@b.vn", "name": "A", "score": 8.0}],), {}),
+        ("bulk_upsert_students", ([[("SV2", "c@d.vn", "C", 7.0)]],), {}),
+        ("get_student", ("SV1",), {}),
+        ("check_student_login", ("SV1", "A@B.VN"), {}),
+        ("list_questions", (), {}),
+        ("create_question", ("Câu hỏi?", "Nhóm X", "open"), {}),
+        ("update_question", (qid,), {"text": "Sửa"}),
+        ("questions_version", (), {}),
+        ("apply_question_changes", (qs, edited), {"renumber": True}),
+        ("save_responses", ("SV1", [{"question_id": qid, "value_int": 2, "value_text": None}]), {}),
+        ("mark_completed", ("SV1",), {}),
+        ("submit_survey", ("SV2", [{"question_id": qid, "value_int": 3, "value_text": None}]), {}),
+        ("get_student_responses", ("SV1",), {}),
+        ("get_student_with_responses", ("SV1",), {}),
+        ("fetch_results", (), {}),
+        ("get_tallies", (), {}),
+        ("fetch_slider_scores_frame", (), {}),
+        ("analytics_version", (), {}),
+        ("iter_open_answers", (qid,), {}),
+        ("verify_tallies", (), {}),
+        ("rebuild_tallies", (), {}),
+        ("export_responses_as_rows", (), {}),
+        ("list_students", (), {}),
+        ("list_students_page", (), {}),
+        ("list_students_page", ("SV", "msv"), {"completed": False, "after": ("SV1", "SV1")}),
+        ("list_students_page", ("a", "name"), {"after": ("A", "SV1")}),
+        ("list_students_page", ("a@", "email"), {"completed": True}),
+        ("update_student", ("SV1",), {"name": "B"}),
+        ("can_request_otp", ("SV1",), {}),
+        ("create_otp", ("SV1", "123456"), {}),
+        ("verify_otp", ("SV1", "123456"), {}),
+        ("purge_expired_otps", (), {}),
+        ("enqueue_email", ("a@b.vn", "OTP", "123456"), {}),
+        ("claim_outbox", (), {}),
+        ("mark_outbox_sent", (1,), {}),
+        ("mark_outbox_failed", (1, "451", 5.0), {}),
+        ("get_outbox_message", (1,), {}),
+        ("outbox_stats", (), {}),
+        ("list_cohorts", (), {}),
+        ("create_cohort", ("K65", "Khóa 65"), {}),
+        ("count_broadcast_candidates", (), {"msv_prefix": "SV"}),
+        ("create_broadcast", ("Nhắc", "Chào {name}"), {}),
+        ("list_broadcasts", (), {}),
+        ("release_broadcast_batch", (1, 10, lambda r: "x"), {}),
+        ("broadcast_progress", (1,), {}),
+        ("list_broadcast_recipients", (1,), {}),
+        ("set_broadcast_status", (1, "paused"), {}),
+        ("delete_question", (qid,), {}),
+        ("delete_student", ("SV1",), {}),
+        ("reset_responses_and_completion", (), {}),
+        ("reset_questions_to_new_default", (), {}),
+    ]
+
+
+def main():
+    statements = []
+    current = {"fn": None}
+    original_get_conn = db.get_conn
+
+    @contextmanager
+    def traced_get_conn(*args, **kwargs):
+        with original_get_conn(*args, **kwargs) as conn:
+            conn.set_trace_callback(lambda sql: statements.append((current["fn"], sql)))
+            try:
+                yield conn
+            finally:
+                conn.set_trace_callback(None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(db_path=Path(tmp) / "plans.db")
+        db.init_db()
+        calls = sample_calls()
+        db.get_conn = traced_get_conn
+        try:
+            for name, args, kwargs in calls:
+                current["fn"] = name
+                result = getattr(db, name)(*args, **kwargs)
+                if inspect.isgenerator(result):
+                    list(result)
+            for name in ("iter_export_rows", "iter_student_answers"):
+                current["fn"] = name
+                list(getattr(db, name)())
+        finally:
+            db.get_conn = original_get_conn
+
+        covered = {name for name, _, _ in calls} | {"iter_export_rows", "iter_student_answers"}
+        public = {
+            name for name, fn in inspect.getmembers(db, inspect.isfunction)
+            if fn.__module__ == "db" and not name.startswith("_") and any(s in inspect.getsource(fn) for s in ("with get_conn() as", "with read_conn() as"))
+        }
+        missing = sorted(public - covered)
+
+        failures = []
+        with db.get_conn() as conn:
+            for fn, sql in statements:
+                head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+                # Bảng tạm (temp.*) đã bị DROP khi hàm kết thúc nên không EXPLAIN lại được
+                if not head or head.startswith(SKIP_PREFIXES) or "temp." in sql:
+                    continue
+                plan = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                # Bỏ qua dòng không phải bảng (SCAN CONSTANT ROW, SCAN (subquery-N)): bảng bên trong được liệt kê riêng
+                scans = [p for p in plan if p.startswith("SCAN") and "USING" not in p
+                         and not p.startswith(("SCAN CONSTANT ROW", "SCAN (subquery"))]
+                aliases = table_aliases(sql)
+                scans = [p for p in scans if (fn, aliases.get(p.split()[1], p.split()[1])) not in FULL_SCAN_OK]
+                if scans:
+                    failures.append((fn, " ".join(sql.split()), scans))
+        db.close_pools()
+
+    for fn, sql, scans in failures:
+        print(f"FULL SCAN in {fn}: {scans}\n    {sql}")
+    if missing:
+        print(f"Hàm chưa được kiểm tra (thêm vào sample_calls): {', '.join(missing)}")
+    if failures or missing:
+        sys.exit(1)
+    print(f"OK: {len(statements)} câu SQL, không có truy vấn quét toàn bảng ngoài danh sách cho phép.")
+
+
+if __name__ == "__main__":
+    main()
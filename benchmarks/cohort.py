@@ -0,0 +1,84 @@
+"""Sinh dữ liệu khảo sát giả lập có tính lặp lại (cùng seed -> cùng dữ liệu) cho benchmark.
+
+Gồm N sinh viên, bộ câu hỏi mặc định (có thể nhân thêm câu hỏi) và câu trả lời: slider lệch về
+mức 2-3, câu hỏi mở là các câu tiếng Việt ghép từ mẫu, có lặp lại, khác hoa/thường và dấu câu.
+
+Chạy: python benchmarks/cohort.py đường_dẫn.db [số_sinh_viên] [tỉ_lệ_hoàn_thành]
+"""
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+HO = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Vũ", "Đặng", "Bùi", "Đỗ", "Ngô"]
+DEM = ["Văn", "Thị", "Đức", "Minh", "Thu", "Quang", "Ngọc", "Hữu"]
+TEN = ["An", "Bình", "Châu", "Dũng", "Giang", "Hà", "Hùng", "Linh", "Nam", "Phương", "Quân", "Trang"]
+
+OPEN_SUBJECTS = ["Đơn vị thực tập", "Khóa BIM–Revit", "Chuyên đề", "Giảng viên hướng dẫn", "Buổi thi vấn đáp"]
+OPEN_OPINIONS = [
+    "rất bổ ích", "cần thêm thời gian thực hành", "nên có thêm ví dụ thực tế", "tổ chức tốt",
+    "hơi nặng so với thời lượng", "giúp em hiểu quy trình thiết kế", "phòng máy cần nâng cấp",
+    "tài liệu nên gửi trước",
+]
+OPEN_SHORT = ["Tốt", "Ổn", "Không có ý kiến", "Cảm ơn thầy cô", "Rất hay"]
+
+
+def student_rows(n: int, seed: int = 0) -> list[tuple]:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        msv = f"{2151000000 + i}"
+        name = f"{rng.choice(HO)} {rng.choice(DEM)} {rng.choice(TEN)}"
+        rows.append((msv, f"{msv}@e.tlu.edu.vn", name, round(rng.uniform(5, 10), 1)))
+    return rows
+
+
+def open_answer(rng: random.Random) -> str:
+    if rng.random() < 0.4:
+        text = rng.choice(OPEN_SHORT)
+    else:
+        text = f"{rng.choice(OPEN_SUBJECTS)} {rng.choice(OPEN_OPINIONS)}"
+    if rng.random() < 0.3:
+        text = text.lower()
+    if rng.random() < 0.4:
+        text += rng.choice([".", "!", "...", " ", " ạ."])
+    return text
+
+
+def answers_for(qs: list[dict], rng: random.Random) -> list[dict]:
+    return [
+        {"question_id": q["id"], "value_int": rng.choices([1, 2, 3], weights=[1, 3, 4])[0], "value_text": None}
+        if q["qtype"] == "slider" else
+        {"question_id": q["id"], "value_int": None, "value_text": open_answer(rng) if rng.random() < 0.8 else ""}
+        for q in qs
+    ]
+
+
+def generate(db_path, students: int = 1000, completed: float = 0.7, extra_questions: int = 0, seed: int = 0) -> dict:
+    """Tạo DB mới tại db_path với dữ liệu giả lập; trả về số lượng đã sinh."""
+    db.configure(db_path=db_path)
+    db.init_db()
+    rng = random.Random(seed)
+    for i in range(extra_questions):
+        db.create_question(f"Câu hỏi bổ sung {i + 1}", f"Nhóm {5 + i // 10} – Bổ sung", "slider" if i % 4 else "open",
+                           "Thấp", "Trung bình", "Cao")
+    rows = student_rows(students, seed)
+    db.bulk_upsert_students([rows])
+    qs = db.list_questions()
+    done = 0
+    for msv, *_ in rows:
+        if rng.random() < completed:
+            db.submit_survey(msv, answers_for(qs, rng))
+            done += 1
+    return {"students": students, "questions": len(qs), "completed": done, "responses": done * len(qs)}
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "cohort.db"
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.7
+    print(generate(path, n, ratio))
+    db.close_pools()
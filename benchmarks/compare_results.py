@@ -0,0 +1,46 @@
+"""So sánh hai file JSON của bench_suite.py, báo các mục chậm hơn ngưỡng cho phép.
+
+Chạy: python benchmarks/compare_results.py cũ.json mới.json [--threshold 1.25] [--min-ms 0.5]
+Trả về mã thoát 1 nếu có mục chậm đi (tiện dùng trong CI).
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path):
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.25, help="tỉ lệ mới/cũ coi là chậm đi")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="bỏ qua mục nhanh hơn mức này (nhiễu đo)")
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}"
+          f" ({new['meta']['students']} sinh viên, sqlite {new['meta']['sqlite']})")
+    regressions = 0
+    for section in ("db", "pages"):
+        for name, cur in sorted(new.get(section, {}).items()):
+            prev = old.get(section, {}).get(name)
+            if prev is None:
+                print(f"  {section:5s} {name:32s} {cur['median_ms']:9.3f} ms  (mới)")
+                continue
+            ratio = cur["median_ms"] / max(prev["median_ms"], 1e-9)
+            flag = ""
+            if ratio >= args.threshold and cur["median_ms"] >= args.min_ms:
+                flag = "  <-- chậm hơn"
+                regressions += 1
+            print(f"  {section:5s} {name:32s} {prev['median_ms']:9.3f} -> {cur['median_ms']:9.3f} ms  x{ratio:5.2f}{flag}")
+    if regressions:
+        print(f"{regressions} mục chậm hơn x{args.threshold:g}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Load test nhiều phiên sinh viên đồng thời: đăng nhập OTP -> nộp bài -> xem Dashboard.
+
+Hai chế độ:
+  db     mỗi phiên là một luồng gọi db.py đúng thứ tự như trang Sinh viên/Dashboard; tất cả
+         bắt đầu cùng lúc (giống lúc cả lớp bấm nộp bài).
+  pages  mỗi phiên chạy thật các script trang bằng AppTest (OTP đọc từ DEV MODE). AppTest không
+         chạy song song trong một process được, nên --concurrency là số process.
+
+So sánh cách xử lý tranh chấp khóa: baseline = BEGIN DEFERRED, không thử lại;
+tuned = BEGIN IMMEDIATE + thử lại có jitter (mặc định của db.py). Báo cáo thông lượng,
+p50/p99 từng bước, tỉ lệ lỗi ("database is locked" tách riêng) và db.lock_stats().
+
+Chạy: python benchmarks/load_test.py [--mode db|pages] [--sessions 300] [--concurrency 300]
+                                     [--strategy both|tuned|baseline] [--busy-timeout 200] [--admin-import 20000]
+"""
+import argparse
+import logging
+import multiprocessing
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import db  # noqa: E402
+import cohort  # noqa: E402
+
+STRATEGIES = {
+    "baseline": {"write_begin": "DEFERRED", "lock_retries": 0},
+    "tuned": {"write_begin": "IMMEDIATE", "lock_retries": db.LOCK_RETRIES},
+}
+
+STEPS = ["login", "verify", "load", "submit", "dashboard"]
+
+
+def setup_db(db_path, strategy, busy_timeout):
+    pragmas = {"busy_timeout": busy_timeout} if busy_timeout is not None else {}
+    db.configure(db_path=db_path, **STRATEGIES[strategy], **pragmas)
+    db.reset_lock_stats()
+
+
+def classify(e: Exception | str) -> str:
+    text = str(e)
+    return "locked" if "locked" in text or "busy" in text else type(e).__name__ if isinstance(e, Exception) else "error"
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []  # (bước, giây, lỗi hoặc None)
+        self._lock = threading.Lock()
+
+    def step(self, name, fn):
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            with self._lock:
+                self.samples.append((name, time.perf_counter() - start, classify(e)))
+            raise
+        with self._lock:
+            self.samples.append((name, time.perf_counter() - start, None))
+        return result
+
+
+# ---------- Chế độ db: các lời gọi db.py của một phiên ----------
+def db_session(rec, msv, email, rng):
+    code = f"{rng.randrange(10 ** 6):06d}"
+
+    def login():
+        stu = db.check_student_login(msv, email)
+        if not (stu and stu["email_match"]) or not db.can_request_otp(msv):
+            raise RuntimeError("login rejected")
+        db.create_otp(msv, code)
+
+    rec.step("login", login)
+    if not rec.step("verify", lambda: db.verify_otp(msv, code)):
+        raise RuntimeError("otp rejected")
+    qs = rec.step("load", lambda: (db.get_student_with_responses(msv), db.list_questions())[1])
+    answers = cohort.answers_for(qs, rng)
+    rec.step("submit", lambda: db.submit_survey(msv, answers))
+    rec.step("dashboard", lambda: (db.get_tallies(), db.get_student_with_responses(msv)))
+
+
+def run_db_mode(db_path, rows, concurrency, strategy, busy_timeout):
+    setup_db(db_path, strategy, busy_timeout)
+    rec = Recorder()
+    failures = []
+    barrier = threading.Barrier(min(concurrency, len(rows)))
+    queue = list(rows)
+    queue_lock = threading.Lock()
+
+    def worker(k):
+        rng = random.Random(k)
+        barrier.wait()
+        while True:
+            with queue_lock:
+                if not queue:
+                    return
+                msv, email, *_ = queue.pop()
+            try:
+                db_session(rec, msv, email, rng)
+            except Exception as e:
+                failures.append(classify(e))
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(min(concurrency, len(rows)))]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return rec.samples, failures, time.perf_counter() - start, db.lock_stats()
+
+
+# ---------- Chế độ pages: chạy script trang bằng AppTest ----------
+def page_session(rec, msv, email):
+    from streamlit.testing.v1 import AppTest
+
+    def check(at):
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        return at
+
+    at = AppTest.from_file(str(ROOT / "pages" / "1_Sinh viên.py"), default_timeout=120)
+    check(at.run())
+
+    def login():
+        at.text_input[0].input(msv)
+        at.text_input[1].input(email)
+        check(at.button[0].click().run())
+        match = re.search(r"là: (\d{6})", at.code[0].value if at.code else "")
+        if not match:
+            raise RuntimeError("login rejected")
+        return match.group(1)
+
+    code = rec.step("login", login)
+
+    def verify():
+        next(t for t in at.text_input if t.label.startswith("Mã 6")).input(code)
+        check(next(b for b in at.button if b.label == "Xác thực").click().run())
+        if not at.text_area and not at.slider:
+            raise RuntimeError("otp rejected")
+
+    rec.step("verify", verify)
+
+    def submit():
+        for area in at.text_area:
+            if area.key and area.key.startswith("open_"):
+                area.input("Nội dung ổn, cần thêm thời gian thực hành.")
+        check(next(b for b in at.button if b.label.startswith("Gửi bài")).click().run())
+        if not any("Đã ghi nhận" in s.value for s in at.success):
+            raise RuntimeError("submit rejected")
+
+    rec.step("submit", submit)
+
+    def dashboard():
+        dash = AppTest.from_file(str(ROOT / "pages" / "3_Dashboard.py"), default_timeout=120)
+        dash.session_state["auth_msv"] = msv
+        check(dash.run())
+
+    rec.step("dashboard", dashboard)
+
+
+def page_worker(args):
+    db_path, rows, strategy, busy_timeout = args
+    for name in ("streamlit.runtime.scriptrunner_utils.script_run_context", "streamlit.elements.lib.policies",
+                 "streamlit.runtime.caching.cache_data_api"):
+        logging.getLogger(name).addFilter(lambda record: record.levelno >= logging.ERROR)
+    setup_db(db_path, strategy, busy_timeout)
+    rec, failures = Recorder(), []
+    for msv, email, *_ in rows:
+        try:
+            page_session(rec, msv, email)
+        except Exception as e:
+            failures.append(classify(e))
+    db.close_pools()
+    return rec.samples, failures, db.lock_stats()
+
+
+def run_pages_mode(db_path, rows, concurrency, strategy, busy_timeout):
+    db.close_pools()
+    parts = [rows[i::concurrency] for i in range(concurrency)]
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(concurrency) as pool:
+        start = time.perf_counter()
+        results = pool.map(page_worker, [(db_path, part, strategy, busy_timeout) for part in parts if part])
+        elapsed = time.perf_counter() - start
+    samples, failures = [], []
+    stats = {"retries": 0, "recovered": 0, "failures": 0, "wait_s": 0.0}
+    for s, f, lock in results:
+        samples += s
+        failures += f
+        for field in stats:
+            stats[field] += lock[field]
+    return samples, failures, elapsed, stats
+
+
+# ---------- Tải nền: Admin import danh sách lớn trong lúc sinh viên nộp bài ----------
+def admin_importer(db_path, rows, stop, strategy, busy_timeout, counts):
+    setup_db(db_path, strategy, busy_timeout)
+    extra = [(f"IMP{i:07d}", f"imp{i}@e.tlu.edu.vn", "Import", 5.0) for i in range(rows)]
+    while not stop.is_set():
+        try:
+            db.bulk_upsert_students([extra])
+            counts["ok"] += 1
+        except Exception as e:
+            counts[classify(e)] = counts.get(classify(e), 0) + 1
+        # Đổi điểm để lần import sau thực sự ghi lại toàn bộ
+        extra = [(m, e, n, 10.0 - s) for m, e, n, s in extra]
+
+
+def report(label, samples, failures, elapsed, sessions, lock):
+    print(f"\n== {label}: {sessions} phiên trong {elapsed:.1f} s -> {sessions / elapsed:.1f} phiên/s, "
+          f"hoàn tất {sessions - len(failures)}, lỗi {len(failures)} ({100 * len(failures) / sessions:.1f}%)")
+    if failures:
+        kinds = {}
+        for kind in failures:
+            kinds[kind] = kinds.get(kind, 0) + 1
+        print(f"   lỗi theo loại: {kinds}")
+    for step in STEPS:
+        ms = sorted(s * 1000 for name, s, err in samples if name == step)
+        errors = sum(1 for name, _, err in samples if name == step and err)
+        if ms:
+            print(f"   {step:10s} n={len(ms):5d}  p50 {statistics.median(ms):8.1f} ms  "
+                  f"p99 {ms[min(len(ms) - 1, int(len(ms) * 0.99))]:8.1f} ms  max {ms[-1]:8.1f} ms  lỗi {errors}")
+    print(f"   lock: thử lại {lock['retries']}, thành công sau khi thử lại {lock['recovered']}, "
+          f"hết lượt {lock['failures']}, chờ backoff {lock['wait_s']:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["db", "pages"], default="db")
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="số luồng (db, mặc định = sessions) hoặc số process (pages, mặc định 4)")
+    parser.add_argument("--strategy", choices=["both", "baseline", "tuned"], default="both")
+    parser.add_argument("--busy-timeout", type=int, default=None,
+                        help="ms, mặc định theo db.PRAGMA_PROFILE; giảm để mô phỏng ổ đĩa chậm")
+    parser.add_argument("--admin-import", type=int, default=0,
+                        help="số dòng Admin import lặp lại trong lúc test (transaction ghi dài)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    concurrency = args.concurrency or (args.sessions if args.mode == "db" else 4)
+
+    for strategy in (["baseline", "tuned"] if args.strategy == "both" else [args.strategy]):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "load.db"
+            cohort.generate(db_path, args.sessions, completed=0.0, seed=args.seed)
+            rows = cohort.student_rows(args.sessions, seed=args.seed)
+            stop, counts = threading.Event(), {"ok": 0}
+            importer = None
+            if args.admin_import:
+                importer = threading.Thread(target=admin_importer,
+                                            args=(db_path, args.admin_import, stop, strategy, args.busy_timeout, counts))
+                importer.start()
+            run = run_db_mode if args.mode == "db" else run_pages_mode
+            samples, failures, elapsed, lock = run(db_path, rows, concurrency, strategy, args.busy_timeout)
+            stop.set()
+            if importer:
+                importer.join()
+            report(f"{strategy} ({args.mode}, {concurrency} đồng thời)", samples, failures, elapsed,
+                   args.sessions, lock)
+            if importer:
+                print(f"   admin import: {counts}")
+            db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
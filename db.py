@@ -1,69 +1,595 @@
+import functools
+import os
+import random
+import re
 import sqlite3
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
 from datetime import datetime, timedelta
 import hashlib
+import inspect
+import itertools
+
+import pandas as pd
+from sqlalchemy.engine import make_url
+
+import db_backend
+import utils_perf
 
 DB_PATH = Path("survey.db")
 
+# Số kết nối nhàn rỗi tối đa giữ lại trong pool cho mỗi file DB
+POOL_SIZE = 8
+
+# Gom các lần nộp bài đồng thời vào một transaction (group commit), xem submit_survey()
+WRITE_QUEUE = False
+
+# PRAGMA áp dụng một lần khi mở mỗi kết nối (chỉnh bằng configure())
+PRAGMA_PROFILE = {
+    "journal_mode": "WAL",      # người đọc không chặn người ghi
+    "synchronous": "NORMAL",    # đủ an toàn với WAL, ít fsync hơn FULL
+    "cache_size": -16000,       # số âm = KiB (~16 MB)
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,       # ms chờ khóa trước khi báo "database is locked"
+}
+
+# Kiểu transaction ngầm trước câu lệnh ghi. IMMEDIATE lấy khóa ghi ngay (chờ tối đa busy_timeout)
+# thay vì đọc trước rồi nâng lên ghi, trường hợp SQLite báo "database is locked" không chờ.
+WRITE_BEGIN = "IMMEDIATE"
+
+# Lỗi khóa còn lọt qua busy_timeout: gọi lại cả hàm tối đa LOCK_RETRIES lần, lần thứ n chờ ngẫu nhiên
+# trong [0, LOCK_BACKOFF * 2**n] giây (tối đa LOCK_BACKOFF_MAX), xem _retry_on_lock()
+LOCK_RETRIES = 4
+LOCK_BACKOFF = 0.05
+LOCK_BACKOFF_MAX = 1.0
+
+# Dashboard/export đọc bản snapshot chỉ đọc, cũ nhất SNAPSHOT_MAX_AGE giây (xem read_conn());
+# None = đọc thẳng file DB chính
+SNAPSHOT_MAX_AGE: float | None = None
+
+_backends: dict[str, db_backend.Backend] = {}
+_pools_lock = threading.Lock()
+
+# File DB (shard) của khóa/lớp đang chọn trong luồng hiện tại, xem use_cohort(); None = DB_PATH
+_active_db: ContextVar[Path | None] = ContextVar("active_db", default=None)
+_active_cohort: ContextVar[str] = ContextVar("active_cohort", default="default")
+
+
+def _path(db_path=None) -> Path:
+    """File DB mà một lời gọi dùng: tham số db_path, shard đang chọn, hoặc DB_PATH."""
+    if db_path is not None:
+        return Path(db_path)
+    return _active_db.get() or Path(DB_PATH)
+
+
+def _db_key(db_path=None) -> str:
+    """Khóa định danh file DB cho pool/cache trong process."""
+    return str(_path(db_path).resolve())
+
+
+def _get_backend(db_path=None, readonly: bool = False) -> db_backend.Backend:
+    """Backend (engine SQLAlchemy + pool kết nối) của một file DB, tạo một lần mỗi process."""
+    path = _path(db_path)
+    key = _db_key(path)
+    backend = _backends.get(key)
+    if backend is None:
+        with _pools_lock:
+            backend = _backends.get(key)
+            if backend is None:
+                backend = db_backend.make_backend(db_backend.sqlite_url(path), POOL_SIZE, PRAGMA_PROFILE,
+                                                  readonly=readonly, write_begin=WRITE_BEGIN)
+                _backends[key] = backend
+    return backend
+
+
+def close_pools() -> None:
+    """Đóng mọi kết nối nhàn rỗi (dùng khi đổi cấu hình hoặc kết thúc benchmark)."""
+    with _pools_lock:
+        for backend in _backends.values():
+            backend.close()
+        _backends.clear()
+
+
+def configure(db_path=None, pool_size: int | None = None, write_queue: bool | None = None,
+              snapshot_max_age: float | None = ..., url: str | None = None, write_begin: str | None = None,
+              lock_retries: int | None = None, **pragmas) -> None:
+    """Đổi file DB, kích thước pool, hàng đợi ghi, snapshot hoặc PRAGMA (vd. configure(synchronous="FULL")).
+
+    url: URL SQLAlchemy thay cho db_path (vd. "sqlite:///data/survey.db"); pool_size=0 tắt pool.
+    write_begin/lock_retries: cách xử lý tranh chấp khóa khi ghi (WRITE_BEGIN, LOCK_RETRIES).
+    Các kết nối đang mở được đóng lại để lần gọi sau áp dụng cấu hình mới.
+    """
+    global DB_PATH, POOL_SIZE, WRITE_QUEUE, SNAPSHOT_MAX_AGE, WRITE_BEGIN, LOCK_RETRIES
+    if write_begin is not None:
+        if write_begin.upper() not in ("DEFERRED", "IMMEDIATE", "EXCLUSIVE"):
+            raise ValueError("write_begin phải là DEFERRED, IMMEDIATE hoặc EXCLUSIVE")
+        WRITE_BEGIN = write_begin.upper()
+    if lock_retries is not None:
+        LOCK_RETRIES = lock_retries
+    if url is not None:
+        # Shard theo khóa và snapshot dựa trên đường dẫn file; backend_class() báo lỗi với dialect chưa hỗ trợ
+        db_backend.backend_class(url)
+        db_path = make_url(url).database
+    if snapshot_max_age is not ...:
+        SNAPSHOT_MAX_AGE = snapshot_max_age
+    if db_path is not None:
+        DB_PATH = Path(db_path)
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if write_queue is not None:
+        WRITE_QUEUE = write_queue
+    PRAGMA_PROFILE.update(pragmas)
+    close_pools()
+
+
 @contextmanager
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+def get_conn(db_path=None):
+    backend = _get_backend(db_path)
+    conn = backend.acquire()
+    traced = utils_perf.tracing_sql()
+    if traced:
+        conn.set_trace_callback(utils_perf.trace_sql)
     try:
         yield conn
-    finally:
         conn.commit()
-        conn.close()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if traced:
+            conn.set_trace_callback(None)
+        backend.release(conn)
 
-def init_db():
-    with get_conn() as conn:
-        c = conn.cursor()
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS students (
-            msv TEXT PRIMARY KEY,
-            email TEXT,
-            name TEXT,
-            score REAL,
-            completed INTEGER DEFAULT 0,
-            completed_at TEXT
-        )
-        """)
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS questions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            group_name TEXT,
-            order_no INTEGER,
-            text TEXT,
-            qtype TEXT CHECK(qtype IN ('slider','open')) NOT NULL,
-            low_label TEXT,
-            mid_label TEXT,
-            high_label TEXT
-        )
+# ---------- Snapshot chỉ đọc ----------
+_snapshot_lock = threading.Lock()
+_snapshot_refreshing: set[str] = set()
+_snapshot_stats: dict[str, dict] = {}
+_snapshot_current: dict[str, Path] = {}
+
+
+def _snapshot_files(db_path=None) -> list[Path]:
+    """Các file snapshot của DB, cũ -> mới: survey.db -> survey.snapshot.<time_ns>.db."""
+    path = _path(db_path)
+    return sorted(path.parent.glob(f"{path.stem}.snapshot.*{path.suffix}"),
+                  key=lambda p: int(p.stem.rsplit(".", 1)[-1]) if p.stem.rsplit(".", 1)[-1].isdigit() else -1)
+
+
+def snapshot_path(db_path=None) -> Path | None:
+    """File snapshot mới nhất, None nếu chưa chụp."""
+    files = _snapshot_files(db_path)
+    return files[-1] if files else None
+
+
+def _close_snapshot_backend(target: Path) -> None:
+    with _pools_lock:
+        old = _backends.pop(_db_key(target), None)
+    if old is not None:
+        old.close()
+
+
+def take_snapshot(db_path=None) -> dict:
+    """Chép DB chính sang file snapshot mới bằng Connection.backup, trả về số đo của lần chép.
+
+    Với WAL, backup một bước chỉ giữ một read transaction nên người ghi không bị chặn.
+    Mỗi lần chụp ghi ra file tên mới (không ghi đè file đang có người đọc: trên Windows
+    os.replace vào file đang mở sẽ lỗi); giữ lại bản trước đó cho người đọc đang dở,
+    các bản cũ hơn được xóa khi không còn ai mở.
+    """
+    path = _path(db_path)
+    with _snapshot_lock:
+        start = time.perf_counter()
+        target = path.with_name(f"{path.stem}.snapshot.{time.time_ns()}{path.suffix}")
+        tmp = target.with_name(target.name + ".tmp")
+        src = sqlite3.connect(path, timeout=PRAGMA_PROFILE["busy_timeout"] / 1000)
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+            # File snapshot mở chế độ chỉ đọc nên không dùng WAL (cần file -shm ghi được)
+            dst.execute("PRAGMA journal_mode=DELETE")
+            pages = dst.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        # Tên mới nên không ai đang mở file đích
+        os.replace(tmp, target)
+        seconds = time.perf_counter() - start
+        for stale in _snapshot_files(path)[:-2]:
+            _close_snapshot_backend(stale)
+            try:
+                stale.unlink()
+            except OSError:
+                # Còn kết nối (process khác) đang mở: xóa ở lần chụp sau
+                pass
+        stats = {"taken_at": time.time(), "seconds": seconds, "pages": pages, "bytes": target.stat().st_size}
+        _snapshot_stats[_db_key(path)] = stats
+        return stats
+
+
+def snapshot_age(db_path=None) -> float | None:
+    """Số giây kể từ lần chụp snapshot gần nhất (theo mtime của file), None nếu chưa có."""
+    current = snapshot_path(db_path)
+    try:
+        return None if current is None else max(0.0, time.time() - current.stat().st_mtime)
+    except FileNotFoundError:
+        return None
+
+
+def _refresh_snapshot_async(db_path=None) -> None:
+    # Luồng nền không thấy shard đang chọn của luồng gọi: chốt đường dẫn trước
+    db_path = _path(db_path)
+    key = _db_key(db_path)
+    with _pools_lock:
+        if key in _snapshot_refreshing:
+            return
+        _snapshot_refreshing.add(key)
+
+    def run():
+        try:
+            take_snapshot(db_path)
+        except (sqlite3.Error, OSError):
+            # Giữ snapshot cũ, thử lại ở lần đọc sau
+            pass
+        finally:
+            _snapshot_refreshing.discard(key)
+
+    threading.Thread(target=run, name="snapshot-refresh", daemon=True).start()
+
+
+def snapshot_info(db_path=None) -> dict:
+    """Trạng thái snapshot cho giao diện: enabled, max_age, age (giây) và số đo lần chụp gần nhất."""
+    return {
+        "enabled": SNAPSHOT_MAX_AGE is not None,
+        "max_age": SNAPSHOT_MAX_AGE,
+        "age": snapshot_age(db_path),
+        "last": _snapshot_stats.get(_db_key(db_path)),
+    }
+
+
+@contextmanager
+def read_conn(db_path=None):
+    """Kết nối cho truy vấn đọc nặng (Dashboard, export).
+
+    Khi SNAPSHOT_MAX_AGE khác None, đọc file snapshot chỉ đọc: chưa có thì chụp ngay, quá hạn
+    thì chụp lại ở luồng nền và tạm dùng bản hiện có. Ngược lại dùng get_conn() như thường.
+    """
+    if SNAPSHOT_MAX_AGE is None:
+        with get_conn(db_path) as conn:
+            yield conn
+        return
+    age = snapshot_age(db_path)
+    if age is None:
+        take_snapshot(db_path)
+    elif age > SNAPSHOT_MAX_AGE:
+        _refresh_snapshot_async(db_path)
+    while True:
+        current = snapshot_path(db_path)
+        # Đã có bản mới hơn (có thể do process khác chụp): đóng pool của bản cũ để file được xóa
+        previous = _snapshot_current.get(_db_key(db_path))
+        if previous is not None and previous != current:
+            _close_snapshot_backend(previous)
+        _snapshot_current[_db_key(db_path)] = current
+        backend = _get_backend(current, readonly=True)
+        try:
+            conn = backend.acquire()
+            break
+        except Exception:
+            # File vừa bị xóa sau khi có bản mới hơn: lấy lại bản mới nhất
+            if current.exists():
+                raise
+    traced = utils_perf.tracing_sql()
+    if traced:
+        conn.set_trace_callback(utils_perf.trace_sql)
+    try:
+        yield conn
+    finally:
+        if traced:
+            conn.set_trace_callback(None)
+        backend.release(conn)
+
+# ---------- Khóa/lớp (cohort): mỗi khóa một file SQLite ----------
+DEFAULT_COHORT = "default"
+_COHORT_CODE = re.compile(r"^[A-Za-z0-9_-]{1,40}$")
+
+
+def cohort_path(code: str | None) -> Path:
+    """Khóa mặc định dùng DB_PATH (dữ liệu cũ); các khóa khác nằm trong thư mục cohorts/ cạnh nó."""
+    if code in (None, DEFAULT_COHORT):
+        return Path(DB_PATH)
+    return Path(DB_PATH).parent / "cohorts" / f"{code}.db"
+
+
+@contextmanager
+def using_cohort(code: str | None):
+    """Chuyển mọi lời gọi db.py trong khối with sang shard của khóa `code`."""
+    tokens = _active_db.set(cohort_path(code)), _active_cohort.set(code or DEFAULT_COHORT)
+    try:
+        yield
+    finally:
+        _active_db.reset(tokens[0])
+        _active_cohort.reset(tokens[1])
+
+
+def use_cohort(code: str | None) -> None:
+    """Chọn shard cho phần còn lại của luồng hiện tại (mỗi lần Streamlit chạy lại trang)."""
+    _active_db.set(cohort_path(code))
+    _active_cohort.set(code or DEFAULT_COHORT)
+
+
+def current_cohort() -> str:
+    return _active_cohort.get()
+
+
+# ---------- Schema migrations ----------
+def _table_columns(c, table: str) -> set[str]:
+    c.execute(f"PRAGMA table_info({table})")
+    return {r["name"] for r in c.fetchall()}
+
+def _add_column(c, table: str, column: str, decl: str) -> None:
+    """ALTER TABLE ADD COLUMN chỉ khi cột chưa có (an toàn với DB production cũ)."""
+    if column not in _table_columns(c, table):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _migration_base_tables(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS students (
+        msv TEXT PRIMARY KEY,
+        email TEXT,
+        name TEXT,
+        score REAL,
+        completed INTEGER DEFAULT 0,
+        completed_at TEXT
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_name TEXT,
+        order_no INTEGER,
+        text TEXT,
+        qtype TEXT CHECK(qtype IN ('slider','open')) NOT NULL,
+        low_label TEXT,
+        mid_label TEXT,
+        high_label TEXT
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS responses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        msv TEXT,
+        question_id INTEGER,
+        value_int INTEGER,
+        value_text TEXT,
+        created_at TEXT,
+        FOREIGN KEY(msv) REFERENCES students(msv),
+        FOREIGN KEY(question_id) REFERENCES questions(id)
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS otps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        msv TEXT,
+        code_hash TEXT,
+        expires_at TEXT,
+        created_at TEXT,
+        used INTEGER DEFAULT 0
+    )
+    """)
+
+# Index cho các truy vấn nóng; tên cố định để migration có thể tạo lại/kiểm tra
+INDEXES = {
+    "idx_responses_msv_question": "CREATE UNIQUE INDEX IF NOT EXISTS idx_responses_msv_question ON responses(msv, question_id)",
+    "idx_responses_question": "CREATE INDEX IF NOT EXISTS idx_responses_question ON responses(question_id)",
+    "idx_otps_msv": "CREATE INDEX IF NOT EXISTS idx_otps_msv ON otps(msv, id)",
+    "idx_questions_order": "CREATE INDEX IF NOT EXISTS idx_questions_order ON questions(order_no)",
+}
+
+def _migration_hot_indexes(c):
+    # Dữ liệu cũ có thể có câu trả lời trùng (bấm gửi 2 lần): giữ bản ghi mới nhất
+    c.execute("""
+    DELETE FROM responses
+    WHERE id NOT IN (SELECT MAX(id) FROM responses GROUP BY msv, question_id)
+    """)
+    for ddl in INDEXES.values():
+        c.execute(ddl)
+
+def _migration_tallies(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS answer_tallies (
+        question_id INTEGER,
+        value_int INTEGER,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (question_id, value_int)
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS question_stats (
+        question_id INTEGER PRIMARY KEY,
+        answers INTEGER NOT NULL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS survey_counters (
+        name TEXT PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    for ddl in TALLY_TRIGGERS:
+        c.execute(ddl)
+    _rebuild_tallies(c)
+
+def _migration_meta_versions(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('questions_version', 1)")
+    # Mọi thay đổi bảng questions (kể cả từ process khác) đều tăng version
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_questions_version_{event.lower()} AFTER {event} ON questions
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'questions_version';
+        END
         """)
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS responses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            msv TEXT,
-            question_id INTEGER,
-            value_int INTEGER,
-            value_text TEXT,
-            created_at TEXT,
-            FOREIGN KEY(msv) REFERENCES students(msv),
-            FOREIGN KEY(question_id) REFERENCES questions(id)
-        )
+
+def _migration_otp_attempts(c):
+    _add_column(c, "otps", "attempts", "INTEGER DEFAULT 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_otps_expires ON otps(expires_at)")
+
+def _migration_outbox(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        to_email TEXT NOT NULL,
+        subject TEXT,
+        body TEXT,
+        status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending','sending','sent','failed')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        next_attempt_at TEXT,
+        claimed_at TEXT,
+        created_at TEXT,
+        sent_at TEXT
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, next_attempt_at)")
+
+def _migration_broadcasts(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subject TEXT NOT NULL,
+        body_template TEXT NOT NULL,
+        rate_per_min INTEGER NOT NULL DEFAULT 60,
+        status TEXT NOT NULL DEFAULT 'running' CHECK(status IN ('running','paused','done')),
+        description TEXT,
+        created_at TEXT,
+        finished_at TEXT
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS broadcast_recipients (
+        broadcast_id INTEGER NOT NULL,
+        msv TEXT NOT NULL,
+        email TEXT,
+        status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending','queued')),
+        outbox_id INTEGER,
+        PRIMARY KEY (broadcast_id, msv)
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status ON broadcast_recipients(broadcast_id, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_students_completed ON students(completed, msv)")
+
+def _migration_cohorts(c):
+    # Chỉ dùng trong DB chính (DB_PATH); các shard cũng có bảng này nhưng để trống
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS cohorts (
+        code TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        created_at TEXT
+    )
+    """)
+
+def _migration_student_search(c):
+    # Tìm theo tiền tố họ tên/email không phân biệt hoa thường + phân trang keyset (cột, msv)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students(name COLLATE NOCASE, msv)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_students_email ON students(email COLLATE NOCASE, msv)")
+
+def _migration_scores_version(c):
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('scores_version', 1)")
+    # Phân tích điểm vấn đáp cache theo version: tăng khi điểm thay đổi (import, sửa, xóa sinh viên)
+    for event, when in (("INSERT", "NEW.score IS NOT NULL"), ("DELETE", "OLD.score IS NOT NULL"),
+                        ("UPDATE OF score", "OLD.score IS NOT NEW.score")):
+        c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_students_score_{event.split()[0].lower()} AFTER {event} ON students
+        WHEN {when}
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'scores_version';
+        END
         """)
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS otps (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            msv TEXT,
-            code_hash TEXT,
-            expires_at TEXT,
-            created_at TEXT,
-            used INTEGER DEFAULT 0
+
+def _migration_broadcast_pacing(c):
+    # Token bucket của đợt gửi nằm trong DB để mọi process chạy BroadcastRunner dùng chung một hạn mức
+    _add_column(c, "broadcasts", "tokens", "REAL")
+    _add_column(c, "broadcasts", "tokens_at", "REAL")  # epoch giây (time.time()), so được giữa các process
+
+# Danh sách migration theo thứ tự (version, tên, hàm nhận cursor).
+# Chỉ thêm bước mới vào cuối; không sửa bước đã chạy trên production.
+MIGRATIONS = [
+    (1, "base tables", _migration_base_tables),
+    (2, "hot query indexes", _migration_hot_indexes),
+    (3, "answer tallies", _migration_tallies),
+    (4, "meta versions", _migration_meta_versions),
+    (5, "otp attempts", _migration_otp_attempts),
+    (6, "email outbox", _migration_outbox),
+    (7, "broadcasts", _migration_broadcasts),
+    (8, "cohort registry", _migration_cohorts),
+    (9, "student search indexes", _migration_student_search),
+    (10, "scores version", _migration_scores_version),
+    (11, "broadcast pacing", _migration_broadcast_pacing),
+]
+
+def schema_version(conn) -> int:
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return int(c.fetchone()[0])
+
+def migrate(conn) -> int:
+    """Áp dụng các migration còn thiếu trong một transaction; trả về version hiện tại."""
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TEXT
+    )
+    """)
+    conn.commit()
+    current = schema_version(conn)
+    if current >= MIGRATIONS[-1][0]:
+        return current
+    # BEGIN IMMEDIATE: chỉ một process được migrate, process khác chờ rồi đọc lại version
+    c.execute("BEGIN IMMEDIATE")
+    current = schema_version(conn)
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        step(c)
+        c.execute(
+            "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+            (version, name, datetime.utcnow().isoformat()),
         )
-        """)
-    seed_questions_if_empty()
+        current = version
+    conn.commit()
+    return current
+
+_initialized: set[str] = set()
+_init_lock = threading.Lock()
+
+def init_db():
+    """Migrate + seed một lần cho mỗi file DB trong process.
+
+    Streamlit chạy lại script ở mỗi thao tác; các lần gọi sau chỉ kiểm tra một set.
+    """
+    key = _db_key()
+    if key in _initialized:
+        return
+    with _init_lock:
+        if key in _initialized:
+            return
+        with get_conn() as conn:
+            migrate(conn)
+        seed_questions_if_empty()
+        _initialized.add(key)
 
 def _default_questions_data():
     return [
@@ -120,6 +646,7 @@ def seed_questions_if_empty():
             INSERT INTO questions (group_name, order_no, text, qtype, low_label, mid_label, high_label)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         """, data)
+    _touch_students()
 
 def reset_questions_to_new_default():
     with get_conn() as conn:
@@ -135,20 +662,103 @@ def reset_questions_to_new_default():
             """,
             data,
         )
+    _touch_students()
 
 def upsert_students(rows):
+    # ON CONFLICT chỉ cập nhật email/name/score nên completed/completed_at được giữ nguyên
     with get_conn() as conn:
         c = conn.cursor()
-        for r in rows:
-            c.execute("""
-            INSERT INTO students (msv, email, name, score, completed, completed_at)
-            VALUES (?, ?, ?, ?, COALESCE((SELECT completed FROM students WHERE msv=?), 0),
-                    COALESCE((SELECT completed_at FROM students WHERE msv=?), NULL))
-            ON CONFLICT(msv) DO UPDATE SET
-                email=excluded.email,
-                name=excluded.name,
-                score=excluded.score
-            """, (r["msv"], r["email"], r["name"], r["score"], r["msv"], r["msv"]))
+        c.executemany("""
+        INSERT INTO students (msv, email, name, score)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(msv) DO UPDATE SET
+            email=excluded.email,
+            name=excluded.name,
+            score=excluded.score
+        """, [(r["msv"], r["email"], r["name"], r["score"]) for r in rows])
+    _touch_students()
+
+def bulk_upsert_students(chunks) -> dict:
+    """Import danh sách lớn: mỗi phần tử của `chunks` là list tuple (msv, email, name, score).
+
+    Các chunk được nạp vào bảng tạm khi chưa giữ khóa ghi (đọc file lâu bao nhiêu thì OTP/nộp bài
+    vẫn ghi bình thường), rồi merge vào `students` trong một transaction BEGIN IMMEDIATE ngắn.
+    Trả về số dòng inserted/updated/unchanged, tổng số và tốc độ (dòng/giây).
+    """
+    started = time.perf_counter()
+    with get_conn() as conn:
+        c = conn.cursor()
+        # DEFERRED và chỉ ghi vào schema temp (riêng của kết nối): không lấy khóa ghi của DB chính
+        c.execute("BEGIN DEFERRED")
+        c.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS import_students (
+            msv TEXT PRIMARY KEY, email TEXT, name TEXT, score REAL
+        )
+        """)
+        c.execute("DELETE FROM temp.import_students")
+        for chunk in chunks:
+            # Trùng MSV trong file: dòng sau ghi đè dòng trước
+            c.executemany("INSERT OR REPLACE INTO temp.import_students VALUES (?, ?, ?, ?)", chunk)
+        conn.commit()
+
+        # Bảng tạm đã nạp xong nên phần merge chạy lại được khi gặp lỗi khóa
+        @_retry_on_lock
+        def _merge_import():
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                c.execute("""
+                SELECT COUNT(*) AS total,
+                       SUM(s.msv IS NULL) AS inserted,
+                       SUM(s.msv IS NOT NULL AND s.email IS t.email AND s.name IS t.name AND s.score IS t.score) AS unchanged
+                FROM temp.import_students t
+                LEFT JOIN students s ON s.msv = t.msv
+                """)
+                row = c.fetchone()
+                c.execute("""
+                INSERT INTO students (msv, email, name, score)
+                SELECT msv, email, name, score FROM temp.import_students WHERE true
+                ON CONFLICT(msv) DO UPDATE SET
+                    email=excluded.email,
+                    name=excluded.name,
+                    score=excluded.score
+                WHERE students.email IS NOT excluded.email
+                   OR students.name IS NOT excluded.name
+                   OR students.score IS NOT excluded.score
+                """)
+                c.execute("DROP TABLE temp.import_students")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return row["total"], row["inserted"] or 0, row["unchanged"] or 0
+
+        total, inserted, unchanged = _merge_import()
+    _touch_students()
+    elapsed = time.perf_counter() - started
+    return {
+        "total": total,
+        "inserted": inserted,
+        "updated": total - inserted - unchanged,
+        "unchanged": unchanged,
+        "seconds": elapsed,
+        "rows_per_sec": total / elapsed if elapsed > 0 else float(total),
+    }
+
+# ---------- Phiên bản bản ghi sinh viên (trong process) ----------
+# Trang Sinh viên giữ bản ghi + câu trả lời của sinh viên đã đăng nhập trong session và chỉ đọc lại
+# khi student_version() đổi, nên các lần rerun không cần truy vấn. Mọi hàm ghi students/responses/
+# questions gọi _touch_students() sau khi commit; sửa từ process khác chỉ thấy sau khi đăng nhập lại.
+_student_writes = itertools.count(1)
+_student_rev: dict[tuple[str, str | None], int] = {}
+
+def _touch_students(msv: str | None = None, db_path=None) -> None:
+    """Đánh dấu bản ghi của `msv` đã đổi; msv=None: mọi sinh viên của file DB (import, reset, sửa câu hỏi)."""
+    _student_rev[(_db_key(db_path), msv)] = next(_student_writes)
+
+def student_version(msv: str) -> tuple[int, int]:
+    """Phiên bản trong process của bản ghi sinh viên (không truy vấn DB); đổi sau mỗi lần ghi liên quan."""
+    key = _db_key()
+    return _student_rev.get((key, None), 0), _student_rev.get((key, msv), 0)
 
 def get_student(msv):
     with get_conn() as conn:
@@ -157,17 +767,59 @@ def get_student(msv):
         row = c.fetchone()
         return dict(row) if row else None
 
+def check_student_login(msv: str, email: str) -> dict | None:
+    """Tra sinh viên khi đăng nhập: một truy vấn theo khóa chính msv, email so không phân biệt hoa thường.
+
+    Trả về bản ghi kèm "email_match" (bool), None nếu không có MSV.
+    """
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT *, COALESCE(email = ? COLLATE NOCASE, 0) AS email_match FROM students WHERE msv=?",
+                  (email, msv))
+        row = c.fetchone()
+    if row is None:
+        return None
+    student = dict(row)
+    student["email_match"] = bool(student["email_match"])
+    return student
+
+def get_student_with_responses(msv: str) -> tuple[dict | None, list[dict]]:
+    """Bản ghi sinh viên và get_student_responses(msv) trên cùng một kết nối."""
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM students WHERE msv=?", (msv,))
+        row = c.fetchone()
+        if row is None:
+            return None, []
+        return dict(row), _student_responses(c, msv)
+
 def mark_completed(msv):
     with get_conn() as conn:
         c = conn.cursor()
         c.execute("UPDATE students SET completed=1, completed_at=? WHERE msv=?", 
                   (datetime.utcnow().isoformat(), msv))
+    _touch_students(msv)
+
+# Bộ câu hỏi đã đọc, theo file DB: {db_key: (questions_version, [dict, ...])}
+_question_cache: dict[str, tuple[int, list[dict]]] = {}
 
 def list_questions():
+    """Danh sách câu hỏi theo order_no, cache trong process.
+
+    Cache hit chỉ tốn một truy vấn đọc meta.questions_version; trigger trên bảng questions
+    tăng version nên sửa từ Admin ở process khác cũng làm cache hết hạn.
+    """
+    key = _db_key()
     with get_conn() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM questions ORDER BY order_no ASC")
-        return [dict(r) for r in c.fetchall()]
+        c.execute("SELECT value FROM meta WHERE key='questions_version'")
+        version = c.fetchone()[0]
+        cached = _question_cache.get(key)
+        if cached is None or cached[0] != version:
+            c.execute("SELECT * FROM questions ORDER BY order_no ASC")
+            cached = (version, [dict(r) for r in c.fetchall()])
+            _question_cache[key] = cached
+    return [dict(q) for q in cached[1]]
 
 def update_question(qid, text=None, low=None, mid=None, high=None, group_name=None, qtype=None):
     with get_conn() as conn:
@@ -191,6 +843,7 @@ def update_question(qid, text=None, low=None, mid=None, high=None, group_name=No
             """,
             (text, low, mid, high, group_name, qtype, qid),
         )
+    _touch_students()
 
 def create_question(text: str, group_name: str, qtype: str, low: str | None = None,
                     mid: str | None = None, high: str | None = None, order_no: int | None = None) -> int:
@@ -208,25 +861,221 @@ def create_question(text: str, group_name: str, qtype: str, low: str | None = No
             """,
             (group_name, order_no, text, qtype, low, mid, high),
         )
-        return c.lastrowid
+        qid = c.lastrowid
+    _touch_students()
+    return qid
 
 def delete_question(qid: int) -> None:
     with get_conn() as conn:
         c = conn.cursor()
         c.execute("DELETE FROM questions WHERE id=?", (qid,))
+    _touch_students()
+
+_QUESTION_FIELDS = ("group_name", "order_no", "text", "qtype", "low_label", "mid_label", "high_label")
+
+def questions_version() -> int:
+    """Version của bảng questions (trigger tăng sau mỗi lần thêm/sửa/xóa, kể cả từ process khác)."""
+    with get_conn() as conn:
+        return conn.execute("SELECT value FROM meta WHERE key='questions_version'").fetchone()[0]
+
+def apply_question_changes(loaded: list[dict], edited: list[dict], renumber: bool = False,
+                           expected_version: int | None = None) -> dict:
+    """Lưu bảng câu hỏi đã sửa hàng loạt: so `edited` với `loaded` (bản đã đọc khi mở trình sửa)
+    rồi thêm/sửa/xóa trong một transaction.
+
+    Dòng của `edited` có id=None là câu hỏi mới; id có trong `loaded` mà không còn trong `edited`
+    bị xóa; chỉ dòng có trường thay đổi mới được UPDATE. renumber=True đánh lại order_no 1..n
+    theo (order_no, vị trí dòng). expected_version: questions_version() lúc đọc `loaded`; nếu
+    danh sách đã bị sửa ở nơi khác thì báo ValueError và không ghi gì.
+    """
+    rows = []
+    for pos, r in enumerate(edited):
+        row = {f: r.get(f) for f in _QUESTION_FIELDS}
+        row["id"] = r.get("id")
+        if not (row["text"] or "").strip():
+            raise ValueError(f"Dòng {pos + 1}: thiếu nội dung câu hỏi.")
+        if row["qtype"] not in ("slider", "open"):
+            raise ValueError(f"Dòng {pos + 1}: kiểu trả lời phải là 'slider' hoặc 'open'.")
+        if row["qtype"] == "open":
+            row["low_label"] = row["mid_label"] = row["high_label"] = None
+        rows.append(row)
+    if renumber:
+        order = sorted(range(len(rows)), key=lambda i: (rows[i]["order_no"] is None, rows[i]["order_no"] or 0, i))
+        for n, i in enumerate(order, start=1):
+            rows[i]["order_no"] = n
+    else:
+        next_no = max([r["order_no"] or 0 for r in rows], default=0)
+        for row in rows:
+            if row["order_no"] is None:
+                next_no += 1
+                row["order_no"] = next_no
+
+    before = {q["id"]: q for q in loaded}
+    kept = {r["id"] for r in rows if r["id"] is not None}
+    deletes = [(qid,) for qid in before if qid not in kept]
+    inserts = [tuple(r[f] for f in _QUESTION_FIELDS) for r in rows if r["id"] is None]
+    updates, renumbered = [], 0
+    for r in rows:
+        old = before.get(r["id"])
+        if old is None:
+            continue
+        changed = [f for f in _QUESTION_FIELDS if r[f] != old.get(f)]
+        if changed:
+            updates.append(tuple(r[f] for f in _QUESTION_FIELDS) + (r["id"],))
+            renumbered += changed == ["order_no"]
+
+    if deletes or inserts or updates:
+        with get_conn() as conn:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            # Kiểm tra trong transaction ghi: không ai sửa được giữa lúc kiểm tra và lúc ghi
+            c.execute("SELECT value FROM meta WHERE key='questions_version'")
+            if expected_version is not None and c.fetchone()[0] != expected_version:
+                raise ValueError("Danh sách câu hỏi đã được sửa ở nơi khác sau khi bạn mở trình sửa. "
+                                 "Tải lại danh sách rồi sửa lại.")
+            c.executemany("DELETE FROM questions WHERE id=?", deletes)
+            c.executemany(f"""
+                UPDATE questions SET {", ".join(f"{f}=?" for f in _QUESTION_FIELDS)} WHERE id=?
+            """, updates)
+            c.executemany(f"""
+                INSERT INTO questions ({", ".join(_QUESTION_FIELDS)})
+                VALUES ({", ".join("?" * len(_QUESTION_FIELDS))})
+            """, inserts)
+        _touch_students()
+    return {
+        "inserted": len(inserts),
+        "updated": len(updates) - renumbered,
+        "renumbered": renumbered,
+        "deleted": len(deletes),
+    }
 
 def save_responses(msv, response_list):
+    now = datetime.utcnow().isoformat()
     with get_conn() as conn:
         c = conn.cursor()
-        for r in response_list:
-            c.execute("""
-            INSERT INTO responses (msv, question_id, value_int, value_text, created_at)
-            VALUES (?, ?, ?, ?, ?)
-            """, (msv, r.get("question_id"), r.get("value_int"), r.get("value_text"),
-                  datetime.utcnow().isoformat()))
+        # UNIQUE(msv, question_id): gửi lại thì ghi đè câu trả lời cũ thay vì thêm dòng trùng
+        c.executemany("""
+        INSERT INTO responses (msv, question_id, value_int, value_text, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(msv, question_id) DO UPDATE SET
+            value_int=excluded.value_int,
+            value_text=excluded.value_text,
+            created_at=excluded.created_at
+        """, [(msv, r.get("question_id"), r.get("value_int"), r.get("value_text"), now)
+              for r in response_list])
+    _touch_students(msv)
+
+# ---------- Survey submission ----------
+def _submit_in_tx(c, msv, answers, now):
+    """Ghi câu trả lời + completed trong transaction hiện tại; bỏ qua nếu đã hoàn thành."""
+    c.execute("SELECT completed FROM students WHERE msv=?", (msv,))
+    row = c.fetchone()
+    if not row:
+        return None
+    if not row["completed"]:
+        c.executemany("""
+        INSERT INTO responses (msv, question_id, value_int, value_text, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(msv, question_id) DO UPDATE SET
+            value_int=excluded.value_int,
+            value_text=excluded.value_text,
+            created_at=excluded.created_at
+        """, [(msv, a.get("question_id"), a.get("value_int"), a.get("value_text"), now)
+              for a in answers])
+        c.execute("UPDATE students SET completed=1, completed_at=? WHERE msv=?", (now, msv))
+    c.execute("SELECT * FROM students WHERE msv=?", (msv,))
+    return dict(c.fetchone())
+
+def _submit_direct(msv, answers, db_path=None):
+    with get_conn(db_path) as conn:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        return _submit_in_tx(c, msv, answers, datetime.utcnow().isoformat())
+
+
+class _SubmitQueue:
+    """Luồng nền gom các lần nộp bài đồng thời thành một commit (mỗi bài một SAVEPOINT)."""
+
+    def __init__(self, db_path: Path, max_batch: int = 64, max_wait: float = 0.01):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._q = queue.Queue()
+        threading.Thread(target=self._run, name=f"submit-queue:{db_path.name}", daemon=True).start()
+
+    def submit(self, msv, answers, timeout: float = 30):
+        fut = Future()
+        self._q.put((msv, answers, fut))
+        return fut.result(timeout)
+
+    def _collect(self):
+        batch = [self._q.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            results = []
+            try:
+                with get_conn(self.db_path) as conn:
+                    c = conn.cursor()
+                    c.execute("BEGIN IMMEDIATE")
+                    now = datetime.utcnow().isoformat()
+                    for msv, answers, fut in batch:
+                        c.execute("SAVEPOINT submit_one")
+                        try:
+                            results.append((fut, _submit_in_tx(c, msv, answers, now), None))
+                            c.execute("RELEASE submit_one")
+                        except sqlite3.Error as e:
+                            c.execute("ROLLBACK TO submit_one")
+                            c.execute("RELEASE submit_one")
+                            results.append((fut, None, e))
+            except Exception as e:
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for fut, result, error in results:
+                if error is not None:
+                    fut.set_exception(error)
+                else:
+                    fut.set_result(result)
+
+
+_submit_queues: dict[str, _SubmitQueue] = {}
+
+def _get_submit_queue(db_path: Path) -> _SubmitQueue:
+    key = _db_key(db_path)
+    with _pools_lock:
+        q = _submit_queues.get(key)
+        if q is None:
+            q = _submit_queues[key] = _SubmitQueue(db_path)
+    return q
+
+def submit_survey(msv: str, answers: list[dict]) -> dict | None:
+    """Nộp bài khảo sát: ghi câu trả lời và completed trong cùng một transaction.
+
+    Idempotent: sinh viên đã hoàn thành thì không ghi gì thêm. Trả về bản ghi sinh viên
+    sau khi nộp (None nếu không có MSV). Khi WRITE_QUEUE bật, bài nộp đi qua hàng đợi
+    group commit thay vì tự mở transaction.
+    """
+    if WRITE_QUEUE:
+        student = _get_submit_queue(_path()).submit(msv, answers)
+    else:
+        student = _submit_direct(msv, answers)
+    _touch_students(msv)
+    return student
 
 def fetch_results():
-    with get_conn() as conn:
+    with read_conn() as conn:
         c = conn.cursor()
         c.execute("""
         SELECT q.id as question_id, q.text as question_text, q.qtype, 
@@ -237,34 +1086,135 @@ def fetch_results():
         """)
         return [dict(r) for r in c.fetchall()]
 
+# ---------- Analytics API (gộp/đọc theo cột) ----------
+def fetch_slider_scores_frame() -> pd.DataFrame:
+    """Câu trả lời slider kèm điểm vấn đáp: msv (string), question_id (int32), value_int (int8), score (float64)."""
+    with read_conn() as conn:
+        c = conn.cursor()
+        # Tuple thay vì sqlite3.Row: đọc vài trăm nghìn dòng nhanh hơn đáng kể
+        c.row_factory = None
+        c.execute("""
+        SELECT r.msv, r.question_id, r.value_int, s.score
+        FROM responses r
+        JOIN questions q ON q.id = r.question_id
+        JOIN students s ON s.msv = r.msv
+        WHERE q.qtype = 'slider' AND r.value_int IS NOT NULL
+        """)
+        rows = c.fetchall()
+    # NULL score (chưa có điểm) -> NaN
+    frame = pd.DataFrame.from_records(rows, columns=["msv", "question_id", "value_int", "score"])
+    return frame.astype({"msv": "string", "question_id": "int32", "value_int": "int8", "score": "float64"})
+
+def analytics_version() -> tuple[int, int, int]:
+    """(version câu hỏi, version điểm, tổng version câu trả lời): đổi khi dữ liệu phân tích đổi."""
+    with read_conn() as conn:
+        row = conn.execute("""
+        SELECT (SELECT value FROM meta WHERE key = 'questions_version'),
+               COALESCE((SELECT value FROM meta WHERE key = 'scores_version'), 0),
+               (SELECT COALESCE(SUM(version), 0) FROM question_stats)
+        """).fetchone()
+        return tuple(row)
+
+def iter_open_answers(question_id: int, chunk_size: int = 5000):
+    """Chunk list nội dung trả lời (value_text khác NULL) của một câu hỏi, theo index question_id."""
+    with read_conn() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT value_text FROM responses WHERE question_id=? AND value_text IS NOT NULL ORDER BY id",
+            (question_id,),
+        )
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [r[0] for r in rows]
+
 def list_students():
     with get_conn() as conn:
         c = conn.cursor()
         c.execute("SELECT * FROM students ORDER BY msv ASC")
         return [dict(r) for r in c.fetchall()]
 
-def update_student(msv: str, email: str | None = None, name: str | None = None, score: float | None = None):
+STUDENT_SEARCH_FIELDS = ("msv", "name", "email")
+
+# Cận trên của khoảng tiền tố: prefix <= giá trị < prefix + ký tự Unicode lớn nhất
+_PREFIX_END = "\U0010ffff"
+
+def list_students_page(search: str | None = None, field: str = "msv", completed: bool | None = None,
+                       after: tuple | None = None, limit: int = 50) -> dict:
+    """Một trang danh sách sinh viên, phân trang keyset (không OFFSET) nên trang nào cũng tốn như nhau.
+
+    search: tiền tố của `field` (msv phân biệt hoa thường, name/email thì không); khi tìm theo
+    name/email, danh sách sắp theo cột đó rồi tới msv. after: giá trị "next" của trang trước.
+    Trả về {"rows": [...], "next": cursor của trang sau hoặc None}.
+    """
+    if field not in STUDENT_SEARCH_FIELDS:
+        raise ValueError(f"field phải là một trong {STUDENT_SEARCH_FIELDS}")
+    search = (search or "").strip()
+    key = field if search else "msv"
+    where, params = [], []
+    if key == "msv":
+        # Chỉ một cận dưới để SQLite bắt đầu quét từ con trỏ, không từ đầu khoảng tiền tố
+        if after is not None:
+            where.append("msv > ?")
+            params.append(after[1])
+        elif search:
+            where.append("msv >= ?")
+            params.append(search)
+        if search:
+            where.append("msv < ?")
+            params.append(search + _PREFIX_END)
+        order = "msv"
+    else:
+        # So sánh cả cặp (cột, msv) để SQLite bắt đầu quét index đúng tại vị trí của trang
+        start_key, start_msv = after if after is not None else (search, "")
+        where.append(f"({key}, msv) > (? COLLATE NOCASE, ?) AND {key} < ? COLLATE NOCASE")
+        params += [start_key, start_msv, search + _PREFIX_END]
+        order = f"{key} COLLATE NOCASE, msv"
+    if completed is not None:
+        # Khi sắp theo name/email: "+completed" để SQLite không chọn idx_students_completed rồi phải sort
+        where.append("completed = ?" if key == "msv" else "+completed = ?")
+        params.append(int(completed))
+    sql = "SELECT * FROM students"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order} LIMIT ?"
+    with get_conn() as conn:
+        c = conn.cursor()
+        # Lấy thừa một dòng để biết còn trang sau hay không
+        c.execute(sql, params + [limit + 1])
+        rows = [dict(r) for r in c.fetchall()]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {"rows": rows, "next": (rows[-1][key], rows[-1]["msv"]) if more else None}
+
+def update_student(msv: str, email: str | None = None, name: str | None = None, score: float | None = ...):
+    """Sửa thông tin sinh viên; chỉ ghi các trường được truyền.
+
+    email/name=None: giữ nguyên (hai trường bắt buộc). score=None: xóa điểm (chưa có điểm).
+    """
+    fields = {f: v for f, v in (("email", email), ("name", name)) if v is not None}
+    if score is not ...:
+        fields["score"] = score
+    if not fields:
+        return
     with get_conn() as conn:
         c = conn.cursor()
         c.execute(
-            """
-            UPDATE students SET
-                email=COALESCE(?, email),
-                name=COALESCE(?, name),
-                score=COALESCE(?, score)
-            WHERE msv=?
-            """,
-            (email, name, score, msv),
+            f"UPDATE students SET {', '.join(f'{f}=?' for f in fields)} WHERE msv=?",
+            (*fields.values(), msv),
         )
+    _touch_students(msv)
 
 def delete_student(msv: str):
     with get_conn() as conn:
         c = conn.cursor()
         c.execute("DELETE FROM responses WHERE msv=?", (msv,))
         c.execute("DELETE FROM students WHERE msv=?", (msv,))
+    _touch_students(msv)
 
 def export_responses_as_rows():
-    with get_conn() as conn:
+    with read_conn() as conn:
         c = conn.cursor()
         c.execute("""
         SELECT r.id, r.msv, s.name, s.email, s.score, q.id as question_id, q.text as question_text,
@@ -276,35 +1226,313 @@ def export_responses_as_rows():
         """)
         return [dict(r) for r in c.fetchall()]
 
+EXPORT_COLUMNS = ["id", "msv", "name", "email", "score", "question_id", "question_text",
+                  "qtype", "value_int", "value_text", "created_at"]
+
+def iter_export_rows(chunk_size: int = 5000):
+    """Như export_responses_as_rows() nhưng trả về từng chunk tuple theo EXPORT_COLUMNS."""
+    with read_conn() as conn:
+        c = conn.cursor()
+        c.execute("""
+        SELECT r.id, r.msv, s.name, s.email, s.score, q.id as question_id, q.text as question_text,
+               q.qtype, r.value_int, r.value_text, r.created_at
+        FROM responses r
+        JOIN questions q ON q.id = r.question_id
+        JOIN students s ON s.msv = r.msv
+        ORDER BY r.id ASC
+        """)
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [tuple(r) for r in rows]
+
+def iter_student_answers(chunk_size: int = 5000):
+    """Chunk tuple (msv, name, email, score, question_id, value_int, value_text) sắp theo msv.
+
+    Thứ tự (msv, question_id) trùng với index idx_responses_msv_question nên SQLite không phải sort.
+    """
+    with read_conn() as conn:
+        c = conn.cursor()
+        c.execute("""
+        SELECT r.msv, s.name, s.email, s.score, r.question_id, r.value_int, r.value_text
+        FROM responses r
+        JOIN students s ON s.msv = r.msv
+        ORDER BY r.msv, r.question_id
+        """)
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [tuple(r) for r in rows]
+
 def reset_responses_and_completion():
     with get_conn() as conn:
         c = conn.cursor()
         c.execute("DELETE FROM responses")
         c.execute("UPDATE students SET completed=0, completed_at=NULL")
+    _touch_students()
+
+def _student_responses(c, msv: str) -> list[dict]:
+    c.execute(
+        """
+        SELECT q.id as question_id,
+               q.group_name, q.order_no, q.text, q.qtype,
+               q.low_label, q.mid_label, q.high_label,
+               r.value_int, r.value_text, r.created_at
+        FROM questions q
+        LEFT JOIN responses r
+          ON r.question_id = q.id AND r.msv = ?
+        ORDER BY q.order_no ASC
+        """,
+        (msv,),
+    )
+    return [dict(r) for r in c.fetchall()]
 
 def get_student_responses(msv: str):
     """Return list of questions with the student's answers (if any), ordered by order_no."""
+    with get_conn() as conn:
+        return _student_responses(conn.cursor(), msv)
+
+# ---------- Answer tallies ----------
+# Bộ đếm được trigger cập nhật cùng transaction với responses/students, nên Dashboard
+# chỉ đọc O(số câu hỏi) dòng thay vì quét toàn bộ responses.
+TALLY_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_responses_tally_insert AFTER INSERT ON responses
+    BEGIN
+        INSERT INTO answer_tallies (question_id, value_int, n)
+        SELECT NEW.question_id, NEW.value_int, 1 WHERE NEW.value_int IS NOT NULL
+        ON CONFLICT(question_id, value_int) DO UPDATE SET n = n + 1;
+        INSERT INTO question_stats (question_id, answers, version) VALUES (NEW.question_id, 1, 1)
+        ON CONFLICT(question_id) DO UPDATE SET answers = answers + 1, version = version + 1;
+        UPDATE survey_counters SET n = n + 1
+        WHERE name = 'started' AND (SELECT COUNT(*) FROM responses WHERE msv = NEW.msv) = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_responses_tally_update
+    AFTER UPDATE OF question_id, value_int, value_text ON responses
+    BEGIN
+        UPDATE answer_tallies SET n = n - 1
+        WHERE question_id = OLD.question_id AND value_int = OLD.value_int;
+        INSERT INTO answer_tallies (question_id, value_int, n)
+        SELECT NEW.question_id, NEW.value_int, 1 WHERE NEW.value_int IS NOT NULL
+        ON CONFLICT(question_id, value_int) DO UPDATE SET n = n + 1;
+        UPDATE question_stats SET answers = answers - 1, version = version + 1
+        WHERE question_id = OLD.question_id;
+        INSERT INTO question_stats (question_id, answers, version) VALUES (NEW.question_id, 1, 1)
+        ON CONFLICT(question_id) DO UPDATE SET answers = answers + 1, version = version + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_responses_tally_delete AFTER DELETE ON responses
+    BEGIN
+        UPDATE answer_tallies SET n = n - 1
+        WHERE question_id = OLD.question_id AND value_int = OLD.value_int;
+        UPDATE question_stats SET answers = answers - 1, version = version + 1
+        WHERE question_id = OLD.question_id;
+        UPDATE survey_counters SET n = n - 1
+        WHERE name = 'started' AND NOT EXISTS (SELECT 1 FROM responses WHERE msv = OLD.msv);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_students_completed_insert AFTER INSERT ON students
+    WHEN NEW.completed = 1
+    BEGIN
+        UPDATE survey_counters SET n = n + 1 WHERE name = 'completed';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_students_completed_update AFTER UPDATE OF completed ON students
+    WHEN COALESCE(OLD.completed, 0) != COALESCE(NEW.completed, 0)
+    BEGIN
+        UPDATE survey_counters SET n = n + (CASE WHEN NEW.completed = 1 THEN 1 ELSE -1 END)
+        WHERE name = 'completed';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_students_completed_delete AFTER DELETE ON students
+    WHEN OLD.completed = 1
+    BEGIN
+        UPDATE survey_counters SET n = n - 1 WHERE name = 'completed';
+    END
+    """,
+]
+
+# Giá trị đúng của từng bộ đếm, tính lại từ bảng gốc (dùng cho rebuild/verify)
+_TALLY_SOURCES = {
+    "answer_tallies": """
+        SELECT question_id, value_int, COUNT(*) AS n FROM responses
+        WHERE value_int IS NOT NULL GROUP BY question_id, value_int
+    """,
+    "question_stats": """
+        SELECT question_id, COUNT(*) AS answers FROM responses GROUP BY question_id
+    """,
+    "survey_counters": """
+        SELECT 'started' AS name, COUNT(DISTINCT msv) AS n FROM responses
+        UNION ALL
+        SELECT 'completed', COUNT(*) FROM students WHERE completed = 1
+    """,
+}
+
+def _rebuild_tallies(c):
+    c.execute("DELETE FROM answer_tallies")
+    c.execute(f"INSERT INTO answer_tallies (question_id, value_int, n) {_TALLY_SOURCES['answer_tallies']}")
+    # Giữ version cũ (nếu có) và tăng lên để mọi cache phía trên bị vô hiệu
+    c.execute("UPDATE question_stats SET answers = 0, version = version + 1")
+    c.execute(f"""
+    INSERT INTO question_stats (question_id, answers, version)
+    SELECT question_id, answers, 1 FROM ({_TALLY_SOURCES['question_stats']}) WHERE true
+    ON CONFLICT(question_id) DO UPDATE SET answers = excluded.answers
+    """)
+    c.execute("DELETE FROM survey_counters")
+    c.execute(f"INSERT INTO survey_counters (name, n) {_TALLY_SOURCES['survey_counters']}")
+
+def rebuild_tallies() -> None:
+    """Tính lại toàn bộ bộ đếm từ responses/students (sau khi sửa dữ liệu thủ công)."""
     with get_conn() as conn:
         c = conn.cursor()
-        c.execute(
-            """
-            SELECT q.id as question_id,
-                   q.group_name, q.order_no, q.text, q.qtype,
-                   q.low_label, q.mid_label, q.high_label,
-                   r.value_int, r.value_text, r.created_at
-            FROM questions q
-            LEFT JOIN responses r
-              ON r.question_id = q.id AND r.msv = ?
-            ORDER BY q.order_no ASC
-            """,
-            (msv,),
-        )
-        return [dict(r) for r in c.fetchall()]
+        c.execute("BEGIN IMMEDIATE")
+        _rebuild_tallies(c)
+
+def verify_tallies() -> list[str]:
+    """So sánh bộ đếm với dữ liệu gốc; trả về danh sách sai lệch (rỗng = khớp)."""
+    checks = {
+        "answer_tallies": "SELECT question_id, value_int, n FROM answer_tallies WHERE n != 0",
+        "question_stats": "SELECT question_id, answers FROM question_stats WHERE answers != 0",
+        "survey_counters": "SELECT name, n FROM survey_counters",
+    }
+    problems = []
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN")  # đọc nhất quán giữa bộ đếm và bảng gốc
+        for table, actual_sql in checks.items():
+            c.execute(_TALLY_SOURCES[table])
+            expected = {tuple(r)[:-1]: tuple(r)[-1] for r in c.fetchall() if tuple(r)[-1]}
+            c.execute(actual_sql)
+            actual = {tuple(r)[:-1]: tuple(r)[-1] for r in c.fetchall() if tuple(r)[-1]}
+            for key in sorted(set(expected) | set(actual), key=str):
+                if expected.get(key, 0) != actual.get(key, 0):
+                    problems.append(f"{table} {key}: {actual.get(key, 0)} != {expected.get(key, 0)}")
+    return problems
+
+def get_tallies() -> dict:
+    """Số liệu tổng hợp cho Dashboard: started/completed và số đếm theo từng câu hỏi.
+
+    {"started": int, "completed": int,
+     "questions": {question_id: {"answers": int, "version": int, "counts": {value_int: n}}}}
+    """
+    with read_conn() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN")
+        c.execute("SELECT name, n FROM survey_counters")
+        counters = {r["name"]: r["n"] for r in c.fetchall()}
+        c.execute("SELECT question_id, answers, version FROM question_stats")
+        questions = {r["question_id"]: {"answers": r["answers"], "version": r["version"], "counts": {}}
+                     for r in c.fetchall()}
+        c.execute("SELECT question_id, value_int, n FROM answer_tallies WHERE n > 0")
+        for r in c.fetchall():
+            questions.setdefault(r["question_id"], {"answers": 0, "version": 0, "counts": {}})
+            questions[r["question_id"]]["counts"][r["value_int"]] = r["n"]
+        return {
+            "started": counters.get("started", 0),
+            "completed": counters.get("completed", 0),
+            "questions": questions,
+        }
+
+# ---------- Danh sách khóa & tổng hợp nhiều khóa ----------
+def list_cohorts() -> list[dict]:
+    """Khóa mặc định + các khóa trong registry (bảng cohorts của DB chính)."""
+    with using_cohort(DEFAULT_COHORT):
+        init_db()
+        with get_conn() as conn:
+            rows = conn.execute("SELECT code, name, created_at FROM cohorts ORDER BY created_at, code").fetchall()
+    return [{"code": DEFAULT_COHORT, "name": "Mặc định", "created_at": None}] + [dict(r) for r in rows]
+
+
+def create_cohort(code: str, name: str) -> dict:
+    """Đăng ký khóa mới và tạo file shard (migrate + bộ câu hỏi mặc định)."""
+    code = (code or "").strip()
+    if not _COHORT_CODE.match(code) or code == DEFAULT_COHORT:
+        raise ValueError("Mã khóa chỉ gồm chữ, số, '-' và '_' (tối đa 40 ký tự).")
+    with using_cohort(DEFAULT_COHORT):
+        init_db()
+        with get_conn() as conn:
+            try:
+                conn.execute(
+                    "INSERT INTO cohorts (code, name, created_at) VALUES (?, ?, ?)",
+                    (code, (name or code).strip(), datetime.utcnow().isoformat()),
+                )
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Khóa {code} đã tồn tại.") from None
+    cohort_path(code).parent.mkdir(parents=True, exist_ok=True)
+    with using_cohort(code):
+        init_db()
+    return {"code": code, "name": (name or code).strip()}
+
+
+def aggregate_tallies(codes: list[str] | None = None, max_workers: int = 4) -> dict:
+    """Cộng bộ đếm của nhiều khóa (mặc định tất cả), mỗi shard đọc song song ở một luồng.
+
+    Câu hỏi được ghép theo (nhóm, nội dung, kiểu) vì id khác nhau giữa các shard.
+    {"started", "completed", "cohorts": {code: {"started", "completed"}},
+     "questions": [{"group_name", "order_no", "text", "qtype", "low_label", ..., "answers", "counts"}]}
+    """
+    codes = codes or [c["code"] for c in list_cohorts()]
+
+    def load(code):
+        with using_cohort(code):
+            init_db()
+            return code, get_tallies(), list_questions()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(codes))), thread_name_prefix="cohort") as ex:
+        shards = list(ex.map(load, codes))
+
+    result = {"started": 0, "completed": 0, "cohorts": {}, "questions": []}
+    merged: dict[tuple, dict] = {}
+    for code, tallies, qs in shards:
+        result["started"] += tallies["started"]
+        result["completed"] += tallies["completed"]
+        result["cohorts"][code] = {"started": tallies["started"], "completed": tallies["completed"]}
+        for q in qs:
+            key = (q["group_name"], q["text"], q["qtype"])
+            item = merged.get(key)
+            if item is None:
+                item = merged[key] = {**{k: q[k] for k in ("group_name", "order_no", "text", "qtype",
+                                                         "low_label", "mid_label", "high_label")},
+                                      "answers": 0, "counts": {}}
+                result["questions"].append(item)
+            stats = tallies["questions"].get(q["id"], {})
+            item["answers"] += stats.get("answers", 0)
+            for value, n in stats.get("counts", {}).items():
+                item["counts"][value] = item["counts"].get(value, 0) + n
+    result["questions"].sort(key=lambda q: (q["order_no"] or 0))
+    return result
 
 # ---------- OTP helpers ----------
+# Số lần nhập sai tối đa cho một mã; quá số này mã bị vô hiệu
+OTP_MAX_ATTEMPTS = 5
+# Chu kỳ (giây) dọn các mã đã hết hạn, chạy kèm create_otp
+OTP_PURGE_INTERVAL = 600
+
+_last_otp_purge: dict[str, float] = {}
+
 def _hash_code(code: str) -> str:
     return hashlib.sha256(code.encode("utf-8")).hexdigest()
 
+def purge_expired_otps() -> int:
+    """Xóa các mã OTP đã hết hạn; trả về số dòng đã xóa."""
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM otps WHERE expires_at < ?", (datetime.utcnow().isoformat(),))
+        _last_otp_purge[_db_key()] = time.monotonic()
+        return c.rowcount
+
+def _maybe_purge_otps() -> None:
+    if time.monotonic() - _last_otp_purge.get(_db_key(), 0.0) >= OTP_PURGE_INTERVAL:
+        purge_expired_otps()
+
 def can_request_otp(msv: str, cooldown_sec: int = 60) -> bool:
     with get_conn() as conn:
         c = conn.cursor()
@@ -316,6 +1544,7 @@ def can_request_otp(msv: str, cooldown_sec: int = 60) -> bool:
         return (datetime.utcnow() - last).total_seconds() >= cooldown_sec
 
 def create_otp(msv: str, code: str, ttl_minutes: int = 10):
+    _maybe_purge_otps()
     with get_conn() as conn:
         c = conn.cursor()
         code_hash = _hash_code(code)
@@ -329,7 +1558,7 @@ def verify_otp(msv: str, code: str) -> bool:
     with get_conn() as conn:
         c = conn.cursor()
         c.execute("""
-        SELECT id, code_hash, expires_at, used FROM otps 
+        SELECT id, code_hash, expires_at, used, attempts FROM otps 
         WHERE msv=? ORDER BY id DESC LIMIT 1
         """, (msv,))
         row = c.fetchone()
@@ -337,9 +1566,321 @@ def verify_otp(msv: str, code: str) -> bool:
             return False
         if row["used"] == 1:
             return False
+        if (row["attempts"] or 0) >= OTP_MAX_ATTEMPTS:
+            return False
         if datetime.utcnow() > datetime.fromisoformat(row["expires_at"]):
             return False
         if _hash_code(code) != row["code_hash"]:
+            c.execute("UPDATE otps SET attempts=COALESCE(attempts, 0)+1 WHERE id=?", (row["id"],))
             return False
-        c.execute("UPDATE otps SET used=1 WHERE id=?", (row["id"],))
-        return True
+        # used=0 trong WHERE: hai request đồng thời không thể cùng dùng một mã
+        c.execute("UPDATE otps SET used=1 WHERE id=? AND used=0", (row["id"],))
+        return c.rowcount == 1
+
+# ---------- Email outbox ----------
+# Thư "sending" quá lâu (process gửi bị tắt giữa chừng) được nhận lại sau ngần này giây
+OUTBOX_CLAIM_TIMEOUT = 300
+
+def enqueue_email(to_email: str, subject: str, body: str) -> int:
+    now = datetime.utcnow().isoformat()
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("""
+        INSERT INTO outbox (to_email, subject, body, status, next_attempt_at, created_at)
+        VALUES (?, ?, ?, 'pending', ?, ?)
+        """, (to_email, subject, body, now, now))
+        return c.lastrowid
+
+def claim_outbox(limit: int = 20) -> list[dict]:
+    """Nhận tối đa `limit` thư đến hạn gửi, đánh dấu 'sending' để worker khác không lấy trùng."""
+    now = datetime.utcnow()
+    stale = (now - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)).isoformat()
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+        SELECT * FROM outbox WHERE status='pending' AND next_attempt_at <= ?
+        UNION ALL
+        SELECT * FROM outbox WHERE status='sending' AND next_attempt_at <= ? AND claimed_at < ?
+        ORDER BY id LIMIT ?
+        """, (now.isoformat(), now.isoformat(), stale, limit))
+        rows = [dict(r) for r in c.fetchall()]
+        c.executemany(
+            "UPDATE outbox SET status='sending', claimed_at=? WHERE id=?",
+            [(now.isoformat(), r["id"]) for r in rows],
+        )
+        return rows
+
+def mark_outbox_sent(outbox_id: int) -> None:
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE outbox SET status='sent', attempts=attempts+1, sent_at=?, last_error=NULL WHERE id=?",
+            (datetime.utcnow().isoformat(), outbox_id),
+        )
+
+def mark_outbox_failed(outbox_id: int, error: str, retry_in: float | None) -> None:
+    """Ghi lỗi gửi; retry_in=None nghĩa là bỏ hẳn (status 'failed')."""
+    with get_conn() as conn:
+        if retry_in is None:
+            conn.execute(
+                "UPDATE outbox SET status='failed', attempts=attempts+1, last_error=? WHERE id=?",
+                (error, outbox_id),
+            )
+        else:
+            next_at = (datetime.utcnow() + timedelta(seconds=retry_in)).isoformat()
+            conn.execute(
+                "UPDATE outbox SET status='pending', attempts=attempts+1, last_error=?, next_attempt_at=? WHERE id=?",
+                (error, next_at, outbox_id),
+            )
+
+def get_outbox_message(outbox_id: int) -> dict | None:
+    with get_conn() as conn:
+        row = conn.execute("SELECT * FROM outbox WHERE id=?", (outbox_id,)).fetchone()
+        return dict(row) if row else None
+
+def outbox_stats() -> dict[str, int]:
+    with get_conn() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+
+# ---------- Broadcast (email nhắc nhở hàng loạt) ----------
+def _broadcast_filter(only_incomplete: bool, msv_prefix: str | None):
+    where = ["COALESCE(email, '') != ''"]
+    params = []
+    if only_incomplete:
+        where.append("completed = 0")
+    if msv_prefix:
+        where.append("msv >= ? AND msv < ?")
+        params += [msv_prefix, msv_prefix + _PREFIX_END]
+    return " AND ".join(where), params
+
+def count_broadcast_candidates(only_incomplete: bool = True, msv_prefix: str | None = None) -> int:
+    where, params = _broadcast_filter(only_incomplete, msv_prefix)
+    with get_conn() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM students WHERE {where}", params).fetchone()[0]
+
+def create_broadcast(subject: str, body_template: str, rate_per_min: int = 60,
+                     only_incomplete: bool = True, msv_prefix: str | None = None) -> int:
+    """Tạo đợt gửi và chốt danh sách người nhận (mặc định: sinh viên chưa hoàn thành)."""
+    where, params = _broadcast_filter(only_incomplete, msv_prefix)
+    description = ("Chưa hoàn thành" if only_incomplete else "Tất cả") + (f", MSV {msv_prefix}*" if msv_prefix else "")
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+        INSERT INTO broadcasts (subject, body_template, rate_per_min, status, description, created_at)
+        VALUES (?, ?, ?, 'running', ?, ?)
+        """, (subject, body_template, rate_per_min, description, datetime.utcnow().isoformat()))
+        bid = c.lastrowid
+        c.execute(f"""
+        INSERT INTO broadcast_recipients (broadcast_id, msv, email)
+        SELECT ?, msv, email FROM students WHERE {where}
+        """, [bid] + params)
+        return bid
+
+def list_broadcasts(status: str | None = None) -> list[dict]:
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT * FROM broadcasts WHERE ? IS NULL OR status = ? ORDER BY id DESC",
+            (status, status),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+def set_broadcast_status(broadcast_id: int, status: str) -> None:
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE broadcasts SET status=?, finished_at=CASE WHEN ?='done' THEN ? END WHERE id=?",
+            (status, status, datetime.utcnow().isoformat(), broadcast_id),
+        )
+
+def release_broadcast_batch(broadcast_id: int, limit: int, render, burst_seconds: float = 5.0) -> int:
+    """Đưa người nhận đang chờ vào outbox (render(student_dict) -> body), không vượt rate_per_min.
+
+    Hạn mức là token bucket lưu trong dòng broadcasts (dồn tối đa burst_seconds giây thư), đọc và trừ
+    trong cùng transaction BEGIN IMMEDIATE nên nhiều process cùng chạy vẫn chỉ gửi rate_per_min thư/phút.
+    Mỗi lần gọi đưa tối đa `limit` thư. Trả về số thư đã đưa vào outbox; khi không còn ai chờ thì
+    đánh dấu đợt gửi 'done'.
+    """
+    now = datetime.utcnow().isoformat()
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("SELECT subject, status, rate_per_min, tokens, tokens_at FROM broadcasts WHERE id=?", (broadcast_id,))
+        b = c.fetchone()
+        if not b or b["status"] != "running":
+            return 0
+        clock = time.time()
+        capacity = max(1.0, b["rate_per_min"] * burst_seconds / 60)
+        tokens = capacity if b["tokens_at"] is None else min(
+            capacity, b["tokens"] + max(0.0, clock - b["tokens_at"]) * b["rate_per_min"] / 60)
+        limit = min(limit, int(tokens))
+        c.execute("""
+        SELECT r.msv, r.email, s.name, s.score
+        FROM broadcast_recipients r
+        LEFT JOIN students s ON s.msv = r.msv
+        WHERE r.broadcast_id = ? AND r.status = 'pending'
+        ORDER BY r.msv LIMIT ?
+        """, (broadcast_id, limit))
+        recipients = [dict(r) for r in c.fetchall()]
+        for r in recipients:
+            c.execute("""
+            INSERT INTO outbox (to_email, subject, body, status, next_attempt_at, created_at)
+            VALUES (?, ?, ?, 'pending', ?, ?)
+            """, (r["email"], b["subject"], render(r), now, now))
+            c.execute(
+                "UPDATE broadcast_recipients SET status='queued', outbox_id=? WHERE broadcast_id=? AND msv=?",
+                (c.lastrowid, broadcast_id, r["msv"]),
+            )
+        c.execute("UPDATE broadcasts SET tokens=?, tokens_at=? WHERE id=?",
+                  (tokens - len(recipients), clock, broadcast_id))
+        if len(recipients) < max(limit, 1):
+            c.execute("""
+            SELECT 1 FROM broadcast_recipients WHERE broadcast_id=? AND status='pending' LIMIT 1
+            """, (broadcast_id,))
+            if c.fetchone() is None:
+                c.execute("UPDATE broadcasts SET status='done', finished_at=? WHERE id=?", (now, broadcast_id))
+        return len(recipients)
+
+# Trạng thái của một người nhận: waiting (chưa vào outbox), queued (đang chờ/đang gửi), sent, failed
+_RECIPIENT_STATUS = """
+    CASE WHEN o.id IS NULL THEN 'waiting'
+         WHEN o.status IN ('pending', 'sending') THEN 'queued'
+         ELSE o.status END
+"""
+
+def broadcast_progress(broadcast_id: int) -> dict[str, int]:
+    """Số người nhận theo trạng thái waiting/queued/sent/failed."""
+    with get_conn() as conn:
+        rows = conn.execute(f"""
+        SELECT {_RECIPIENT_STATUS} AS status, COUNT(*) AS n
+        FROM broadcast_recipients r
+        LEFT JOIN outbox o ON o.id = r.outbox_id
+        WHERE r.broadcast_id = ?
+        GROUP BY 1
+        """, (broadcast_id,)).fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+def list_broadcast_recipients(broadcast_id: int, limit: int = 200) -> list[dict]:
+    with get_conn() as conn:
+        rows = conn.execute(f"""
+        SELECT r.msv, r.email, {_RECIPIENT_STATUS} AS status,
+               o.attempts, o.last_error, o.sent_at
+        FROM broadcast_recipients r
+        LEFT JOIN outbox o ON o.id = r.outbox_id
+        WHERE r.broadcast_id = ?
+        ORDER BY r.msv LIMIT ?
+        """, (broadcast_id, limit)).fetchall()
+        return [dict(r) for r in rows]
+
+
+# ---------- Tranh chấp khóa ----------
+_lock_lock = threading.Lock()
+_lock_counts: dict[str, dict] = {}
+_retry_local = threading.local()
+
+def _is_lock_error(e: Exception) -> bool:
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in str(e) or "busy" in str(e))
+
+def _count_lock(name: str, field: str, seconds: float = 0.0) -> None:
+    with _lock_lock:
+        counts = _lock_counts.setdefault(name, {"retries": 0, "recovered": 0, "failures": 0, "wait_s": 0.0})
+        counts[field] += 1
+        counts["wait_s"] += seconds
+
+def _retry_on_lock(fn):
+    """Gọi lại fn khi gặp lỗi khóa (transaction đã rollback nên chạy lại cả hàm là an toàn).
+
+    Chỉ lời gọi ngoài cùng thử lại; lời gọi lồng nhau để lỗi đi lên cho lời gọi ngoài.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if getattr(_retry_local, "active", False):
+            return fn(*args, **kwargs)
+        _retry_local.active = True
+        try:
+            attempt = 0
+            while True:
+                try:
+                    result = fn(*args, **kwargs)
+                    if attempt:
+                        _count_lock(name, "recovered")
+                    return result
+                except sqlite3.OperationalError as e:
+                    if not _is_lock_error(e):
+                        raise
+                    if attempt >= LOCK_RETRIES:
+                        _count_lock(name, "failures")
+                        raise
+                    # Full jitter: các luồng cùng bị từ chối không thử lại cùng lúc
+                    delay = random.uniform(0, min(LOCK_BACKOFF_MAX, LOCK_BACKOFF * 2 ** attempt))
+                    _count_lock(name, "retries", delay)
+                    utils_perf.record("lock", name, delay)
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            _retry_local.active = False
+    return wrapper
+
+def lock_stats() -> dict:
+    """Số lần gặp lỗi khóa từ lúc khởi động process: tổng và theo hàm.
+
+    retries = số lần thử lại, recovered = lời gọi thành công sau khi thử lại,
+    failures = lời gọi vẫn lỗi sau LOCK_RETRIES lần, wait_s = tổng thời gian chờ backoff.
+    """
+    with _lock_lock:
+        by_function = {name: dict(c) for name, c in _lock_counts.items()}
+    total = {"retries": 0, "recovered": 0, "failures": 0, "wait_s": 0.0}
+    for counts in by_function.values():
+        for field in total:
+            total[field] += counts[field]
+    return {**total, "write_begin": WRITE_BEGIN, "busy_timeout_ms": PRAGMA_PROFILE.get("busy_timeout"),
+            "lock_retries": LOCK_RETRIES, "by_function": by_function}
+
+def reset_lock_stats() -> None:
+    with _lock_lock:
+        _lock_counts.clear()
+
+# ---------- Đo thời gian (utils_perf) ----------
+def _explain(sql: str) -> list[str]:
+    with get_conn() as conn:
+        return [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+# Hàm cấu hình/kết nối không bọc: thời gian lấy kết nối đã được ghi riêng ("conn")
+_NOT_INSTRUMENTED = {
+    "configure", "close_pools", "get_conn", "read_conn", "migrate", "schema_version",
+    "snapshot_path", "snapshot_age", "snapshot_info",
+    "cohort_path", "using_cohort", "use_cohort", "current_cohort",
+    "student_version", "lock_stats", "reset_lock_stats",
+}
+
+# Không tự gọi lại khi lỗi khóa: nhiều transaction nối tiếp (chạy lại sẽ lặp phần đã commit)
+# hoặc tham số là iterator chỉ duyệt được một lần
+_NO_RETRY = {"create_cohort", "bulk_upsert_students", "take_snapshot"}
+
+for _name, _fn in list(globals().items()):
+    if (inspect.isfunction(_fn) and _fn.__module__ == __name__ and not _name.startswith("_")
+            and _name not in _NOT_INSTRUMENTED):
+        if not inspect.isgeneratorfunction(_fn) and _name not in _NO_RETRY:
+            _fn = _retry_on_lock(_fn)
+        globals()[_name] = utils_perf.instrument(_fn, _explain)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python db.py verify-tallies | rebuild-tallies
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    init_db()
+    if command == "rebuild-tallies":
+        rebuild_tallies()
+        print("Đã tính lại bộ đếm.")
+    elif command == "verify-tallies":
+        problems = verify_tallies()
+        print("\n".join(problems) if problems else "Bộ đếm khớp với dữ liệu gốc.")
+        sys.exit(1 if problems else 0)
+    else:
+        print("Cách dùng: python db.py verify-tallies | rebuild-tallies")
+        sys.exit(2)
@@ -0,0 +1,105 @@
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+import utils_perf
+
+# PRAGMA áp dụng được cho kết nối chỉ đọc (file snapshot)
+_READONLY_PRAGMAS = ("cache_size", "mmap_size", "temp_store", "busy_timeout")
+
+
+class Backend(ABC):
+    """Giao diện lưu trữ mà db.py dùng: engine SQLAlchemy giữ pool kết nối DB-API.
+
+    db.py chỉ gọi acquire()/release()/close(); kết nối trả về là proxy của pool
+    (conn.execute, conn.cursor, conn.commit... chuyển thẳng xuống driver).
+    """
+
+    dialect = None
+
+    def __init__(self, url: str, pool_size: int = 8, pragmas: dict | None = None, readonly: bool = False,
+                 write_begin: str = "DEFERRED"):
+        self.url = make_url(url)
+        self.readonly = readonly
+        self.pragmas = dict(pragmas or {})
+        # Kiểu transaction ngầm mở trước câu lệnh ghi đầu tiên (DEFERRED/IMMEDIATE)
+        self.write_begin = write_begin
+        self.engine = create_engine(self.url, creator=self._timed_connect, **self._pool_args(pool_size))
+
+    def _pool_args(self, pool_size: int) -> dict:
+        if pool_size <= 0:
+            # Không giữ kết nối: mỗi lần acquire mở kết nối mới (để so sánh trong benchmark)
+            return {"poolclass": NullPool}
+        # Không giới hạn số kết nối đang mượn; chỉ giữ lại tối đa pool_size kết nối nhàn rỗi.
+        # LIFO: kết nối vừa trả (cache trang còn nóng) được dùng lại trước.
+        return {"poolclass": QueuePool, "pool_size": pool_size, "max_overflow": -1, "pool_use_lifo": True}
+
+    def _timed_connect(self):
+        with utils_perf.timer("conn", "open"):
+            return self.connect()
+
+    @abstractmethod
+    def connect(self):
+        """Mở một kết nối DB-API mới (pool gọi khi cần thêm kết nối)."""
+
+    def acquire(self):
+        return self.engine.raw_connection()
+
+    def release(self, conn) -> None:
+        # Pool rollback transaction còn dở khi nhận lại kết nối
+        conn.close()
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+
+class SQLiteBackend(Backend):
+    """SQLite một file, WAL + PRAGMA theo PRAGMA_PROFILE của db.py."""
+
+    dialect = "sqlite"
+
+    def __init__(self, url: str, pool_size: int = 8, pragmas: dict | None = None, readonly: bool = False,
+                 write_begin: str = "DEFERRED"):
+        super().__init__(url, pool_size, pragmas, readonly, write_begin)
+        self.path = Path(self.url.database)
+        if readonly:
+            self.pragmas = {k: v for k, v in self.pragmas.items() if k in _READONLY_PRAGMAS}
+
+    def connect(self) -> sqlite3.Connection:
+        if self.readonly:
+            conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            # IMMEDIATE: giữ khóa ghi ngay khi bắt đầu transaction, không bị SQLITE_BUSY lúc nâng read -> write
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=self.write_begin)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+
+# Tên dialect SQLAlchemy -> lớp backend. SQL trong db.py viết theo cú pháp SQLite
+# (INSERT OR IGNORE, PRAGMA, trigger, Connection.backup), nên DB server cần backend riêng
+# kèm phần chuyển đổi các câu lệnh đó trước khi đăng ký ở đây.
+BACKENDS: dict[str, type[Backend]] = {"sqlite": SQLiteBackend}
+
+
+def sqlite_url(path) -> str:
+    return f"sqlite:///{Path(path)}"
+
+
+def backend_class(url: str) -> type[Backend]:
+    name = make_url(url).get_backend_name()
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Chưa hỗ trợ backend '{name}' (có: {', '.join(sorted(BACKENDS))}).") from None
+
+
+def make_backend(url: str, pool_size: int = 8, pragmas: dict | None = None, readonly: bool = False,
+                 write_begin: str = "DEFERRED") -> Backend:
+    return backend_class(url)(url, pool_size=pool_size, pragmas=pragmas, readonly=readonly, write_begin=write_begin)
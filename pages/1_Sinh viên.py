@@ -1,9 +1,16 @@
 import streamlit as st
-from db import init_db, get_student, list_questions, save_responses, mark_completed, create_otp, verify_otp, can_request_otp, get_student_responses
+from utils_perf import page_start, page_end, stop_page
+from db import init_db, check_student_login, list_questions, submit_survey, create_otp, verify_otp, can_request_otp
 from utils_mail import send_email_code
+from utils_ratelimit import allow_otp_request, allow_otp_verify, release_otp_request
+from utils_cohort import select_cohort
+from utils_student import load_student
+from utils_snapshot import apply_db_conf
 import random
 
 st.set_page_config(page_title="Sinh viên - Khảo sát", page_icon="👩‍🎓", layout="wide")
+page_start("Sinh viên")
+apply_db_conf()
 
 st.markdown("""
 <style>
@@ -15,8 +22,13 @@ div[data-baseweb="slider"] > div > div[role="slider"] {
 
 st.title("👩‍🎓 Sinh viên")
 
+select_cohort()
 init_db()
 
+# IP của client (None khi chạy local/bản Streamlit cũ), dùng cho giới hạn tần suất OTP
+# st.context chỉ có từ Streamlit 1.37 (requirements cho phép >=1.34)
+client_ip = getattr(getattr(st, "context", None), "ip_address", None)
+
 # ---------- Step 1: Request OTP ----------
 with st.form("login_form"):
     st.subheader("Đăng nhập khảo sát (OTP qua email)")
@@ -27,10 +39,16 @@ with st.form("login_form"):
 if req:
     st.session_state["auth_msv"] = None
     st.session_state["otp_ready_for"] = None
-    stu = get_student(msv)
-    if not stu:
+    # Kiểm tra giới hạn trong bộ nhớ trước, yêu cầu bị từ chối không chạm tới DB
+    wait = allow_otp_request(msv, client_ip)
+    stu = check_student_login(msv, email) if not wait else None
+    if wait:
+        st.warning(f"Bạn đã yêu cầu quá nhiều lần. Vui lòng đợi ~{int(wait) + 1} giây rồi thử lại.")
+    elif not stu:
+        release_otp_request(msv)
         st.error("❌ Không tìm thấy Mã sinh viên trong hệ thống.")
-    elif email.lower() != (stu["email"] or "").lower():
+    elif not stu["email_match"]:
+        release_otp_request(msv)
         st.error("❌ Email không khớp dữ liệu. Vui lòng kiểm tra lại.")
     else:
         if not can_request_otp(msv):
@@ -54,7 +72,10 @@ if otp_ready_for:
         verify_btn = st.form_submit_button("Xác thực")
 
     if verify_btn:
-        if verify_otp(otp_ready_for, otp.strip()):
+        wait = allow_otp_verify(otp_ready_for, client_ip)
+        if wait:
+            st.error(f"❌ Bạn đã thử quá nhiều lần. Vui lòng đợi ~{int(wait) + 1} giây.")
+        elif verify_otp(otp_ready_for, otp.strip()):
             st.session_state["auth_msv"] = otp_ready_for
             st.success("✅ Xác thực thành công.")
         else:
@@ -62,15 +83,16 @@ if otp_ready_for:
 
 auth_msv = st.session_state.get("auth_msv")
 if not auth_msv:
-    st.stop()
+    stop_page()
 
 # ---------- After auth: survey ----------
-stu = get_student(auth_msv)
+student = load_student(auth_msv)
+stu = student["student"]
 if stu and stu.get("completed"):
     st.success(f"🎉 Điểm thi vấn đáp của bạn: **{stu['score']}**")
     st.info("Bạn đã hoàn tất khảo sát. Dưới đây là câu trả lời của bạn (không thể chỉnh sửa).")
 
-    data = get_student_responses(auth_msv)
+    data = student["responses"]
     current_group = None
     for item in data:
         if item["group_name"] != current_group:
@@ -86,7 +108,7 @@ if stu and stu.get("completed"):
             txt = item["value_text"] or ""
             st.markdown(f"**{item['order_no']}. {item['text']}**")
             st.text_area("", value=txt, height=100, disabled=True, key=f"ro_{item['question_id']}")
-    st.stop()
+    stop_page()
 
 questions = list_questions()
 
@@ -138,16 +160,18 @@ if submit:
                 missing.append(q["order_no"])
     if missing:
         st.error(f"❌ Bạn chưa trả lời đầy đủ các câu: {', '.join(map(str, missing))}")
-        st.stop()
+        stop_page()
 
     payload = [
         {"question_id": qid, "value_int": v["value_int"], "value_text": v["value_text"]}
         for qid, v in answers.items()
     ]
-    save_responses(auth_msv, payload)
-    mark_completed(auth_msv)
-
-    stu2 = get_student(auth_msv)
+    stu2 = submit_survey(auth_msv, payload)
+    if not stu2:
+        st.error("❌ Không tìm thấy Mã sinh viên trong hệ thống.")
+        stop_page()
     st.success("✅ Đã ghi nhận phản hồi. Cảm ơn bạn!")
     st.balloons()
     st.info(f"🎉 Điểm thi vấn đáp của bạn: **{stu2['score']}**")
+
+page_end()
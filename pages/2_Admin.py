@@ -1,22 +1,45 @@
 import streamlit as st
+import utils_perf
+from utils_perf import page_start, page_end, stop_page
 import pandas as pd
-from io import BytesIO
+import io
+import tempfile
+import time
+from utils_export import write_responses_csv
+from utils_import import iter_roster_rows
+from utils_mail import get_email_conf, start_broadcasts
+from utils_snapshot import apply_db_conf, snapshot_caption
+from utils_cohort import select_cohort, refresh_cohorts
 from db import (
     init_db,
-    upsert_students,
+    bulk_upsert_students,
     list_questions,
-    update_question,
     create_question,
-    delete_question,
-    list_students,
+    apply_question_changes,
+    questions_version,
+    list_students_page,
+    STUDENT_SEARCH_FIELDS,
     update_student,
     delete_student,
-    export_responses_as_rows,
     reset_responses_and_completion,
     reset_questions_to_new_default,
+    rebuild_tallies,
+    verify_tallies,
+    count_broadcast_candidates,
+    create_broadcast,
+    list_broadcasts,
+    set_broadcast_status,
+    broadcast_progress,
+    list_broadcast_recipients,
+    take_snapshot,
+    create_cohort,
+    lock_stats,
+    reset_lock_stats,
 )
 
 st.set_page_config(page_title="Admin", page_icon="🛠️", layout="wide")
+page_start("Admin")
+apply_db_conf()
 
 init_db()
 
@@ -39,39 +62,82 @@ if do_login:
 
 if not st.session_state.get("admin_auth"):
     st.warning("Vui lòng đăng nhập để sử dụng chức năng quản trị.")
-    st.stop()
+    stop_page()
 
-tab1, tab2, tab3, tab4 = st.tabs(["📥 Import/Export", "📝 Câu hỏi & Thang đo", "👥 Sinh viên", "♻️ Reset dữ liệu"]) 
+# Mỗi khóa/lớp là một file DB riêng; mọi thao tác bên dưới áp dụng cho khóa đang chọn
+cohort = select_cohort()
+init_db()
+with st.sidebar.expander("➕ Thêm khóa / lớp"):
+    new_code = st.text_input("Mã khóa (vd. K65-2025)")
+    new_name = st.text_input("Tên hiển thị")
+    if st.button("Tạo khóa"):
+        try:
+            create_cohort(new_code, new_name)
+            refresh_cohorts()
+            # Chuyển sang khóa mới ở lần chạy sau (không sửa được key của selectbox đã vẽ)
+            st.session_state["cohort_pending"] = new_code.strip()
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
+
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📥 Import/Export", "📝 Câu hỏi & Thang đo", "👥 Sinh viên", "📣 Nhắc nhở", "♻️ Reset dữ liệu", "⏱️ Performance"]) 
 
 with tab1:
-    st.subheader("Import danh sách sinh viên + điểm thi vấn đáp (Excel)")
+    st.subheader("Import danh sách sinh viên + điểm thi vấn đáp (Excel/CSV)")
     st.caption("Cột yêu cầu: **Mã sinh viên**, **Email**, **Họ và tên**, **Điểm thi vấn đáp**")
-    file = st.file_uploader("Chọn file Excel", type=["xlsx"])
-    if file is not None:
-        df = pd.read_excel(file)
-        required_cols = ["Mã sinh viên", "Email", "Họ và tên", "Điểm thi vấn đáp"]
-        if not all(col in df.columns for col in required_cols):
-            st.error(f"Thiếu cột. Yêu cầu: {required_cols}")
-        else:
-            rows = []
-            for _, r in df.iterrows():
-                rows.append({
-                    "msv": str(r["Mã sinh viên"]).strip(),
-                    "email": str(r["Email"]).strip(),
-                    "name": str(r["Họ và tên"]).strip(),
-                    "score": float(r["Điểm thi vấn đáp"]),
-                })
-            upsert_students(rows)
-            st.success(f"Đã import {len(rows)} sinh viên.")
+    file = st.file_uploader("Chọn file Excel hoặc CSV", type=["xlsx", "csv"])
+    # file_uploader giữ file qua các lần rerun: chỉ import một lần cho mỗi file tải lên
+    if file is not None and st.session_state.get("imported_file_id") != (cohort, file.file_id):
+        try:
+            with st.spinner("Đang import..."):
+                stats = bulk_upsert_students(iter_roster_rows(file, file.name))
+            st.session_state["imported_file_id"] = (cohort, file.file_id)
+            st.session_state["import_stats"] = stats
+        except ValueError as e:
+            st.error(str(e))
+    if file is not None and st.session_state.get("imported_file_id") == (cohort, file.file_id):
+        stats = st.session_state["import_stats"]
+        st.success(
+            f"Đã import {stats['total']} sinh viên: {stats['inserted']} mới, "
+            f"{stats['updated']} cập nhật, {stats['unchanged']} không đổi "
+            f"({stats['seconds']:.2f}s, {stats['rows_per_sec']:.0f} dòng/giây)."
+        )
 
     st.divider()
     st.subheader("Export dữ liệu phản hồi (CSV)")
+    layout = st.radio(
+        "Định dạng",
+        options=["long", "wide"],
+        format_func=lambda x: "Mỗi câu trả lời một dòng" if x == "long" else "Mỗi sinh viên một dòng (cột theo câu hỏi)",
+        horizontal=True,
+    )
+    if caption := snapshot_caption():
+        c1, c2 = st.columns([4, 1])
+        c1.caption(caption)
+        if c2.button("📸 Cập nhật ngay"):
+            snap = take_snapshot()
+            st.success(f"Đã tạo bản sao: {snap['bytes'] / 1e6:.1f} MB trong {snap['seconds'] * 1000:.0f} ms.")
     if st.button("Tải xuống responses.csv"):
-        rows = export_responses_as_rows()
-        out_df = pd.DataFrame(rows)
-        buf = BytesIO()
-        out_df.to_csv(buf, index=False, encoding="utf-8-sig")
-        st.download_button("Download responses.csv", data=buf.getvalue(), file_name="responses.csv", mime="text/csv")
+        # Ghi CSV theo chunk ra file tạm thay vì dựng list dict + DataFrame + BytesIO trong bộ nhớ;
+        # download_button đọc thẳng từ file trên đĩa (FileIO), trang không giữ bản bytes nào
+        with tempfile.TemporaryFile() as raw:
+            f = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+            write_responses_csv(f, layout=layout)
+            f.flush()
+            f.detach()
+            file_name = "responses.csv" if layout == "long" else "responses_wide.csv"
+            st.download_button(f"Download {file_name}", data=raw.raw, file_name=file_name, mime="text/csv")
+
+def editor_cell(value):
+    """Giá trị ô của trình sửa sinh viên: ô trống/chỉ có khoảng trắng -> None, chuỗi được cắt khoảng trắng."""
+    if value is None or pd.isna(value):
+        return None
+    return (value.strip() or None) if isinstance(value, str) else value
+
+def reset_question_editor(cohort: str) -> None:
+    """Bỏ bản danh sách đã tải và các ô đang sửa: lần chạy sau trình sửa đọc lại từ DB."""
+    st.session_state.pop(f"questions_loaded_{cohort}", None)
+    st.session_state.pop(f"question_editor_{cohort}", None)
 
 with tab2:
     st.subheader("Danh sách câu hỏi & cấu hình thang đo")
@@ -98,61 +164,205 @@ with tab2:
         if st.button("Tạo câu hỏi"):
             try:
                 create_question(text=new_text, group_name=new_group, qtype=new_qtype, low=low, mid=mid, high=high, order_no=order_no)
+                reset_question_editor(cohort)
                 st.success("Đã tạo câu hỏi mới.")
             except Exception as e:
                 st.error(f"Lỗi: {e}")
 
     st.divider()
-    # Quản lý danh sách câu hỏi hiện có
-    qs = list_questions()
-    for q in qs:
-        with st.expander(f"[{q['order_no']}] {q['text']}  •  ({q['qtype']})", expanded=False):
-            new_group = st.text_input("Nhóm", value=q["group_name"], key=f"g_{q['id']}")
-            new_text = st.text_input("Sửa nội dung câu hỏi", value=q["text"], key=f"t_{q['id']}")
-            qtype_new = st.selectbox("Kiểu trả lời", options=["slider", "open"], index=0 if q["qtype"]=="slider" else 1, key=f"qt_{q['id']}")
-            if qtype_new == "slider":
-                c1, c2, c3 = st.columns(3)
-                with c1:
-                    low = st.text_input("Nhãn mức 1 (low)", value=q.get("low_label") or "", key=f"l_{q['id']}")
-                with c2:
-                    mid = st.text_input("Nhãn mức 2 (mid)", value=q.get("mid_label") or "", key=f"m_{q['id']}")
-                with c3:
-                    high = st.text_input("Nhãn mức 3 (high)", value=q.get("high_label") or "", key=f"h_{q['id']}")
-            else:
-                low = mid = high = None
-            c4, c5 = st.columns([1,1])
-            with c4:
-                if st.button("Lưu", key=f"s_{q['id']}"):
-                    update_question(q["id"], text=new_text, low=low, mid=mid, high=high, group_name=new_group, qtype=qtype_new)
-                    st.success("Đã cập nhật.")
-            with c5:
-                if st.button("Xóa", key=f"d_{q['id']}"):
-                    delete_question(q["id"])
-                    st.warning("Đã xóa câu hỏi.")
+    # Sửa toàn bộ danh sách dạng bảng: thêm dòng = câu hỏi mới, xóa dòng = xóa câu hỏi.
+    # Đặt trong form để sửa ô không chạy lại trang; khi lưu chỉ ghi các dòng thay đổi trong một transaction.
+    saved = st.session_state.pop("questions_saved", None)
+    if saved:
+        st.success(f"Đã lưu: {saved['inserted']} thêm, {saved['updated']} sửa, "
+                   f"{saved['renumbered']} đổi thứ tự, {saved['deleted']} xóa.")
+    # Thay đổi của data_editor tính theo vị trí dòng, nên trình sửa hiển thị và so sánh với đúng bản
+    # đã đọc lúc mở (giữ trong session), không đọc lại danh sách ở mỗi lần rerun.
+    loaded_key, editor_key = f"questions_loaded_{cohort}", f"question_editor_{cohort}"
+    current_version = questions_version()
+    if loaded_key not in st.session_state:
+        st.session_state[loaded_key] = {"version": current_version, "questions": list_questions()}
+    loaded = st.session_state[loaded_key]
+    qs = loaded["questions"]
+    if current_version != loaded["version"]:
+        st.warning("Danh sách câu hỏi đã được sửa ở nơi khác sau khi bạn mở trình sửa; "
+                   "lưu sẽ bị từ chối cho tới khi tải lại.")
+        st.button("🔄 Tải lại danh sách", on_click=reset_question_editor, args=(cohort,))
+    q_cols = ["id", "order_no", "group_name", "text", "qtype", "low_label", "mid_label", "high_label"]
+    with st.form(f"question_editor_form_{cohort}"):
+        edited_df = st.data_editor(
+            pd.DataFrame(qs, columns=q_cols),
+            key=editor_key,
+            num_rows="dynamic",
+            hide_index=True,
+            column_config={
+                "id": st.column_config.NumberColumn("ID", disabled=True),
+                "order_no": st.column_config.NumberColumn("Thứ tự", min_value=1, step=1),
+                "group_name": st.column_config.TextColumn("Nhóm"),
+                "text": st.column_config.TextColumn("Nội dung câu hỏi", required=True, width="large"),
+                "qtype": st.column_config.SelectboxColumn("Kiểu", options=["slider", "open"], required=True, default="slider"),
+                "low_label": st.column_config.TextColumn("Nhãn mức 1"),
+                "mid_label": st.column_config.TextColumn("Nhãn mức 2"),
+                "high_label": st.column_config.TextColumn("Nhãn mức 3"),
+            },
+        )
+        renumber = st.checkbox("Đánh số lại thứ tự 1, 2, 3… theo cột Thứ tự", value=True)
+        save_questions = st.form_submit_button("💾 Lưu thay đổi")
+    if save_questions:
+        edited = edited_df.astype(object).where(edited_df.notna(), None).to_dict("records")
+        for r in edited:
+            for col in ("id", "order_no"):
+                if r[col] is not None:
+                    r[col] = int(r[col])
+            for col in ("group_name", "text", "low_label", "mid_label", "high_label"):
+                if isinstance(r[col], str):
+                    r[col] = r[col].strip() or None
+        try:
+            st.session_state["questions_saved"] = apply_question_changes(
+                qs, edited, renumber=renumber, expected_version=loaded["version"])
+            reset_question_editor(cohort)
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
 
 with tab3:
     st.subheader("Danh sách sinh viên")
-    students = list_students()
-    if students:
-        df = pd.DataFrame(students)
-        st.dataframe(df, hide_index=True)
-        with st.expander("✏️ Sửa sinh viên"):
-            msv = st.text_input("Mã sinh viên")
-            email = st.text_input("Email mới", "")
-            name = st.text_input("Họ tên mới", "")
-            score = st.number_input("Điểm thi vấn đáp", step=0.1, format="%.1f")
-            if st.button("Cập nhật"):
-                update_student(msv, email if email else None, name if name else None, score if score else None)
-                st.success("Đã cập nhật.")
-        with st.expander("🗑️ Xóa sinh viên"):
-            msv_del = st.text_input("Mã sinh viên cần xóa")
-            if st.button("Xóa sinh viên"):
-                delete_student(msv_del)
-                st.warning("Đã xóa sinh viên và phản hồi liên quan.")
+    saved = st.session_state.pop("students_saved", None)
+    if saved:
+        st.success(f"Đã cập nhật {saved['updated']} và xóa {saved['deleted']} sinh viên (cùng phản hồi liên quan).")
+    c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
+    with c1:
+        stu_search = st.text_input("Tìm theo tiền tố", key="stu_search")
+    with c2:
+        stu_field = st.selectbox("Tìm trong", STUDENT_SEARCH_FIELDS, key="stu_field",
+                                 format_func=lambda f: {"msv": "MSV", "name": "Họ tên", "email": "Email"}[f])
+    with c3:
+        stu_status = st.selectbox("Trạng thái", ["Tất cả", "Đã hoàn thành", "Chưa hoàn thành"], key="stu_status")
+    with c4:
+        stu_limit = st.selectbox("Số dòng/trang", [25, 50, 100], index=1, key="stu_limit")
+
+    # Con trỏ keyset của các trang đã đi qua (None = trang đầu); đổi bộ lọc thì quay về trang đầu
+    stu_filters = (cohort, stu_search.strip(), stu_field, stu_status, stu_limit)
+    if st.session_state.get("stu_filters") != stu_filters:
+        st.session_state["stu_filters"] = stu_filters
+        st.session_state["stu_cursors"] = [None]
+    cursors = st.session_state["stu_cursors"]
+    completed = {"Tất cả": None, "Đã hoàn thành": True, "Chưa hoàn thành": False}[stu_status]
+    page = list_students_page(stu_search, stu_field, completed, after=cursors[-1], limit=stu_limit)
+
+    n1, n2, n3 = st.columns([1, 1, 4])
+    with n1:
+        st.button("◀ Trang trước", disabled=len(cursors) == 1, on_click=cursors.pop)
+    with n2:
+        st.button("Trang sau ▶", disabled=page["next"] is None, on_click=cursors.append, args=(page["next"],))
+    with n3:
+        st.caption(f"Trang {len(cursors)} · {len(page['rows'])} sinh viên")
+
+    if page["rows"]:
+        stu_cols = ["msv", "name", "email", "score", "completed", "completed_at"]
+        stu_df = pd.DataFrame(page["rows"], columns=stu_cols)
+        stu_df["completed"] = stu_df["completed"].fillna(0).astype(bool)
+        stu_df.insert(0, "delete", False)
+        # Sửa họ tên/email/điểm ngay trên bảng, tick cột Xóa để xóa; chỉ ghi các dòng thay đổi
+        with st.form("student_page_form"):
+            edited_stu = st.data_editor(
+                stu_df,
+                key=f"student_editor_{hash((stu_filters, cursors[-1]))}",
+                hide_index=True,
+                column_config={
+                    "delete": st.column_config.CheckboxColumn("Xóa"),
+                    "msv": st.column_config.TextColumn("MSV", disabled=True),
+                    "name": st.column_config.TextColumn("Họ tên"),
+                    "email": st.column_config.TextColumn("Email"),
+                    "score": st.column_config.NumberColumn("Điểm vấn đáp", min_value=0.0, step=0.1, format="%.1f"),
+                    "completed": st.column_config.CheckboxColumn("Hoàn thành", disabled=True),
+                    "completed_at": st.column_config.TextColumn("Thời điểm hoàn thành", disabled=True),
+                },
+            )
+            save_students = st.form_submit_button("💾 Lưu thay đổi")
+        if save_students:
+            pending = []
+            for old, new in zip(page["rows"], edited_stu.to_dict("records")):
+                # Chỉ các ô admin thực sự sửa: dòng cũ có email rỗng mà chỉ sửa điểm không bị coi là xóa email
+                changes = {f: editor_cell(new[f]) for f in ("email", "name", "score")
+                           if editor_cell(new[f]) != editor_cell(old[f])}
+                pending.append((old["msv"], bool(new["delete"]), changes))
+            # Email (dùng để đăng nhập) và họ tên bắt buộc; điểm để trống = chưa có điểm
+            blank = [msv for msv, delete, changes in pending
+                     if not delete and any(f in changes and changes[f] is None for f in ("email", "name"))]
+            if blank:
+                st.error(f"Email và họ tên không được để trống (MSV: {', '.join(blank)}). Chưa lưu thay đổi nào.")
+            else:
+                result = {"updated": 0, "deleted": 0}
+                for msv, delete, changes in pending:
+                    if delete:
+                        delete_student(msv)
+                        result["deleted"] += 1
+                    elif changes:
+                        update_student(msv, **changes)
+                        result["updated"] += 1
+                st.session_state["students_saved"] = result
+                st.rerun()
+    elif stu_search or completed is not None:
+        st.info("Không tìm thấy sinh viên phù hợp.")
     else:
         st.info("Chưa có sinh viên trong hệ thống.")
 
 with tab4:
+    st.subheader("Gửi email nhắc sinh viên chưa hoàn thành khảo sát")
+    st.caption("Thư được đưa vào hàng đợi với tốc độ giới hạn và gửi bởi luồng nền; có thể đóng trang trong khi gửi.")
+    if get_email_conf()["dev_mode"]:
+        st.warning("DEV MODE đang bật: thư không gửi thật, chỉ được đánh dấu đã gửi trong outbox.")
+    runner = start_broadcasts()
+
+    with st.form("broadcast_form"):
+        subject = st.text_input("Tiêu đề", value="Nhắc hoàn thành khảo sát học phần Thực tập tốt nghiệp")
+        body_template = st.text_area(
+            "Nội dung (dùng {name}, {msv}, {email})",
+            value="Xin chào {name} ({msv}),\n\nBạn chưa hoàn thành khảo sát học phần Thực tập tốt nghiệp. "
+                  "Vui lòng đăng nhập hệ thống khảo sát để hoàn thành và xem điểm thi vấn đáp.\n\nTrân trọng.",
+            height=160,
+        )
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            only_incomplete = st.checkbox("Chỉ sinh viên chưa hoàn thành", value=True)
+        with c2:
+            msv_prefix = st.text_input("Lọc theo tiền tố MSV (tùy chọn)").strip()
+        with c3:
+            rate = st.number_input("Số thư mỗi phút", min_value=1, max_value=1000, value=60, step=10)
+        start_btn = st.form_submit_button("📣 Bắt đầu gửi")
+    if start_btn:
+        n = count_broadcast_candidates(only_incomplete, msv_prefix or None)
+        if n == 0:
+            st.info("Không có sinh viên nào phù hợp bộ lọc.")
+        else:
+            bid = create_broadcast(subject, body_template, int(rate), only_incomplete, msv_prefix or None)
+            st.success(f"Đã tạo đợt gửi #{bid} cho {n} sinh viên (~{n / rate:.0f} phút).")
+
+    st.divider()
+    broadcasts = list_broadcasts()
+    if broadcasts:
+        st.button("🔄 Làm mới tiến độ")
+    for b in broadcasts[:10]:
+        progress = broadcast_progress(b["id"])
+        total = sum(progress.values())
+        done = progress.get("sent", 0) + progress.get("failed", 0)
+        with st.expander(f"#{b['id']} • {b['subject']} • {b['description']} • {b['status']}", expanded=b["status"] != "done"):
+            st.progress(done / total if total else 1.0, text=f"{done}/{total} đã xử lý • {progress}")
+            c1, c2 = st.columns(2)
+            with c1:
+                if b["status"] == "running" and st.button("⏸️ Tạm dừng", key=f"bp_{b['id']}"):
+                    set_broadcast_status(b["id"], "paused")
+                    st.rerun()
+                if b["status"] == "paused" and st.button("▶️ Tiếp tục", key=f"br_{b['id']}"):
+                    set_broadcast_status(b["id"], "running")
+                    st.rerun()
+            with c2:
+                show = st.checkbox("Xem trạng thái từng người nhận", key=f"bs_{b['id']}")
+            if show:
+                st.dataframe(pd.DataFrame(list_broadcast_recipients(b["id"])), hide_index=True)
+
+with tab5:
     st.subheader("Reset dữ liệu khảo sát")
     st.caption("Xóa toàn bộ phản hồi và đánh dấu chưa hoàn thành cho tất cả sinh viên")
     if st.button("♻️ Reset responses + completed"):
@@ -162,4 +372,69 @@ with tab4:
     st.caption("Cập nhật lại bộ câu hỏi mặc định theo phiên bản mới (xóa hết câu hỏi & phản hồi hiện tại)")
     if st.button("🗃️ Reset questions theo bộ mới"):
         reset_questions_to_new_default()
+        reset_question_editor(cohort)
         st.success("Đã cập nhật bộ câu hỏi mới.")
+    st.divider()
+    st.caption("Đối soát bộ đếm của Dashboard với bảng responses/students")
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("🔍 Kiểm tra bộ đếm"):
+            problems = verify_tallies()
+            if problems:
+                st.error("Bộ đếm lệch:\n\n" + "\n".join(f"- {p}" for p in problems))
+            else:
+                st.success("Bộ đếm khớp với dữ liệu gốc.")
+    with c2:
+        if st.button("🔢 Tính lại bộ đếm"):
+            rebuild_tallies()
+            st.success("Đã tính lại bộ đếm.")
+
+with tab6:
+    st.subheader("Thời gian xử lý (trong process này)")
+    st.caption("Đo thời gian lấy kết nối DB, từng hàm db.py, vẽ biểu đồ, gửi SMTP và mỗi lần chạy lại trang. "
+               "Dữ liệu nằm trong bộ nhớ (ring buffer), mất khi khởi động lại app.")
+    c1, c2, c3 = st.columns([1, 1, 1])
+    with c1:
+        enabled = st.toggle("Bật đo thời gian", value=utils_perf.ENABLED)
+    with c2:
+        slow_ms = st.number_input("Ghi truy vấn chậm hơn (ms, 0 = tắt)", min_value=0, step=50,
+                                  value=int(utils_perf.SLOW_QUERY_MS or 0))
+    with c3:
+        window = st.selectbox("Khoảng thời gian", options=[0, 300, 3600],
+                              format_func=lambda x: "Toàn bộ buffer" if x == 0 else f"{x // 60} phút gần nhất")
+    if enabled != utils_perf.ENABLED or (slow_ms or None) != utils_perf.SLOW_QUERY_MS:
+        utils_perf.enable(enabled, slow_query_ms=slow_ms or None)
+
+    rows = utils_perf.summary(since=time.time() - window if window else None)
+    if rows:
+        perf_df = pd.DataFrame(rows)[["kind", "name", "count", "p50_ms", "p95_ms", "p99_ms", "max_ms", "total_ms"]]
+        perf_df.columns = ["Loại", "Tên", "Số lần", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)", "Tổng (ms)"]
+        st.dataframe(perf_df.round(2), hide_index=True)
+    elif enabled:
+        st.info("Chưa có số liệu. Thao tác trên các trang khác rồi quay lại đây.")
+
+    slow = utils_perf.slow_queries()
+    if slow:
+        st.markdown(f"**Truy vấn chậm** ({len(slow)} gần nhất)")
+        for item in slow[:50]:
+            with st.expander(f"{item['name']} · {item['ms']:.0f} ms · {time.strftime('%H:%M:%S', time.localtime(item['at']))}"):
+                for stmt in item["statements"]:
+                    st.code(stmt["sql"].strip(), language="sql")
+                    st.caption(" | ".join(stmt["plan"]))
+
+    locks = lock_stats()
+    st.markdown("**Tranh chấp khóa ghi**")
+    st.caption(f"BEGIN {locks['write_begin']} · busy_timeout {locks['busy_timeout_ms']} ms · "
+               f"thử lại tối đa {locks['lock_retries']} lần. Thử lại {locks['retries']} lần, "
+               f"{locks['recovered']} lời gọi thành công sau khi thử lại, {locks['failures']} lời gọi vẫn lỗi, "
+               f"chờ backoff {locks['wait_s']:.2f} s.")
+    if locks["by_function"]:
+        lock_df = pd.DataFrame.from_dict(locks["by_function"], orient="index").rename_axis("Hàm").reset_index()
+        lock_df.columns = ["Hàm", "Thử lại", "Thành công sau thử lại", "Vẫn lỗi", "Chờ (s)"]
+        st.dataframe(lock_df.round(3), hide_index=True)
+    if st.button("🧹 Xóa số liệu đo"):
+        utils_perf.reset()
+        reset_lock_stats()
+        st.rerun()
+
+page_end()
@@ -1,22 +1,28 @@
 import streamlit as st
+from utils_perf import page_start, page_end, stop_page
 st.set_page_config(page_title="Dashboard", page_icon="📊", layout="wide")
+page_start("Dashboard")
 
 # Import các module khác sau khi set_page_config
-import pandas as pd
-import re
-import unicodedata as ud
-import matplotlib as mpl
 import math
-import matplotlib.pyplot as plt
-from db import init_db, list_questions, fetch_results, get_student
+import pandas as pd
+from utils_charts import slider_chart_png, wordcloud_png
+from utils_text import open_answer_frequencies
+from utils_snapshot import apply_db_conf, snapshot_caption
+from utils_cohort import select_cohort, apply_cohort
+from utils_student import load_student
+from utils_analytics import LEVELS, answer_analytics
+from db import init_db, list_questions, get_tallies, list_cohorts, aggregate_tallies, analytics_version
 
 # Kiểm tra wordcloud
 try:
-    from wordcloud import WordCloud, STOPWORDS
+    from wordcloud import WordCloud
     WORDCLOUD_AVAILABLE = True
 except ImportError:
     WORDCLOUD_AVAILABLE = False
 
+apply_db_conf()
+cohort = select_cohort()
 init_db()
 
 # Quyền xem dashboard nghiêm ngặt:
@@ -27,11 +33,11 @@ if not is_admin:
     auth_msv = st.session_state.get("auth_msv")
     if not auth_msv:
         st.error("Bạn chưa đăng nhập. Vui lòng vào tab Sinh viên để đăng nhập (OTP).")
-        st.stop()
-    stu = get_student(auth_msv)
+        stop_page()
+    stu = load_student(auth_msv)["student"]
     if not (stu and stu.get("completed")):
         st.error("Bạn chưa hoàn thành khảo sát nên chưa thể xem Dashboard.")
-        st.stop()
+        stop_page()
 
 # Hiển thị thông báo về wordcloud nếu cần
 if not WORDCLOUD_AVAILABLE:
@@ -87,19 +93,10 @@ st.markdown("""
 
 st.markdown('<h1 class="dashboard-title">📊 Dashboard</h1>', unsafe_allow_html=True)
 
-# Giảm font mặc định cho toàn bộ biểu đồ
-mpl.rcParams.update({
-    'font.size': 6,
-    'axes.titlesize': 6,
-    'axes.labelsize': 6,
-    'xtick.labelsize': 5,
-    'ytick.labelsize': 5,
-})
-
-results = fetch_results()
-if not results:
+tallies = get_tallies()
+if not tallies["started"]:
     st.info("📝 Chưa có dữ liệu phản hồi.")
-    st.stop()
+    stop_page()
 
 # Chặn sinh viên chưa hoàn thành xem dashboard nếu chạy qua page sinh viên
 st.caption("Dashboard chỉ để xem tổng hợp. Sinh viên cần hoàn thành khảo sát để xem điểm trong trang Sinh viên.")
@@ -107,12 +104,10 @@ st.caption("Dashboard chỉ để xem tổng hợp. Sinh viên cần hoàn thàn
 qs = list_questions()
 qs_by_id = {q["id"]: q for q in qs}
 
-df = pd.DataFrame(results)
-
-# Thống kê tổng quan
-total_responses = len(df['msv'].unique())
+# Thống kê tổng quan (đọc từ bộ đếm, không quét responses)
+total_responses = tallies["started"]
 total_questions = len(qs)
-completed_surveys = len(df[df['question_id'] == qs[0]['id']])
+completed_surveys = tallies["completed"]
 
 col1, col2, col3 = st.columns(3)
 with col1:
@@ -137,106 +132,171 @@ with col3:
     </div>
     """, unsafe_allow_html=True)
 
-st.markdown('<h2 class="section-header">📈 Phân Phối Câu Trả Lời (Slider)</h2>', unsafe_allow_html=True)
-
-for q in [q for q in qs if q["qtype"] == "slider"]:
-    sub = df[df["question_id"] == q["id"]]
-    counts = sub["value_int"].value_counts().sort_index()
-    label_map = {1: q["low_label"], 2: q["mid_label"], 3: q["high_label"]}
-    labels = [label_map.get(k, str(k)) for k in [1,2,3]]
-    values = [int(counts.get(k, 0)) for k in [1,2,3]]
-
-    st.markdown(f'<p class="question-text"><strong>{q["order_no"]}. {q["text"]}</strong></p>', unsafe_allow_html=True)
-    
-    # Tạo biểu đồ nhỏ gọn hơn - giảm thêm 50% chiều ngang
-    fig, ax = plt.subplots(figsize=(2.4, 1.2), dpi=110)
-    bars = ax.bar(labels, values, color=['#e74c3c', '#f39c12', '#27ae60'], alpha=0.8)
-    
-    # Thêm số liệu trên cột
-    for bar, value in zip(bars, values):
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height + 0.02,
-                f'{value}', ha='center', va='bottom', fontweight='bold', fontsize=7)
-    
-    ax.set_xlabel("Mức đánh giá", fontsize=5)
-    ax.set_ylabel("Số lượng", fontsize=5)
-    ax.set_title("", fontsize=6)
-    ax.grid(axis='y', alpha=0.3)
-    ax.tick_params(axis='both', labelsize=5)
-    plt.tight_layout()
-    
-    st.pyplot(fig, use_container_width=False)
-    st.markdown(f'<p class="chart-caption">Thang đo: 1 = {q["low_label"]} | 2 = {q["mid_label"]} | 3 = {q["high_label"]}</p>', unsafe_allow_html=True)
-    st.divider()
-
-if WORDCLOUD_AVAILABLE:
-    st.markdown('<h2 class="section-header">☁️ WordCloud (Câu Hỏi Mở)</h2>', unsafe_allow_html=True)
-    vn_stop = set([
-        "và","là","của","cho","các","những","được","trong","khi","đã","với","tôi",
-        "cần","rất","thì","nên","có","không","cũng","như","đến","để","một","mọi",
-        "vì","ở","ra","này","kia","đó","đang","sẽ","đi","bị","từ","học","môn"
-    ])
-    stopwords = STOPWORDS.union(vn_stop)
-
-    for q in [q for q in qs if q["qtype"] == "open"]:
-        sub = df[(df["question_id"] == q["id"]) & (df["value_text"].notnull())]
-        raw_texts = [str(x) for x in sub["value_text"].tolist() if str(x).strip()]
-        if not raw_texts:
+if caption := snapshot_caption():
+    st.caption(caption)
+
+# Mỗi phần là một fragment: đổi nhóm/trang chỉ chạy lại phần đó, các ô số liệu ở trên giữ nguyên
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", lambda f: f)
+
+PAGE_SIZE = 6
+
+def paginate(items, key: str):
+    """Chỉ trả về các câu hỏi của trang đang chọn (selectbox hiện khi có nhiều hơn một trang)."""
+    pages = max(1, math.ceil(len(items) / PAGE_SIZE))
+    if pages == 1:
+        return items
+    page = st.selectbox(
+        "Trang", range(1, pages + 1), key=key,
+        format_func=lambda p: f"Trang {p}/{pages} (câu {(p - 1) * PAGE_SIZE + 1}–{min(p * PAGE_SIZE, len(items))})",
+    )
+    return items[(page - 1) * PAGE_SIZE: page * PAGE_SIZE]
+
+def pick_group(items, key: str):
+    """Chọn nhóm câu hỏi như các tab, nhưng chỉ nhóm đang chọn được dựng."""
+    groups = list(dict.fromkeys(q["group_name"] or "Khác" for q in items))
+    if len(groups) <= 1:
+        return items
+    group = st.radio("Nhóm câu hỏi", groups, horizontal=True, key=key, label_visibility="collapsed")
+    return [q for q in items if (q["group_name"] or "Khác") == group]
+
+@fragment
+def slider_section():
+    apply_cohort()
+    st.markdown('<h2 class="section-header">📈 Phân Phối Câu Trả Lời (Slider)</h2>', unsafe_allow_html=True)
+    sliders = [q for q in qs if q["qtype"] == "slider"]
+    for q in paginate(pick_group(sliders, "dash_slider_group"), "dash_slider_page"):
+        stats = tallies["questions"].get(q["id"], {})
+        counts = stats.get("counts", {})
+        label_map = {1: q["low_label"], 2: q["mid_label"], 3: q["high_label"]}
+        labels = [label_map.get(k, str(k)) for k in [1,2,3]]
+        values = [int(counts.get(k, 0)) for k in [1,2,3]]
+
+        st.markdown(f'<p class="question-text"><strong>{q["order_no"]}. {q["text"]}</strong></p>', unsafe_allow_html=True)
+
+        # Ảnh PNG được cache theo (câu hỏi, nhãn, version dữ liệu), chỉ vẽ lại khi có câu trả lời mới
+        st.image(slider_chart_png(q["id"], tuple(labels), stats.get("version", 0), tuple(values)))
+        st.markdown(f'<p class="chart-caption">Thang đo: 1 = {q["low_label"]} | 2 = {q["mid_label"]} | 3 = {q["high_label"]}</p>', unsafe_allow_html=True)
+        st.divider()
+
+@fragment
+def open_section():
+    apply_cohort()
+    # Câu hỏi mở: tần suất và ảnh WordCloud được cache theo version dữ liệu của từng câu hỏi
+    answered = [
+        q for q in qs
+        if q["qtype"] == "open" and tallies["questions"].get(q["id"], {}).get("answers")
+    ]
+
+    if WORDCLOUD_AVAILABLE:
+        st.markdown('<h2 class="section-header">☁️ WordCloud (Câu Hỏi Mở)</h2>', unsafe_allow_html=True)
+        # Phần nặng nhất của trang: chỉ dựng khi người xem bật
+        if not st.toggle(f"Hiển thị WordCloud ({len(answered)} câu hỏi mở)", key="dash_show_wordcloud"):
+            return
+
+        for q in paginate(answered, "dash_open_page"):
+            version = tallies["questions"][q["id"]].get("version", 0)
+            freq = open_answer_frequencies(q["id"], version, cohort=cohort)
+            if not freq["frequencies"]:
+                continue
+
+            try:
+                png = wordcloud_png(q["id"], version, cohort=cohort)
+                st.markdown(f'<p class="question-text"><strong>{q["order_no"]}. {q["text"]}</strong></p>', unsafe_allow_html=True)
+                st.image(png)
+
+                total = f'~{freq["total"]}' if freq["sampled"] else freq["total"]
+                st.markdown(f'<p class="chart-caption">Số câu trả lời: {total} · Số cụm khác nhau: {len(freq["frequencies"])}</p>', unsafe_allow_html=True)
+                st.divider()
+            except Exception as e:
+                st.error(f"Lỗi tạo WordCloud cho câu hỏi {q['order_no']}: {e}")
+    else:
+        st.markdown('<h2 class="section-header">📝 Câu Hỏi Mở (WordCloud Tạm Thời Bị Tắt)</h2>', unsafe_allow_html=True)
+        for q in paginate(answered, "dash_open_page"):
+            freq = open_answer_frequencies(q["id"], tallies["questions"][q["id"]].get("version", 0), cohort=cohort)
+            if freq["total"]:
+                st.markdown(f'<p class="question-text"><strong>{q["order_no"]}. {q["text"]}</strong></p>', unsafe_allow_html=True)
+                st.markdown(f'<div class="metric-box"><strong>Số câu trả lời:</strong> {freq["total"]}</div>', unsafe_allow_html=True)
+                st.divider()
+
+@fragment
+def faculty_section(cohorts):
+    # Chỉ admin, khi có nhiều khóa: cộng bộ đếm của mọi shard (đọc song song)
+    st.markdown('<h2 class="section-header">🏫 Tổng Hợp Toàn Khoa</h2>', unsafe_allow_html=True)
+    if not st.toggle(f"Hiển thị tổng hợp {len(cohorts)} khóa", key="dash_show_faculty"):
+        return
+    agg = aggregate_tallies([c["code"] for c in cohorts])
+    names = {c["code"]: c["name"] for c in cohorts}
+    st.dataframe(pd.DataFrame([
+        {"Khóa": names[code], "Đã trả lời": v["started"], "Hoàn thành": v["completed"]}
+        for code, v in agg["cohorts"].items()
+    ] + [{"Khóa": "Tổng", "Đã trả lời": agg["started"], "Hoàn thành": agg["completed"]}]), hide_index=True)
+    st.dataframe(pd.DataFrame([
+        {"Câu hỏi": f'{q["order_no"]}. {q["text"]}',
+         "1": q["counts"].get(1, 0), "2": q["counts"].get(2, 0), "3": q["counts"].get(3, 0),
+         "Tổng": q["answers"]}
+        for q in agg["questions"] if q["qtype"] == "slider"
+    ]), hide_index=True)
+
+@fragment
+def analytics_section():
+    # Chỉ admin: bảng theo điểm vấn đáp có thể lộ điểm khi một mức chỉ có vài sinh viên
+    apply_cohort()
+    st.markdown('<h2 class="section-header">🔬 Phân Tích Chéo (Slider × Điểm Vấn Đáp)</h2>', unsafe_allow_html=True)
+    sliders = [q for q in qs if q["qtype"] == "slider"]
+    if len(sliders) < 2 or not st.toggle("Hiển thị phân tích chéo", key="dash_show_analytics"):
+        return
+    # Tính một lần cho mọi bảng bên dưới; chỉ tính lại khi có câu trả lời/điểm/câu hỏi mới
+    res = answer_analytics(tuple(q["id"] for q in sliders), analytics_version(), cohort=cohort)
+    if not res["students"]:
+        st.info("Chưa có câu trả lời slider.")
+        return
+    idx = {qid: i for i, qid in enumerate(res["questions"])}
+    title = lambda q: f'{q["order_no"]}. {q["text"]}'
+    level_labels = lambda q: [q["low_label"], q["mid_label"], q["high_label"]]
+
+    st.markdown('<p class="question-text"><strong>Điểm vấn đáp trung bình theo mức trả lời</strong></p>', unsafe_allow_html=True)
+    st.dataframe(pd.DataFrame([
+        {"Câu hỏi": title(q),
+         **{f"Mức {k}": res["score_mean"][idx[q["id"]], j] for j, k in enumerate(LEVELS)},
+         **{f"SV mức {k}": res["score_n"][idx[q["id"]], j] for j, k in enumerate(LEVELS)},
+         "ρ với điểm": res["score_corr"].iloc[idx[q["id"]]]}
+        for q in sliders
+    ]).round(2), hide_index=True)
+    st.markdown('<p class="chart-caption">Mức 1/2/3 = nhãn thấp/giữa/cao của từng câu. '
+                'ρ: tương quan hạng Spearman giữa câu trả lời và điểm vấn đáp.</p>', unsafe_allow_html=True)
+
+    # Câu so sánh: mặc định câu nguyện vọng bộ môn (Nhóm 4)
+    default = next((i for i, q in enumerate(sliders) if (q["group_name"] or "").startswith("Nhóm 4")), len(sliders) - 1)
+    target = st.selectbox("So sánh theo câu", sliders, index=default, format_func=title, key="dash_analytics_target")
+    t = idx[target["id"]]
+    as_percent = st.toggle("Tỉ lệ % theo hàng", key="dash_analytics_percent")
+    rows = []
+    for q in sliders:
+        if q["id"] == target["id"]:
             continue
+        table = res["crosstab"][idx[q["id"]], :, t, :]
+        for label, counts in zip(level_labels(q), table):
+            total = int(counts.sum())
+            values = counts / total * 100 if as_percent and total else counts
+            rows.append({"Câu hỏi": title(q), "Trả lời": label,
+                         **dict(zip(level_labels(target), values)), "Tổng": total})
+    rows.append({"Câu hỏi": "Điểm vấn đáp trung bình", "Trả lời": "",
+                 **dict(zip(level_labels(target), res["score_mean"][t])), "Tổng": int(res["score_n"][t].sum())})
+    st.dataframe(pd.DataFrame(rows).round(1 if as_percent else 2), hide_index=True)
+
+    # Câu so sánh thường là lựa chọn (bộ môn), không có thứ tự nên bỏ khỏi ma trận tương quan
+    ordinal = [q for q in sliders if q["id"] != target["id"]]
+    corr = res["corr"].iloc[[idx[q["id"]] for q in ordinal], [idx[q["id"]] for q in ordinal]]
+    corr.index = corr.columns = [f'Câu {q["order_no"]}' for q in ordinal]
+    st.markdown('<p class="question-text"><strong>Tương quan giữa các câu trả lời (Spearman)</strong></p>', unsafe_allow_html=True)
+    st.dataframe(corr.style.format("{:.2f}", na_rep="–").background_gradient(cmap="RdBu", vmin=-1, vmax=1))
+    st.markdown(f'<p class="chart-caption">{res["students"]} sinh viên có câu trả lời slider.</p>', unsafe_allow_html=True)
+
+slider_section()
+open_section()
+if is_admin:
+    analytics_section()
+if is_admin and len(all_cohorts := list_cohorts()) > 1:
+    faculty_section(all_cohorts)
 
-        # Gom theo cụm câu trả lời giống nhau (bỏ khoảng trắng thừa và dấu câu cuối)
-        canon_to_display: dict[str, tuple[str, int]] = {}
-        for t in raw_texts:
-            display = re.sub(r"\s+", " ", t.strip())
-            # Bỏ ký tự phân tách/dấu câu ở cuối (Unicode), tránh regex \p; dùng unicodedata
-            tmp = display
-            while tmp and (ud.category(tmp[-1]).startswith('P') or ud.category(tmp[-1]).startswith('Z')):
-                tmp = tmp[:-1]
-            canonical = tmp.lower()
-            if canonical in canon_to_display:
-                old_disp, cnt = canon_to_display[canonical]
-                canon_to_display[canonical] = (old_disp, cnt + 1)
-            else:
-                canon_to_display[canonical] = (display, 1)
-
-        # Tạo frequencies theo cụm câu trả lời (mỗi câu là một token)
-        frequencies = {disp: cnt for disp, cnt in canon_to_display.values()}
-
-        try:
-            # Tăng kích thước chữ theo tần suất, nhưng vẫn giữ tổng thể gọn
-            max_count = max(frequencies.values())
-            # Tính max_font_size động: cơ sở 18, cộng thêm 6px cho mỗi lần lặp (tối đa 60)
-            dynamic_max_font = min(60, 18 + max_count * 6)
-            wc = WordCloud(
-                width=160,
-                height=60,
-                background_color="white",
-                collocations=False,  # giữ nguyên cụm, không tách bigram
-                max_words=30,
-                max_font_size=int(dynamic_max_font),
-                min_font_size=6,
-                prefer_horizontal=1,
-                margin=0,
-                relative_scaling=0.5,
-            ).generate_from_frequencies(frequencies)
-
-            st.markdown(f'<p class="question-text"><strong>{q["order_no"]}. {q["text"]}</strong></p>', unsafe_allow_html=True)
-            fig, ax = plt.subplots(figsize=(2.0, 0.9), dpi=120)
-            ax.imshow(wc, interpolation="bilinear")
-            ax.axis("off")
-            plt.tight_layout()
-            st.pyplot(fig, use_container_width=False)
-
-            st.markdown(f'<p class="chart-caption">Số câu trả lời: {len(raw_texts)} · Số cụm khác nhau: {len(frequencies)}</p>', unsafe_allow_html=True)
-            st.divider()
-        except Exception as e:
-            st.error(f"Lỗi tạo WordCloud cho câu hỏi {q['order_no']}: {e}")
-else:
-    st.markdown('<h2 class="section-header">📝 Câu Hỏi Mở (WordCloud Tạm Thời Bị Tắt)</h2>', unsafe_allow_html=True)
-    for q in [q for q in qs if q["qtype"] == "open"]:
-        sub = df[(df["question_id"] == q["id"]) & (df["value_text"].notnull())]
-        texts = [str(x) for x in sub["value_text"].tolist() if str(x).strip()]
-        if texts:
-            st.markdown(f'<p class="question-text"><strong>{q["order_no"]}. {q["text"]}</strong></p>', unsafe_allow_html=True)
-            st.markdown(f'<div class="metric-box"><strong>Số câu trả lời:</strong> {len(texts)}</div>', unsafe_allow_html=True)
-            st.divider()
+page_end()
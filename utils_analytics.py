@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import db
+import utils_perf
+
+# Các mức của câu hỏi slider (1 = low_label, 2 = mid_label, 3 = high_label)
+LEVELS = (1, 2, 3)
+
+def answer_matrix(frame: pd.DataFrame, question_ids: list[int]) -> dict:
+    """Pivot câu trả lời slider một lần thành ma trận sinh viên × câu hỏi và tính mọi bảng từ đó.
+
+    `frame` có cột msv, question_id, value_int, score (như db.fetch_slider_scores_frame()).
+    Mỗi câu trả lời là một cột one-hot (câu hỏi, mức); một phép nhân ma trận cho mọi bảng chéo
+    giữa hai câu hỏi, một phép nhân nữa cho tổng điểm theo mức, thay vì lọc từng câu hỏi/mức.
+
+    Trả về:
+      questions   danh sách question_id theo thứ tự các trục
+      students    số sinh viên có ít nhất một câu trả lời slider
+      crosstab    mảng (câu a, mức a, câu b, mức b) -> số sinh viên; đường chéo a == b là số đếm từng mức
+      score_mean  (câu, mức) -> điểm vấn đáp trung bình (NaN nếu không ai có điểm)
+      score_n     (câu, mức) -> số sinh viên có điểm
+      corr        DataFrame tương quan Spearman giữa các câu (theo cặp sinh viên trả lời cả hai)
+      score_corr  Series tương quan Spearman của từng câu với điểm vấn đáp
+    """
+    nq, nl = len(question_ids), len(LEVELS)
+    frame = frame[frame["question_id"].isin(question_ids) & frame["value_int"].between(LEVELS[0], LEVELS[-1])]
+    rows, students = pd.factorize(frame["msv"])
+    cols = pd.Index(question_ids).get_indexer(frame["question_id"])
+    values = frame["value_int"].to_numpy(dtype=np.int64)
+
+    matrix = np.full((len(students), nq), np.nan)
+    matrix[rows, cols] = values
+    score = np.full(len(students), np.nan)
+    score[rows] = frame["score"].to_numpy()
+
+    onehot = np.zeros((len(students), nq * nl))
+    onehot[rows, cols * nl + values - LEVELS[0]] = 1.0
+    has_score = ~np.isnan(score)
+    score_n = onehot.T @ has_score
+    score_sum = onehot.T @ np.where(has_score, score, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        score_mean = np.where(score_n > 0, score_sum / score_n, np.nan)
+
+    # Điểm là cột cuối: một lần corr() cho cả tương quan giữa các câu và với điểm
+    corr = pd.DataFrame(np.column_stack([matrix, score]), columns=[*question_ids, "score"]).corr(
+        method="spearman", min_periods=3)
+    return {
+        "questions": list(question_ids),
+        "students": len(students),
+        "crosstab": (onehot.T @ onehot).round().astype(np.int64).reshape(nq, nl, nq, nl),
+        "score_mean": score_mean.reshape(nq, nl),
+        "score_n": score_n.round().astype(np.int64).reshape(nq, nl),
+        "corr": corr.iloc[:nq, :nq],
+        "score_corr": corr["score"].iloc[:nq],
+    }
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def answer_analytics(question_ids: tuple[int, ...], data_version: tuple, cohort: str | None = None) -> dict:
+    """answer_matrix() của khóa, cache theo (khóa, câu hỏi, db.analytics_version())."""
+    with db.using_cohort(cohort or db.current_cohort()), utils_perf.timer("analytics", "matrix"):
+        return answer_matrix(db.fetch_slider_scores_frame(), list(question_ids))
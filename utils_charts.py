@@ -0,0 +1,88 @@
+import io
+
+import matplotlib
+from matplotlib.figure import Figure
+import streamlit as st
+
+import utils_perf
+
+# Font nhỏ cho toàn bộ biểu đồ Dashboard
+CHART_RC = {
+    'font.size': 6,
+    'axes.titlesize': 6,
+    'axes.labelsize': 6,
+    'xtick.labelsize': 5,
+    'ytick.labelsize': 5,
+}
+
+def _to_png(fig: Figure) -> bytes:
+    # Cùng tham số st.pyplot dùng mặc định, để ảnh hiển thị như trước
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=200)
+    return buf.getvalue()
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def slider_chart_png(question_id: int, labels: tuple, data_version: int, values: tuple) -> bytes:
+    """PNG biểu đồ cột cho một câu hỏi slider.
+
+    Cache dùng chung cho mọi session (LRU, tối đa 256 ảnh), khóa theo câu hỏi, nhãn và
+    version dữ liệu của câu hỏi đó: chỉ biểu đồ có câu trả lời mới được vẽ lại.
+    """
+    with utils_perf.timer("chart", "slider"), matplotlib.rc_context(CHART_RC):
+        # Figure thay vì pyplot: không dùng state toàn cục, an toàn khi nhiều session vẽ cùng lúc
+        fig = Figure(figsize=(2.4, 1.2), dpi=110)
+        ax = fig.subplots()
+        bars = ax.bar(labels, values, color=['#e74c3c', '#f39c12', '#27ae60'], alpha=0.8)
+
+        # Thêm số liệu trên cột
+        for bar, value in zip(bars, values):
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height + 0.02,
+                    f'{value}', ha='center', va='bottom', fontweight='bold', fontsize=7)
+
+        ax.set_xlabel("Mức đánh giá", fontsize=5)
+        ax.set_ylabel("Số lượng", fontsize=5)
+        ax.set_title("", fontsize=6)
+        ax.grid(axis='y', alpha=0.3)
+        ax.tick_params(axis='both', labelsize=5)
+        fig.tight_layout()
+        return _to_png(fig)
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def wordcloud_png(question_id: int, data_version: int, cohort: str | None = None) -> bytes | None:
+    """PNG WordCloud của một câu hỏi mở, cache theo (khóa, câu hỏi, version dữ liệu); None nếu chưa có câu trả lời."""
+    from utils_text import open_answer_frequencies
+
+    frequencies = open_answer_frequencies(question_id, data_version, cohort=cohort)["frequencies"]
+    if not frequencies:
+        return None
+    with utils_perf.timer("chart", "wordcloud"):
+        return _wordcloud_png(frequencies)
+
+def _wordcloud_png(frequencies: dict) -> bytes:
+    from wordcloud import WordCloud
+
+    # Tăng kích thước chữ theo tần suất, nhưng vẫn giữ tổng thể gọn
+    max_count = max(frequencies.values())
+    # Tính max_font_size động: cơ sở 18, cộng thêm 6px cho mỗi lần lặp (tối đa 60)
+    dynamic_max_font = min(60, 18 + max_count * 6)
+    wc = WordCloud(
+        width=160,
+        height=60,
+        background_color="white",
+        collocations=False,  # giữ nguyên cụm, không tách bigram
+        max_words=30,
+        max_font_size=int(dynamic_max_font),
+        min_font_size=6,
+        prefer_horizontal=1,
+        margin=0,
+        relative_scaling=0.5,
+    ).generate_from_frequencies(frequencies)
+
+    with matplotlib.rc_context(CHART_RC):
+        fig = Figure(figsize=(2.0, 0.9), dpi=120)
+        ax = fig.subplots()
+        ax.imshow(wc, interpolation="bilinear")
+        ax.axis("off")
+        fig.tight_layout()
+        return _to_png(fig)
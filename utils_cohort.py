@@ -0,0 +1,39 @@
+import streamlit as st
+
+import db
+
+def _reset_login():
+    # Đăng nhập sinh viên gắn với một khóa: đổi khóa thì phải đăng nhập lại
+    for key in ("auth_msv", "otp_ready_for", "student"):
+        if key in st.session_state:
+            st.session_state[key] = None
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _list_cohorts():
+    # Danh sách khóa hiếm khi đổi: không đọc registry ở mỗi lần rerun của mọi trang
+    return db.list_cohorts()
+
+def refresh_cohorts():
+    """Gọi sau khi thêm khóa để ô chọn khóa thấy ngay (không chờ hết ttl)."""
+    _list_cohorts.clear()
+
+def select_cohort() -> str:
+    """Ô chọn khóa/lớp ở sidebar (ẩn khi chỉ có khóa mặc định) và chuyển db.py sang shard đó."""
+    cohorts = _list_cohorts()
+    codes = [c["code"] for c in cohorts]
+    pending = st.session_state.pop("cohort_pending", None)
+    if pending in codes:
+        st.session_state["cohort"] = pending
+    if st.session_state.get("cohort") not in codes:
+        st.session_state["cohort"] = db.DEFAULT_COHORT
+    if len(codes) > 1:
+        names = {c["code"]: c["name"] for c in cohorts}
+        st.sidebar.selectbox("Khóa / lớp", codes, key="cohort", format_func=lambda c: f"{names[c]} ({c})",
+                             on_change=_reset_login)
+    return apply_cohort()
+
+def apply_cohort() -> str:
+    """Chọn lại shard theo session (dùng đầu mỗi fragment: fragment chạy lại ở luồng mới)."""
+    code = st.session_state.get("cohort", db.DEFAULT_COHORT)
+    db.use_cohort(code)
+    return code
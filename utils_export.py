@@ -0,0 +1,42 @@
+import csv
+
+from db import EXPORT_COLUMNS, iter_export_rows, iter_student_answers, list_questions
+
+def write_responses_csv(f, layout: str = "long", chunk_size: int = 5000) -> int:
+    """Ghi CSV phản hồi vào file text `f` theo từng chunk; trả về số dòng dữ liệu.
+
+    layout="long": mỗi câu trả lời một dòng (như export cũ).
+    layout="wide": mỗi sinh viên một dòng, mỗi câu hỏi một cột.
+    Bộ nhớ dùng chỉ phụ thuộc chunk_size (và số câu hỏi với layout wide).
+    """
+    writer = csv.writer(f)
+    if layout == "long":
+        writer.writerow(EXPORT_COLUMNS)
+        n = 0
+        for chunk in iter_export_rows(chunk_size):
+            writer.writerows(chunk)
+            n += len(chunk)
+        return n
+
+    questions = list_questions()
+    col_of = {q["id"]: i for i, q in enumerate(questions)}
+    is_open = [q["qtype"] == "open" for q in questions]
+    writer.writerow(["msv", "name", "email", "score"] + [f"{q['order_no']}. {q['text']}" for q in questions])
+
+    n = 0
+    current, cells = None, None
+    for chunk in iter_student_answers(chunk_size):
+        for msv, name, email, score, qid, value_int, value_text in chunk:
+            if current is None or msv != current[0]:
+                if current is not None:
+                    writer.writerow(list(current) + cells)
+                    n += 1
+                current, cells = (msv, name, email, score), [""] * len(questions)
+            i = col_of.get(qid)
+            if i is not None:
+                value = value_text if is_open[i] else value_int
+                cells[i] = "" if value is None else value
+    if current is not None:
+        writer.writerow(list(current) + cells)
+        n += 1
+    return n
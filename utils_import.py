@@ -0,0 +1,53 @@
+import pandas as pd
+
+# Cột trong file Excel/CSV -> cột trong bảng students
+ROSTER_COLUMNS = {
+    "Mã sinh viên": "msv",
+    "Email": "email",
+    "Họ và tên": "name",
+    "Điểm thi vấn đáp": "score",
+}
+
+def iter_roster_chunks(file, filename: str, chunk_size: int = 5000):
+    """Đọc file danh sách theo từng DataFrame nhỏ, không nạp cả file vào bộ nhớ."""
+    if filename.lower().endswith(".csv"):
+        yield from pd.read_csv(file, chunksize=chunk_size, dtype=str, encoding="utf-8-sig")
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(h).strip() if h is not None else "" for h in header]
+        batch = []
+        for r in rows:
+            batch.append(r)
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        wb.close()
+
+def normalize_roster(df: pd.DataFrame) -> list[tuple]:
+    """Chuẩn hóa một chunk (vectorized) thành list tuple (msv, email, name, score)."""
+    df = df.rename(columns=lambda c: str(c).strip())
+    missing = [col for col in ROSTER_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Thiếu cột. Yêu cầu: {list(ROSTER_COLUMNS)}")
+    out = df[list(ROSTER_COLUMNS)].rename(columns=ROSTER_COLUMNS)
+    for col in ("msv", "email", "name"):
+        out[col] = out[col].astype("string").str.strip()
+    out["score"] = pd.to_numeric(out["score"], errors="coerce")
+    out = out[out["msv"].notna() & (out["msv"] != "")]
+    out = out.astype(object).where(out.notna(), None)
+    return list(out.itertuples(index=False, name=None))
+
+def iter_roster_rows(file, filename: str, chunk_size: int = 5000):
+    """Chuỗi chunk đã chuẩn hóa, dùng trực tiếp cho db.bulk_upsert_students."""
+    for chunk in iter_roster_chunks(file, filename, chunk_size):
+        yield normalize_roster(chunk)
@@ -1,25 +1,264 @@
 import smtplib, ssl
+import threading
+import time
 from email.mime.text import MIMEText
 from email.utils import formataddr
 import streamlit as st
 
+import db
+import utils_perf
+
 def get_email_conf():
     try:
         cfg = st.secrets.get("email", {})
     except Exception:
         # Fallback khi không có secrets.toml
         cfg = {}
-    
+
     return {
         "host": cfg.get("host"),
         "port": int(cfg.get("port", 587)),
         "user": cfg.get("user"),
         "password": cfg.get("password"),
         "use_tls": bool(cfg.get("use_tls", True)),
+        # "none" chỉ dùng cho SMTP giả lập local (vd. aiosmtpd) khi test
+        "security": cfg.get("security"),
         "from_name": cfg.get("from_name", "Survey System"),
         "dev_mode": bool(cfg.get("dev_mode", True)),  # Mặc định bật dev mode
+        "workers": int(cfg.get("workers", 2)),
+        "max_attempts": int(cfg.get("max_attempts", 5)),
     }
 
+def _open_smtp(conf):
+    security = conf.get("security") or ("starttls" if conf["use_tls"] else "ssl")
+    if security == "ssl":
+        server = smtplib.SMTP_SSL(conf["host"], conf["port"], context=ssl.create_default_context(), timeout=30)
+    else:
+        server = smtplib.SMTP(conf["host"], conf["port"], timeout=30)
+        if security == "starttls":
+            server.starttls(context=ssl.create_default_context())
+    server.login(conf["user"], conf["password"])
+    return server
+
+def _build_message(conf, to_email, subject, body):
+    msg = MIMEText(body, "plain", "utf-8")
+    msg["Subject"] = subject
+    msg["From"] = formataddr((conf["from_name"], conf["user"]))
+    msg["To"] = to_email
+    return msg
+
+def _is_permanent(e: Exception) -> bool:
+    """Lỗi 5xx do người nhận/nội dung: gửi lại cũng không thành công. 4xx, lỗi mạng, lỗi đăng nhập: thử lại."""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return False
+
+
+class MailWorkerPool:
+    """Các luồng nền lấy thư từ bảng outbox và gửi qua SMTP.
+
+    Mỗi luồng giữ một kết nối SMTP đã đăng nhập và dùng lại cho nhiều thư; lỗi tạm thời
+    được gửi lại với backoff lũy thừa, trạng thái từng thư ghi trong outbox.
+    """
+
+    def __init__(self, conf, workers: int = 2, batch_size: int = 20, poll_interval: float = 2.0,
+                 max_attempts: int = 5, backoff_base: float = 5.0, idle_reconnect: float = 60.0):
+        self.conf = conf
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.idle_reconnect = idle_reconnect
+        self.sent = 0
+        self.failed = 0
+        self.started_at = None
+        self._next_cohort = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"mail-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def notify(self):
+        """Đánh thức worker ngay khi có thư mới thay vì chờ chu kỳ poll."""
+        self._wake.set()
+
+    def messages_per_second(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return self.sent / max(time.monotonic() - self.started_at, 1e-9)
+
+    def _claim(self):
+        """Lấy một lô thư chờ gửi; mỗi khóa có outbox riêng nên lần lượt xoay vòng qua các khóa."""
+        codes = [c["code"] for c in db.list_cohorts()]
+        with self._lock:
+            self._next_cohort = (self._next_cohort + 1) % len(codes)
+            start = self._next_cohort
+        for code in codes[start:] + codes[:start]:
+            with db.using_cohort(code):
+                batch = db.claim_outbox(self.batch_size)
+            if batch:
+                return code, batch
+        return None, []
+
+    def _run(self):
+        server, last_used = None, 0.0
+        try:
+            while not self._stop.is_set():
+                try:
+                    cohort, batch = self._claim()
+                except Exception:
+                    # Lỗi DB tạm thời (vd. database is locked): chờ rồi lấy lại, không để worker dừng hẳn
+                    self._stop.wait(self.poll_interval)
+                    continue
+                if not batch:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+                # Đánh dấu sent/failed trong cùng shard đã lấy thư
+                with db.using_cohort(cohort):
+                    for item in batch:
+                        try:
+                            if server is not None and time.monotonic() - last_used > self.idle_reconnect:
+                                server = self._close(server)
+                            if server is None:
+                                with utils_perf.timer("smtp", "connect"):
+                                    server = _open_smtp(self.conf)
+                            with utils_perf.timer("smtp", "send"):
+                                server.send_message(_build_message(self.conf, item["to_email"], item["subject"], item["body"]))
+                            last_used = time.monotonic()
+                        except Exception as e:
+                            if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                                # Lỗi kết nối: mở lại ở thư sau
+                                server = self._close(server)
+                            attempts = item["attempts"] + 1
+                            give_up = _is_permanent(e) or attempts >= self.max_attempts
+                            self._record(db.mark_outbox_failed, item["id"], str(e),
+                                         None if give_up else self.backoff_base * 2 ** (attempts - 1))
+                            if give_up:
+                                with self._lock:
+                                    self.failed += 1
+                            continue
+                        # Thư đã gửi: chỉ thử ghi lại trạng thái, không đưa thư vào hàng đợi gửi lại
+                        self._record(db.mark_outbox_sent, item["id"], give_up_on_stop=False)
+                        with self._lock:
+                            self.sent += 1
+        finally:
+            self._close(server)
+
+    def _record(self, fn, *args, give_up_on_stop: bool = True) -> bool:
+        """Ghi trạng thái thư vào outbox, thử lại với backoff khi DB lỗi tạm thời.
+
+        Thư lỗi: bỏ khi worker dừng, thư còn 'sending' được lấy lại sau OUTBOX_CLAIM_TIMEOUT để gửi lại.
+        Thư đã gửi (give_up_on_stop=False): thử đến khi ghi được kể cả lúc đang dừng, nếu không
+        thư bị lấy lại và sinh viên nhận hai lần.
+        """
+        delay = 0.5
+        while True:
+            try:
+                fn(*args)
+                return True
+            except Exception:
+                if self._stop.wait(delay):
+                    if give_up_on_stop:
+                        return False
+                    # _stop đã đặt nên wait() không chờ nữa
+                    time.sleep(delay)
+                delay = min(delay * 2, 10.0)
+
+    @staticmethod
+    def _close(server):
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+        return None
+
+
+class _KeepMissing(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+def render_template(template: str, student: dict) -> str:
+    """Điền {name}, {msv}, {email}, {score} vào nội dung; placeholder lạ được giữ nguyên."""
+    values = _KeepMissing({k: ("" if v is None else v) for k, v in student.items()})
+    return template.format_map(values)
+
+
+class BroadcastRunner:
+    """Luồng nền đưa thư của các đợt gửi đang chạy vào outbox, không quá rate_per_min thư/phút.
+
+    Tiến độ và hạn mức gửi nằm trong DB nên đợt gửi tiếp tục sau khi khởi động lại và nhiều process
+    cùng chạy runner vẫn dùng chung một hạn mức; tạm dừng bằng db.set_broadcast_status(id, "paused").
+    """
+
+    def __init__(self, on_release=None, tick: float = 1.0, burst_seconds: float = 5.0, max_batch: int = 500):
+        self.on_release = on_release
+        self.tick = tick
+        # Cho phép dồn tối đa burst_seconds giây thư, sau đó đều rate_per_min/phút
+        self.burst_seconds = burst_seconds
+        self.max_batch = max_batch
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="broadcast-runner", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_once(self) -> int:
+        released = 0
+        for cohort in db.list_cohorts():
+            # Mỗi khóa có bảng broadcasts/outbox riêng
+            with db.using_cohort(cohort["code"]):
+                for b in db.list_broadcasts("running"):
+                    template = b["body_template"]
+                    released += db.release_broadcast_batch(b["id"], self.max_batch,
+                                                           lambda r: render_template(template, r),
+                                                           burst_seconds=self.burst_seconds)
+        if released and self.on_release:
+            self.on_release()
+        return released
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # Lỗi tạm thời (vd. database is locked): thử lại ở nhịp sau
+                pass
+            self._stop.wait(self.tick)
+
+
+@st.cache_resource
+def get_mail_worker(conf_key: tuple) -> MailWorkerPool:
+    conf = dict(conf_key)
+    return MailWorkerPool(conf, workers=conf["workers"], max_attempts=conf["max_attempts"]).start()
+
 def send_email_code(to_email: str, subject: str, body: str):
     conf = get_email_conf()
     if conf["dev_mode"]:
@@ -31,21 +270,34 @@ def send_email_code(to_email: str, subject: str, body: str):
         st.error("Thiếu cấu hình SMTP trong st.secrets['email']. Không thể gửi email.")
         return False
 
-    msg = MIMEText(body, "plain", "utf-8")
-    msg["Subject"] = subject
-    msg["From"] = formataddr((conf["from_name"], conf["user"]))
-    msg["To"] = to_email
-
+    # Ghi vào outbox rồi trả về ngay; worker nền gửi và tự thử lại khi lỗi tạm thời
     try:
-        if conf["use_tls"]:
-            server = smtplib.SMTP(conf["host"], conf["port"])
-            server.starttls(context=ssl.create_default_context())
-        else:
-            server = smtplib.SMTP_SSL(conf["host"], conf["port"], context=ssl.create_default_context())
-        server.login(conf["user"], conf["password"])
-        server.send_message(msg)
-        server.quit()
+        db.enqueue_email(to_email, subject, body)
+        get_mail_worker(tuple(sorted(conf.items()))).notify()
         return True
     except Exception as e:
         st.error(f"Lỗi gửi email: {e}")
         return False
+
+def drain_outbox_dev(batch_size: int = 500) -> int:
+    """DEV MODE không có worker SMTP: đánh dấu thư trong outbox là đã gửi (không gửi thật)
+    để đợt gửi chạy hết thay vì nằm mãi ở 'queued'. Trả về số thư đã xử lý."""
+    drained = 0
+    for cohort in db.list_cohorts():
+        with db.using_cohort(cohort["code"]):
+            while batch := db.claim_outbox(batch_size):
+                for item in batch:
+                    db.mark_outbox_sent(item["id"])
+                drained += len(batch)
+    return drained
+
+@st.cache_resource
+def get_broadcast_runner(conf_key: tuple) -> BroadcastRunner:
+    conf = dict(conf_key)
+    on_release = drain_outbox_dev if conf["dev_mode"] else get_mail_worker(conf_key).notify
+    return BroadcastRunner(on_release=on_release).start()
+
+def start_broadcasts() -> BroadcastRunner:
+    """Bảo đảm runner (và worker gửi thư, nếu không ở dev mode) đang chạy trong process."""
+    conf = get_email_conf()
+    return get_broadcast_runner(tuple(sorted(conf.items())))
@@ -0,0 +1,171 @@
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Đo thời gian trong process: tắt mặc định, bật ở tab Performance của Admin.
+# Khi tắt, mỗi lời gọi chỉ tốn một lần kiểm tra cờ ENABLED.
+ENABLED = False
+
+# Lời gọi db.py chậm hơn ngưỡng này (ms) được lưu kèm câu SQL và EXPLAIN QUERY PLAN; None = tắt
+SLOW_QUERY_MS: float | None = None
+
+# Ring buffer (thời điểm, loại, tên, giây) — bản ghi cũ nhất bị đẩy ra khi đầy
+_events: deque = deque(maxlen=20000)
+_slow: deque = deque(maxlen=200)
+_local = threading.local()
+
+
+def enable(on: bool = True, slow_query_ms: float | None = ..., capacity: int | None = None) -> None:
+    global ENABLED, SLOW_QUERY_MS, _events
+    ENABLED = on
+    if slow_query_ms is not ...:
+        SLOW_QUERY_MS = slow_query_ms
+    if capacity and capacity != _events.maxlen:
+        _events = deque(_events, maxlen=capacity)
+
+
+def reset() -> None:
+    _events.clear()
+    _slow.clear()
+
+
+def record(kind: str, name: str, seconds: float) -> None:
+    if ENABLED:
+        _events.append((time.time(), kind, name, seconds))
+
+
+@contextmanager
+def timer(kind: str, name: str):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _events.append((time.time(), kind, name, time.perf_counter() - start))
+
+
+# ---------- Truy vấn chậm ----------
+_SKIP_SQL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+
+def trace_sql(sql: str) -> None:
+    """Trace callback của sqlite3: gom câu SQL mà lời gọi db.py hiện tại đã chạy."""
+    statements = getattr(_local, "statements", None)
+    if statements is not None and len(statements) < 50 and not sql.lstrip().upper().startswith(_SKIP_SQL):
+        statements.append(sql)
+
+
+def tracing_sql() -> bool:
+    return ENABLED and SLOW_QUERY_MS is not None and getattr(_local, "statements", None) is not None
+
+
+def _finish_call(name: str, start: float, statements, explain) -> None:
+    seconds = time.perf_counter() - start
+    _events.append((time.time(), "db", name, seconds))
+    threshold = SLOW_QUERY_MS
+    if statements and threshold is not None and seconds * 1000 >= threshold:
+        plans = []
+        for sql in statements:
+            try:
+                plans.append(explain(sql))
+            except Exception as e:
+                plans.append([f"(không lấy được plan: {e})"])
+        _slow.append({
+            "at": time.time(), "name": name, "ms": seconds * 1000,
+            "statements": [{"sql": sql, "plan": plan} for sql, plan in zip(statements, plans)],
+        })
+
+
+def instrument(fn, explain=None):
+    """Bọc một hàm db.py: ghi thời gian mỗi lời gọi (generator: tới khi duyệt xong).
+
+    explain(sql) -> list[str] dùng để lấy EXPLAIN QUERY PLAN cho lời gọi chậm.
+    """
+    name = fn.__name__
+
+    def begin():
+        # Chỉ lời gọi ngoài cùng gom SQL; lời gọi lồng nhau dùng chung danh sách
+        own = SLOW_QUERY_MS is not None and getattr(_local, "statements", None) is None
+        if own:
+            _local.statements = []
+        return own, time.perf_counter()
+
+    def end(own, start):
+        statements = None
+        if own:
+            statements, _local.statements = _local.statements, None
+        _finish_call(name, start, statements, explain)
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def gen_wrapper(*args, **kwargs):
+            if not ENABLED:
+                return (yield from fn(*args, **kwargs))
+            # Generator có thể bị dừng giữa chừng ở luồng khác: không gom SQL, chỉ đo thời gian
+            start = time.perf_counter()
+            try:
+                return (yield from fn(*args, **kwargs))
+            finally:
+                _events.append((time.time(), "db", name, time.perf_counter() - start))
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        own, start = begin()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            end(own, start)
+    return wrapper
+
+
+# ---------- Tổng hợp ----------
+def _percentile(sorted_ms: list[float], p: float) -> float:
+    return sorted_ms[min(len(sorted_ms) - 1, int(len(sorted_ms) * p))]
+
+
+def summary(since: float | None = None) -> list[dict]:
+    """Số lần gọi và phân vị (ms) theo (loại, tên), sắp theo tổng thời gian giảm dần."""
+    groups: dict[tuple, list[float]] = {}
+    for at, kind, name, seconds in list(_events):
+        if since is None or at >= since:
+            groups.setdefault((kind, name), []).append(seconds * 1000)
+    rows = []
+    for (kind, name), ms in groups.items():
+        ms.sort()
+        rows.append({
+            "kind": kind, "name": name, "count": len(ms), "total_ms": sum(ms),
+            "p50_ms": _percentile(ms, 0.50), "p95_ms": _percentile(ms, 0.95),
+            "p99_ms": _percentile(ms, 0.99), "max_ms": ms[-1],
+        })
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+
+def slow_queries() -> list[dict]:
+    return list(reversed(_slow))
+
+
+# ---------- Thời gian chạy lại trang ----------
+def page_start(page: str) -> None:
+    """Gọi ở đầu script; page_end() ở cuối ghi thời gian một lần rerun (bỏ qua lần dừng bằng st.stop())."""
+    _local.page = (page, time.perf_counter())
+
+
+def page_end() -> None:
+    page = getattr(_local, "page", None)
+    if page is not None:
+        _local.page = None
+        record("page", page[0], time.perf_counter() - page[1])
+
+
+def stop_page() -> None:
+    """Thay cho st.stop() trong các trang: ghi thời gian rerun rồi dừng script."""
+    import streamlit as st
+    page_end()
+    st.stop()
@@ -0,0 +1,85 @@
+import threading
+import time
+
+class RateLimiter:
+    """Token bucket theo khóa (MSV, IP...) giữ trong bộ nhớ process, không chạm tới DB.
+
+    Mỗi khóa có tối đa `capacity` token, hồi lại `capacity` token sau `per_seconds` giây.
+    """
+
+    def __init__(self, capacity: float, per_seconds: float, max_keys: int = 100_000):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.max_keys = max_keys
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def allow(self, key, cost: float = 1.0) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(key, now)
+            allowed = tokens >= cost
+            self._buckets[key] = (tokens - cost if allowed else tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return allowed
+
+    def retry_after(self, key, cost: float = 1.0) -> float:
+        """Số giây cần chờ đến khi khóa có đủ token."""
+        with self._lock:
+            missing = cost - self._tokens(key, time.monotonic())
+        return max(0.0, missing / self.rate)
+
+    def reset(self, key) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _prune(self, now):
+        # Bucket đã hồi đầy không khác gì bucket mới: bỏ đi để giới hạn bộ nhớ
+        for key in [k for k in self._buckets if self._tokens(k, now) >= self.capacity]:
+            del self._buckets[key]
+
+
+# Giới hạn cho luồng đăng nhập OTP, dùng chung cho mọi session trong process
+OTP_REQUEST_PER_MSV = RateLimiter(capacity=1, per_seconds=60)    # cooldown 60 giây/MSV
+OTP_REQUEST_PER_IP = RateLimiter(capacity=20, per_seconds=600)
+OTP_VERIFY_PER_MSV = RateLimiter(capacity=5, per_seconds=300)
+OTP_VERIFY_PER_IP = RateLimiter(capacity=50, per_seconds=600)
+# Nhập sai MSV/email: cooldown được trả lại để sửa lỗi gõ, nhưng mỗi MSV chỉ được sai 5 lần/10 phút
+OTP_LOGIN_FAIL_PER_MSV = RateLimiter(capacity=5, per_seconds=600)
+# Không biết IP (thường gặp sau proxy của Streamlit): mọi yêu cầu dùng chung một bucket, đủ cho cả lớp
+# đăng nhập cùng lúc nhưng chặn thử hàng loạt
+OTP_REQUEST_GLOBAL = RateLimiter(capacity=300, per_seconds=60)
+OTP_VERIFY_GLOBAL = RateLimiter(capacity=600, per_seconds=60)
+
+def _allow_client(per_ip: RateLimiter, fallback: RateLimiter, ip: str | None) -> float:
+    limiter, key = (per_ip, ip) if ip else (fallback, "*")
+    return 0.0 if limiter.allow(key) else limiter.retry_after(key)
+
+def allow_otp_request(msv: str, ip: str | None) -> float:
+    """0 nếu được gửi mã; ngược lại số giây cần chờ."""
+    if wait := _allow_client(OTP_REQUEST_PER_IP, OTP_REQUEST_GLOBAL, ip):
+        return wait
+    if wait := OTP_LOGIN_FAIL_PER_MSV.retry_after(msv):
+        return wait
+    if not OTP_REQUEST_PER_MSV.allow(msv):
+        return OTP_REQUEST_PER_MSV.retry_after(msv)
+    return 0.0
+
+def release_otp_request(msv: str) -> None:
+    """Yêu cầu không gửi mã (sai MSV/email): trả lại cooldown để sửa rồi gửi lại ngay,
+    nhưng tính một lần sai vào OTP_LOGIN_FAIL_PER_MSV."""
+    OTP_LOGIN_FAIL_PER_MSV.allow(msv)
+    OTP_REQUEST_PER_MSV.reset(msv)
+
+def allow_otp_verify(msv: str, ip: str | None) -> float:
+    """0 nếu được thử mã; ngược lại số giây cần chờ."""
+    if wait := _allow_client(OTP_VERIFY_PER_IP, OTP_VERIFY_GLOBAL, ip):
+        return wait
+    if not OTP_VERIFY_PER_MSV.allow(msv):
+        return OTP_VERIFY_PER_MSV.retry_after(msv)
+    return 0.0
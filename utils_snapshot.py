@@ -0,0 +1,46 @@
+import streamlit as st
+
+import db
+
+def get_db_conf():
+    try:
+        cfg = st.secrets.get("db", {})
+    except Exception:
+        # Fallback khi không có secrets.toml
+        cfg = {}
+
+    max_age = cfg.get("snapshot_max_age")
+    conf = {
+        # Số giây tối đa Dashboard/export được phép trễ so với survey.db; bỏ trống = đọc trực tiếp
+        "snapshot_max_age": None if max_age in (None, "") else float(max_age),
+    }
+    # URL SQLAlchemy của DB chính (mặc định sqlite:///survey.db) và số kết nối giữ trong pool
+    if cfg.get("url"):
+        conf["url"] = cfg["url"]
+    if cfg.get("pool_size") not in (None, ""):
+        conf["pool_size"] = int(cfg["pool_size"])
+    return conf
+
+@st.cache_resource
+def _apply_db_conf(conf_key: tuple) -> dict:
+    conf = dict(conf_key)
+    db.configure(**conf)
+    return conf
+
+def apply_db_conf() -> dict:
+    """Áp dụng cấu hình [db] trong st.secrets một lần cho mỗi process.
+
+    Gọi ngay sau page_start() ở App.py và mọi trang, trước khi trang mở kết nối DB
+    (select_cohort, init_db...), để mọi trang dùng cùng một DB/pool.
+    """
+    return _apply_db_conf(tuple(sorted(get_db_conf().items())))
+
+def snapshot_caption() -> str | None:
+    """Dòng chú thích độ trễ của số liệu khi Dashboard/export đọc từ snapshot."""
+    info = db.snapshot_info()
+    if not info["enabled"]:
+        return None
+    if info["age"] is None:
+        return "🕒 Số liệu đọc từ bản sao chỉ đọc (chưa được tạo)."
+    return (f"🕒 Số liệu đọc từ bản sao chỉ đọc, cập nhật {int(info['age'])} giây trước "
+            f"(tự làm mới khi cũ hơn {info['max_age']:g} giây).")
@@ -0,0 +1,20 @@
+import streamlit as st
+
+import db
+
+def load_student(msv: str) -> dict:
+    """Bản ghi + câu trả lời của sinh viên đã đăng nhập, giữ trong session.
+
+    Chỉ đọc DB (một lần, db.get_student_with_responses) khi chưa có hoặc db.student_version() đã đổi
+    (nộp bài, Admin sửa/xóa/reset); các lần rerun còn lại không tốn truy vấn nào.
+    Trả về {"student": dict | None, "responses": list[dict]}.
+    """
+    key = (st.session_state.get("cohort", db.DEFAULT_COHORT), msv)
+    version = db.student_version(msv)
+    cached = st.session_state.get("student")
+    if cached and cached["key"] == key and cached["version"] == version:
+        return cached
+    stu, responses = db.get_student_with_responses(msv)
+    cached = {"key": key, "version": version, "student": stu, "responses": responses}
+    st.session_state["student"] = cached
+    return cached
@@ -0,0 +1,72 @@
+import math
+import random
+import sys
+import unicodedata as ud
+from functools import lru_cache
+
+import pandas as pd
+import streamlit as st
+
+import db
+import utils_perf
+
+# Câu hỏi mở có nhiều câu trả lời hơn ngưỡng này thì WordCloud dựng từ mẫu ngẫu nhiên
+WORDCLOUD_SAMPLE_SIZE = 20000
+
+@lru_cache(maxsize=1)
+def _trailing_chars() -> str:
+    # Mọi ký tự dấu câu (P*) và phân tách (Z*) của Unicode, tính một lần cho mỗi process
+    return "".join(ch for ch in map(chr, range(sys.maxunicode + 1)) if ud.category(ch)[0] in "PZ")
+
+def canonicalize_answers(texts) -> pd.DataFrame:
+    """Cột display (bỏ khoảng trắng thừa) và canonical (bỏ dấu câu cuối, chữ thường); bỏ câu rỗng."""
+    s = pd.Series(texts, dtype="string").dropna()
+    display = s.str.strip().str.replace(r"\s+", " ", regex=True)
+    display = display[display.str.len() > 0]
+    canonical = display.str.rstrip(_trailing_chars()).str.lower()
+    return pd.DataFrame({"display": display, "canonical": canonical})
+
+def answer_frequencies(texts) -> dict[str, int]:
+    """Gom câu trả lời giống nhau thành cụm: {câu hiển thị đầu tiên của cụm: số lần}."""
+    df = canonicalize_answers(texts)
+    g = df.groupby("canonical", sort=False)["display"].agg(["first", "size"])
+    return dict(zip(g["first"].tolist(), g["size"].astype(int).tolist()))
+
+def reservoir_sample(chunks, k: int, seed: int = 0) -> tuple[list, int]:
+    """Lấy mẫu đều k phần tử từ các chunk (Algorithm L), trả về (mẫu, tổng số phần tử đã duyệt).
+
+    Chỉ sinh số ngẫu nhiên ở những vị trí được thay vào mẫu nên duyệt 100k câu vẫn nhanh.
+    """
+    rng = random.Random(seed)
+    u = lambda: rng.random() or 1e-12
+    sample, seen = [], 0
+    w = math.exp(math.log(u()) / k)
+    next_i = k + math.floor(math.log(u()) / math.log(1 - w))
+    for chunk in chunks:
+        base, n = seen, len(chunk)
+        seen += n
+        if len(sample) < k:
+            sample.extend(chunk[:k - len(sample)])
+        while next_i < seen:
+            sample[rng.randrange(k)] = chunk[next_i - base]
+            w *= math.exp(math.log(u()) / k)
+            next_i += math.floor(math.log(u()) / math.log(1 - w)) + 1
+    return sample, seen
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def open_answer_frequencies(question_id: int, data_version: int, sample_size: int = WORDCLOUD_SAMPLE_SIZE,
+                            cohort: str | None = None) -> dict:
+    """Bảng tần suất của một câu hỏi mở, cache theo (khóa, câu hỏi, version dữ liệu).
+
+    Trả về {"total", "sampled", "frequencies"}; khi lấy mẫu, tổng và số lần là ước lượng theo tỉ lệ mẫu.
+    """
+    with db.using_cohort(cohort or db.current_cohort()), utils_perf.timer("text", "frequencies"):
+        texts, seen = reservoir_sample(db.iter_open_answers(question_id), sample_size)
+        frequencies = answer_frequencies(texts)
+    kept = sum(frequencies.values())
+    sampled = seen > sample_size
+    total = round(seen * kept / len(texts)) if sampled else kept
+    if sampled and kept:
+        scale = total / kept
+        frequencies = {k: max(1, round(v * scale)) for k, v in frequencies.items()}
+    return {"total": total, "sampled": sampled, "frequencies": frequencies}